@@ -0,0 +1,521 @@
+"""Custom Ansible filters for bcrypt hashing, shared by all roles.
+
+This avoids the control-node dependency on passlib's bcrypt backend,
+which currently breaks under Python 3.13. Hashes are computed in-process
+with the `bcrypt` package when it is installed, and otherwise by shelling
+out to the system `htpasswd` utility (whose `$2y$` output is normalized
+to `$2b$`).
+
+Hashes are cached on the control node so a password that has not changed
+keeps the same hash (and salt) across plays. Without the cache every run
+renders a new salt, which changes the templated file and re-triggers its
+handlers. The cache is a Fernet-encrypted file holding HMAC fingerprints
+of the cost and password; plain-text passwords are never written to it.
+Entries looked up by fingerprint alone record when they were last used and
+are dropped once unused for a while, so hashes of rotated passwords do not
+stay in the cache forever.
+
+Roles should prefer ``bcrypt_credentials``, which stores one entry per
+credential name (e.g. ``wazuh/admin``): a rotated secret replaces its old
+entry instead of adding one, and only new or rotated secrets are hashed::
+
+    {% set hashes = {'traefik/admin': traefik_admin_password}
+       | bcrypt_credentials(12) %}
+
+Environment:
+    HTPASSWD_BCRYPT_CACHE: Cache file path. Defaults to
+        ``~/.ansible/cache/htpasswd_bcrypt.cache``; set it to an empty
+        string to disable caching.
+    HTPASSWD_BCRYPT_CACHE_KEY: Fernet key for the cache. When unset, a key
+        is generated once and stored next to the cache file (mode 0600).
+    HTPASSWD_BCRYPT_CACHE_MAX_AGE_DAYS: Days after which an unused
+        fingerprint entry is pruned. Defaults to 90.
+    HTPASSWD_BCRYPT_BACKEND: ``auto`` (default), ``native`` or ``htpasswd``.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Union
+
+DEFAULT_CACHE_PATH = "~/.ansible/cache/htpasswd_bcrypt.cache"
+CACHE_VERSION = 3
+# Version 1 only had fingerprint-keyed entries and version 2 did not record
+# their last use; both are read and upgraded in place
+READABLE_CACHE_VERSIONS = (1, 2, 3)
+# Not every run renders every template (--limit, --tags), so an entry is only
+# pruned once it has gone unused for this long
+ENTRY_MAX_AGE = float(os.environ.get("HTPASSWD_BCRYPT_CACHE_MAX_AGE_DAYS", "90")) * 86400
+# A cache hit refreshes the last use of its entry at most this often
+TOUCH_INTERVAL = 86400
+
+
+class FilterModule:
+    """Expose custom filters to Ansible."""
+
+    def filters(self) -> dict[str, Any]:
+        return {
+            "htpasswd_bcrypt": htpasswd_bcrypt,
+            "htpasswd_bcrypt_many": htpasswd_bcrypt_many,
+            "bcrypt_credentials": bcrypt_credentials,
+        }
+
+
+class HashCache:
+    """Encrypted store of previously computed bcrypt hashes.
+
+    ``entries`` maps a fingerprint to a hash and the time it was last used;
+    ``credentials`` maps a credential name to the fingerprint and hash of
+    its current secret.
+    Ansible renders templates in forked workers, so every write takes an
+    exclusive lock, re-reads the file and merges before replacing it.
+    """
+
+    def __init__(self, path: str, key: Optional[bytes] = None):
+        from cryptography.fernet import Fernet
+
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+        key = key or self._load_or_create_key()
+        self._fernet = Fernet(key)
+        # Derive the fingerprint key separately from the encryption key
+        self._fingerprint_key = hashlib.sha256(b"htpasswd-bcrypt-fingerprint:" + key).digest()
+        self._data: Optional[dict[str, dict]] = None
+        self._mtime: Optional[float] = None
+
+    def _load_or_create_key(self) -> bytes:
+        from cryptography.fernet import Fernet
+
+        key_path = self.path + ".key"
+        try:
+            with open(key_path, "rb") as handle:
+                key = handle.read().strip()
+        except FileNotFoundError:
+            key = Fernet.generate_key()
+            try:
+                fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                # Another fork created it first
+                with open(key_path, "rb") as handle:
+                    key = handle.read().strip()
+            else:
+                with os.fdopen(fd, "wb") as handle:
+                    handle.write(key + b"\n")
+        return key
+
+    def fingerprint(self, password: str, cost: int) -> str:
+        message = f"{cost}\0{password}".encode("utf-8")
+        return hmac.new(self._fingerprint_key, message, hashlib.sha256).hexdigest()
+
+    def _read(self) -> dict[str, dict]:
+        empty: dict[str, dict] = {"entries": {}, "credentials": {}}
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return empty
+        if self._data is not None and mtime == self._mtime:
+            return self._data
+
+        from cryptography.fernet import InvalidToken
+
+        with open(self.path, "rb") as handle:
+            token = handle.read()
+        try:
+            data = json.loads(self._fernet.decrypt(token))
+        except (InvalidToken, ValueError):
+            # Unreadable (e.g. key rotated): start over rather than fail the play
+            return empty
+        if data.get("version") not in READABLE_CACHE_VERSIONS:
+            return empty
+
+        entries = data.get("entries", {})
+        if data["version"] < 3:
+            # Give upgraded entries a full retention period
+            now = time.time()
+            entries = {fingerprint: [hashed, now] for fingerprint, hashed in entries.items()}
+        self._data = {
+            "entries": entries,
+            "credentials": data.get("credentials", {}),
+        }
+        self._mtime = mtime
+        return self._data
+
+    def get(self, password: str, cost: int) -> Optional[str]:
+        fingerprint = self.fingerprint(password, cost)
+        stored = self._read()["entries"].get(fingerprint)
+        if not stored or not _is_bcrypt_hash(stored[0], cost):
+            return None
+        if time.time() - stored[1] > TOUCH_INTERVAL:
+            try:
+                self._write(touched=[fingerprint])
+            except OSError as exc:
+                _warn(f"htpasswd_bcrypt could not update its cache: {exc}")
+        return stored[0]
+
+    def get_credential(self, name: str, password: str, cost: int) -> Optional[str]:
+        """Return the hash stored for ``name`` if its secret and cost are unchanged."""
+        stored = self._read()["credentials"].get(name)
+        if stored and stored[0] == self.fingerprint(password, cost) and _is_bcrypt_hash(stored[1], cost):
+            return stored[1]
+        # Adopt a hash cached before credentials had names, so the output stays unchanged
+        return self.get(password, cost)
+
+    def is_current(self, name: str, password: str, cost: int) -> bool:
+        """Whether ``name`` is stored with this exact secret and cost."""
+        stored = self._read()["credentials"].get(name)
+        return bool(stored) and stored[0] == self.fingerprint(password, cost)
+
+    def put(self, password: str, cost: int, hashed: str) -> None:
+        self.put_many([(password, cost, hashed)])
+
+    def put_many(self, items: list[tuple[str, int, str]]) -> None:
+        self._write(entries=items)
+
+    def put_credentials(self, items: list[tuple[str, str, int, str]]) -> None:
+        """Store ``(name, password, cost, hash)`` items, replacing older secrets of those names."""
+        self._write(credentials=items)
+
+    def _write(
+        self,
+        entries: tuple = (),
+        credentials: tuple = (),
+        touched: tuple = (),
+    ) -> None:
+        import fcntl
+
+        with open(self.path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._data = None
+            current = self._read()
+            now = time.time()
+            data = {
+                # Hashes of rotated or removed passwords end up unused and expire here
+                "entries": {
+                    fingerprint: stored
+                    for fingerprint, stored in current["entries"].items()
+                    if now - stored[1] <= ENTRY_MAX_AGE
+                },
+                "credentials": dict(current["credentials"]),
+            }
+            for fingerprint in touched:
+                if fingerprint in data["entries"]:
+                    data["entries"][fingerprint] = [data["entries"][fingerprint][0], now]
+            for password, cost, hashed in entries:
+                data["entries"][self.fingerprint(password, cost)] = [hashed, now]
+            for name, password, cost, hashed in credentials:
+                data["credentials"][name] = [self.fingerprint(password, cost), hashed]
+            payload = json.dumps({"version": CACHE_VERSION, **data}).encode("utf-8")
+
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".htpasswd_bcrypt.")
+            try:
+                with os.fdopen(fd, "wb") as handle:
+                    handle.write(self._fernet.encrypt(payload))
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+            self._data = data
+            self._mtime = os.stat(self.path).st_mtime
+
+
+_cache: Optional[HashCache] = None
+_cache_loaded = False
+
+
+def _get_cache() -> Optional[HashCache]:
+    """Return the process-wide hash cache, or ``None`` when disabled/unavailable."""
+
+    global _cache, _cache_loaded
+    if _cache_loaded:
+        return _cache
+    _cache_loaded = True
+
+    path = os.environ.get("HTPASSWD_BCRYPT_CACHE", DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+
+    key = os.environ.get("HTPASSWD_BCRYPT_CACHE_KEY")
+    try:
+        _cache = HashCache(path, key.encode("ascii") if key else None)
+    except ImportError:
+        _warn("htpasswd_bcrypt cache disabled: the `cryptography` package is not available")
+    except (OSError, ValueError) as exc:
+        _warn(f"htpasswd_bcrypt cache disabled: {exc}")
+    return _cache
+
+
+def _warn(message: str) -> None:
+    from ansible.utils.display import Display
+
+    Display().warning(message)
+
+
+def _is_bcrypt_hash(value: str, cost: int) -> bool:
+    """Check that ``value`` looks like a bcrypt hash produced with ``cost``."""
+
+    parts = value.split("$")
+    return (
+        len(value) == 60
+        and len(parts) == 4
+        and parts[1] in ("2a", "2b", "2y")
+        and parts[2] == f"{cost:02d}"
+    )
+
+
+_native_module: Any = None
+# Why a forced native backend can't be used, raised on every call
+_native_error: Optional[str] = None
+_native_checked = False
+
+
+def _native_bcrypt() -> Any:
+    """Return the `bcrypt` module if it can be used, else ``None``."""
+
+    global _native_module, _native_error, _native_checked
+    if not _native_checked:
+        _native_checked = True
+        backend = os.environ.get("HTPASSWD_BCRYPT_BACKEND", "auto").lower()
+        if backend != "htpasswd":
+            try:
+                import bcrypt
+            except ImportError:
+                if backend == "native":
+                    _native_error = "HTPASSWD_BCRYPT_BACKEND=native but the `bcrypt` package is not installed"
+            else:
+                _native_module = bcrypt
+
+    if _native_error:
+        from ansible.errors import AnsibleFilterError
+
+        raise AnsibleFilterError(_native_error)
+    return _native_module
+
+
+def _hash_password(password: str, cost: int) -> str:
+    """Hash ``password`` in-process when possible, falling back to `htpasswd`."""
+
+    bcrypt = _native_bcrypt()
+    encoded = password.encode("utf-8")
+    # bcrypt>=5 rejects what htpasswd silently truncates; keep htpasswd semantics for those
+    if bcrypt is not None and len(encoded) <= 72 and b"\0" not in encoded:
+        return bcrypt.hashpw(encoded, bcrypt.gensalt(rounds=cost)).decode("ascii")
+    return _hash_with_htpasswd(password, cost)
+
+
+def _check_cost(cost: int, filter_name: str) -> None:
+    from ansible.errors import AnsibleFilterError
+
+    if not isinstance(cost, int) or cost < 4 or cost > 31:
+        raise AnsibleFilterError(f"{filter_name} cost must be an integer between 4 and 31")
+
+
+def _hash_with_htpasswd(password: str, cost: int) -> str:
+    """Hash ``password`` with the `htpasswd` CLI and return a `$2b$` hash."""
+
+    from ansible.errors import AnsibleFilterError
+
+    htpasswd_path = shutil.which("htpasswd")
+    if not htpasswd_path:
+        raise AnsibleFilterError("`htpasswd` executable not found on control node")
+
+    cmd = [htpasswd_path, "-nB", "-C", str(cost), "-i", "ansible"]
+
+    try:
+        result = subprocess.run(
+            cmd,
+            input=f"{password}\n".encode("utf-8"),
+            check=True,
+            capture_output=True,
+        )
+    except subprocess.CalledProcessError as exc:
+        stderr = exc.stderr.decode("utf-8", errors="ignore").strip()
+        raise AnsibleFilterError(f"htpasswd command failed: {stderr or exc}") from exc
+
+    output = result.stdout.decode("utf-8", errors="ignore").strip()
+    try:
+        _, hashed = output.split(":", 1)
+    except ValueError as exc:
+        raise AnsibleFilterError(f"Unexpected htpasswd output: {output}") from exc
+
+    normalized = hashed.strip()
+    if normalized.startswith("$2y$"):
+        normalized = "$2b$" + normalized[4:]
+
+    return normalized
+
+
+def _hash_passwords(passwords: list[str], cost: int, workers: Optional[int] = None) -> list[str]:
+    """Hash ``passwords`` concurrently, one worker per core by default.
+
+    bcrypt releases the GIL, and the `htpasswd` fallback runs in child
+    processes, so threads hash in parallel.
+    """
+
+    max_workers = min(len(passwords), workers or os.cpu_count() or 1)
+    if max_workers <= 1:
+        return [_hash_password(password, cost) for password in passwords]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda password: _hash_password(password, cost), passwords))
+
+
+def htpasswd_bcrypt(password: str, cost: int = 12) -> str:
+    """Return a bcrypt hash for ``password``.
+
+    A hash cached for the same password and cost is returned unchanged, so
+    templates stay stable between runs until the password is rotated.
+
+    Args:
+        password: Plain-text password to hash.
+        cost: Bcrypt cost factor (number of rounds). Defaults to 12.
+
+    Raises:
+        AnsibleFilterError: If no backend is usable or `htpasswd` fails.
+    """
+
+    from ansible.errors import AnsibleFilterError
+
+    if password is None:
+        raise AnsibleFilterError("htpasswd_bcrypt filter received a null password")
+
+    _check_cost(cost, "htpasswd_bcrypt")
+
+    password = str(password)
+    cache = _get_cache()
+    if cache is not None:
+        cached = cache.get(password, cost)
+        if cached:
+            return cached
+
+    hashed = _hash_password(password, cost)
+
+    if cache is not None:
+        try:
+            cache.put(password, cost, hashed)
+        except OSError as exc:
+            _warn(f"htpasswd_bcrypt could not update its cache: {exc}")
+
+    return hashed
+
+
+def htpasswd_bcrypt_many(
+    passwords: Union[list, dict], cost: int = 12, workers: Optional[int] = None
+) -> Union[list, dict]:
+    """Hash several passwords in one call, in parallel.
+
+    Cached hashes are reused as in ``htpasswd_bcrypt``; the remaining
+    passwords are hashed concurrently, one worker per core by default.
+
+    Args:
+        passwords: A list of passwords, or a mapping of names to passwords.
+        cost: Bcrypt cost factor (number of rounds). Defaults to 12.
+        workers: Maximum number of concurrent hashes.
+
+    Returns:
+        Hashes in the same shape as ``passwords``: a list in the same order,
+        or a mapping with the same keys.
+    """
+
+    from ansible.errors import AnsibleFilterError
+
+    if isinstance(passwords, dict):
+        names = list(passwords.keys())
+        values = list(passwords.values())
+    elif isinstance(passwords, (list, tuple)):
+        names = None
+        values = list(passwords)
+    else:
+        raise AnsibleFilterError("htpasswd_bcrypt_many expects a list or a mapping of passwords")
+
+    if any(value is None for value in values):
+        raise AnsibleFilterError("htpasswd_bcrypt_many filter received a null password")
+
+    _check_cost(cost, "htpasswd_bcrypt_many")
+
+    values = [str(value) for value in values]
+    cache = _get_cache()
+
+    hashes: dict[str, str] = {}
+    missing: list[str] = []
+    for value in values:
+        if value in hashes or value in missing:
+            continue
+        cached = cache.get(value, cost) if cache is not None else None
+        if cached:
+            hashes[value] = cached
+        else:
+            missing.append(value)
+
+    if missing:
+        hashes.update(zip(missing, _hash_passwords(missing, cost, workers)))
+
+        if cache is not None:
+            try:
+                cache.put_many([(value, cost, hashes[value]) for value in missing])
+            except OSError as exc:
+                _warn(f"htpasswd_bcrypt_many could not update its cache: {exc}")
+
+    result = [hashes[value] for value in values]
+    if names is not None:
+        return dict(zip(names, result))
+    return result
+
+
+def bcrypt_credentials(credentials: dict, cost: int = 12, workers: Optional[int] = None) -> dict:
+    """Hash named credentials, keeping one stable hash per credential name.
+
+    The cache remembers the hash of each name together with a fingerprint
+    of the secret it was made from. An unchanged secret gets its stored
+    hash back; only new or rotated secrets are hashed, concurrently.
+
+    Args:
+        credentials: A mapping of globally unique credential names (by
+            convention ``<role>/<user>``) to plain-text secrets.
+        cost: Bcrypt cost factor (number of rounds). Defaults to 12.
+        workers: Maximum number of concurrent hashes.
+
+    Returns:
+        A mapping of the same names to bcrypt hashes.
+    """
+
+    from ansible.errors import AnsibleFilterError
+
+    if not isinstance(credentials, dict):
+        raise AnsibleFilterError("bcrypt_credentials expects a mapping of credential names to secrets")
+    if any(value is None for value in credentials.values()):
+        raise AnsibleFilterError("bcrypt_credentials filter received a null secret")
+
+    _check_cost(cost, "bcrypt_credentials")
+
+    secrets = {str(name): str(value) for name, value in credentials.items()}
+    cache = _get_cache()
+
+    hashes: dict[str, str] = {}
+    for name, secret in secrets.items():
+        cached = cache.get_credential(name, secret, cost) if cache is not None else None
+        if cached:
+            hashes[name] = cached
+
+    missing = [name for name in secrets if name not in hashes]
+    if missing:
+        computed = _hash_passwords([secrets[name] for name in missing], cost, workers)
+        hashes.update(zip(missing, computed))
+
+    if cache is not None:
+        # Also records adopted hashes under their name
+        stale = [name for name in secrets if name in missing or not cache.is_current(name, secrets[name], cost)]
+        if stale:
+            try:
+                cache.put_credentials([(name, secrets[name], cost, hashes[name]) for name in stale])
+            except OSError as exc:
+                _warn(f"bcrypt_credentials could not update its cache: {exc}")
+
+    return {name: hashes[name] for name in secrets}
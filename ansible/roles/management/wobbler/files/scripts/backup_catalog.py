@@ -0,0 +1,198 @@
+"""
+Local time-indexed catalog of backups and snapshots
+
+Restore planning needs "the newest usable backup of each database (or
+snapshot of each volume) at or before time T". Asking the API for that means
+listing everything and sorting it on every run, so the scripts keep a SQLite
+copy instead, indexed by (source, target, created_at).
+
+Refreshes are incremental: listings are read newest-first and paging stops
+once it reaches entries that are older than what the catalog already holds
+(minus an overlap window, so status changes on recent entries are picked up).
+A full refresh, which also drops entries that no longer exist, happens
+periodically or on request.
+
+Runs of both scripts may refresh at the same time (read-only actions run
+without a lease, some in the daemon). Refreshes therefore hold an exclusive
+flock on a file next to the catalog, from reading the high-water mark until
+the write, so a slower run can't replace a newer full listing with an older
+one or miss what the other run just wrote.
+"""
+
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+
+STATE_DIR = os.environ.get("WOBBLER_STATE_DIR", "/app/conf/state")
+FRACTION = re.compile(r"\.(\d+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    source TEXT NOT NULL,
+    id TEXT NOT NULL,
+    target TEXT NOT NULL,
+    label TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (source, id)
+);
+CREATE INDEX IF NOT EXISTS entries_by_time ON entries (source, target, created_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+
+def parse_time(value: Optional[str]) -> int:
+    """Convert an API timestamp (or user input) to epoch seconds, UTC if naive."""
+    if not value:
+        return 0
+    value = value.strip().replace("Z", "+00:00").replace(" ", "T")
+    # Python 3.9's fromisoformat only accepts 3 or 6 fractional digits
+    value = FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), value, count=1)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def format_time(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+
+
+class BackupCatalog:
+    """SQLite catalog shared by the backup and snapshot scripts."""
+
+    FULL_REFRESH_INTERVAL = 6 * 3600
+    OVERLAP = 3600
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(STATE_DIR, "backup-catalog.sqlite3")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Shared with restore worker threads; writes are serialized by the lock
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _refresh_lock(self):
+        with open(self.path + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _meta(self, key: str) -> Optional[float]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> dict:
+        entry = {key: row[key] for key in ("id", "target", "label", "name", "created_at", "status", "size")}
+        entry["data"] = json.loads(row["data"])
+        return entry
+
+    def refresh(
+        self,
+        source: str,
+        items: Iterable[dict],
+        to_entry: Callable[[dict], dict],
+        full: bool = False,
+    ) -> int:
+        """Add entries for ``source`` from ``items``, an iterator over API
+        objects ordered newest first. Returns the number of entries written.
+
+        ``to_entry`` maps an API object to a dict with the keys id, target,
+        label, name, created_at (epoch), status, size and data.
+        """
+        with self._refresh_lock():
+            return self._refresh(source, items, to_entry, full)
+
+    def _refresh(self, source: str, items: Iterable[dict], to_entry: Callable[[dict], dict], full: bool) -> int:
+        now = time.time()
+        high_water = self._meta(f"{source}:high_water")
+        last_full = self._meta(f"{source}:last_full")
+        full = full or high_water is None or last_full is None or now - last_full > self.FULL_REFRESH_INTERVAL
+
+        entries = []
+        for item in items:
+            entry = to_entry(item)
+            if not full and entry["created_at"] < high_water - self.OVERLAP:
+                # Everything further down the listing is already cataloged
+                break
+            entries.append(entry)
+
+        with self._lock, self._db:
+            if full:
+                self._db.execute("DELETE FROM entries WHERE source = ?", (source,))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        source, e["id"], e["target"], e["label"], e["name"],
+                        e["created_at"], e["status"], e["size"], json.dumps(e["data"]),
+                    )
+                    for e in entries
+                ],
+            )
+            newest = max([e["created_at"] for e in entries] + [high_water or 0])
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (f"{source}:high_water", newest))
+            if full:
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (f"{source}:last_full", now))
+        return len(entries)
+
+    def nearest(
+        self,
+        source: str,
+        at: int,
+        statuses: tuple,
+        name_prefix: Optional[str] = None,
+    ) -> list:
+        """Newest entry per target created at or before ``at``, in one indexed query."""
+        query = (
+            "SELECT *, MAX(created_at) FROM entries "
+            f"WHERE source = ? AND created_at <= ? AND status IN ({', '.join('?' * len(statuses))})"
+        )
+        params = [source, at, *statuses]
+        if name_prefix:
+            query += " AND substr(name, 1, ?) = ?"
+            params += [len(name_prefix), name_prefix]
+        query += " GROUP BY target ORDER BY label"
+
+        return [self._entry(row) for row in self._db.execute(query, params)]
+
+    def entries(self, source: str, statuses: tuple, name_prefix: Optional[str] = None) -> list:
+        """Every entry of ``source`` with one of ``statuses``, oldest first."""
+        query = (
+            "SELECT * FROM entries "
+            f"WHERE source = ? AND status IN ({', '.join('?' * len(statuses))})"
+        )
+        params = [source, *statuses]
+        if name_prefix:
+            query += " AND substr(name, 1, ?) = ?"
+            params += [len(name_prefix), name_prefix]
+        query += " ORDER BY created_at"
+
+        return [self._entry(row) for row in self._db.execute(query, params)]
+
+    def remove(self, source: str, entry_id: str) -> None:
+        """Drop an entry found to no longer exist."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE source = ? AND id = ?", (source, entry_id))
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,176 @@
+"""
+Desired state for server snapshots and database backups
+
+The reconcile action of snapshot-manager.py and database-backup.py takes
+its plan from a JSON policy file instead of command-line flags:
+
+    {
+      "snapshots": {
+        "defaults": {"max_age_hours": 24, "retention": 3},
+        "servers": {
+          "tools-prod": {"freeze": ["/srv"]},
+          "authentik-prod": {"retention": 7}
+        }
+      },
+      "databases": {
+        "defaults": {"max_age_hours": 24, "retention": 3, "expires_days": 7},
+        "targets": {
+          "*/*": {},
+          "main-db/analytics": {"max_age_hours": 168},
+          "main-db/scratch": {"enabled": false}
+        }
+      }
+    }
+
+Each target starts from the built-in settings, then the section defaults,
+then its own entry. Database targets are "<instance>/<database>" patterns
+that all apply in file order, so later and more specific patterns win.
+
+A target is due when its newest usable run is older than max_age_hours
+(less grace_minutes, so a run scheduled at the same time every day doesn't
+slip by a whole schedule interval). Runs beyond the retention count are
+deleted, and so are failed runs. The run about to be created only counts
+towards retention once it is ready: reconcile waits for it, and keeps one
+more of the older runs if it fails.
+Planning only looks at an inventory the scripts read once up front, so a
+run where nothing is due makes no writes at all.
+"""
+
+import fnmatch
+import json
+import os
+from typing import Optional
+
+DEFAULT_PATH = os.environ.get("WOBBLER_BACKUP_POLICY", "/app/conf/backup-policy.json")
+
+SETTINGS = {
+    "snapshots": {
+        "enabled": True,
+        "max_age_hours": 24,
+        "grace_minutes": 15,
+        "retention": 3,
+        "freeze": [],
+    },
+    "databases": {
+        "enabled": True,
+        "max_age_hours": 24,
+        "grace_minutes": 15,
+        "retention": 3,
+        "expires_days": 7,
+    },
+}
+TARGETS_KEY = {"snapshots": "servers", "databases": "targets"}
+MINIMUM = {"max_age_hours": 0.1, "grace_minutes": 0, "retention": 1, "expires_days": 1}
+
+
+class PolicyError(Exception):
+    """Raised when the policy file is missing or invalid."""
+
+
+def _check_settings(kind: str, name: str, settings) -> None:
+    if not isinstance(settings, dict):
+        raise PolicyError(f"{kind} {name}: settings must be an object")
+    for key, value in settings.items():
+        if key not in SETTINGS[kind]:
+            raise PolicyError(f"{kind} {name}: unknown setting {key!r}")
+        default = SETTINGS[kind][key]
+        if isinstance(default, bool):
+            valid = isinstance(value, bool)
+        elif isinstance(default, list):
+            valid = isinstance(value, list) and all(isinstance(v, str) for v in value)
+        else:
+            valid = isinstance(value, (int, float)) and not isinstance(value, bool) and value >= MINIMUM[key]
+        if not valid:
+            raise PolicyError(f"{kind} {name}: invalid value for {key}: {value!r}")
+
+
+def load_policy(path: Optional[str] = None) -> dict:
+    """Read and validate a policy file."""
+    path = path or DEFAULT_PATH
+    try:
+        with open(path) as f:
+            policy = json.load(f)
+    except FileNotFoundError:
+        raise PolicyError(f"Policy file not found: {path}")
+    except ValueError as e:
+        raise PolicyError(f"Invalid policy file {path}: {e}")
+
+    if not isinstance(policy, dict):
+        raise PolicyError(f"Invalid policy file {path}: expected an object")
+    for kind, section in policy.items():
+        if kind not in SETTINGS:
+            raise PolicyError(f"Unknown policy section: {kind}")
+        if not isinstance(section, dict):
+            raise PolicyError(f"Policy section {kind} must be an object")
+        unknown = set(section) - {"defaults", TARGETS_KEY[kind]}
+        if unknown:
+            raise PolicyError(f"Unknown keys in policy section {kind}: {', '.join(sorted(unknown))}")
+        _check_settings(kind, "defaults", section.get("defaults", {}))
+        for name, settings in section.get(TARGETS_KEY[kind], {}).items():
+            _check_settings(kind, name, settings)
+    return policy
+
+
+def target_names(policy: dict, kind: str) -> list:
+    """Target names (or patterns) of a section, in file order."""
+    return list(policy.get(kind, {}).get(TARGETS_KEY[kind], {}))
+
+
+def settings_for(policy: dict, kind: str, name: str, exact: bool = False) -> Optional[dict]:
+    """Effective settings of a target, or None if it isn't managed.
+
+    With ``exact``, only entries naming the target literally apply.
+    """
+    section = policy.get(kind, {})
+    settings = {**SETTINGS[kind], **section.get("defaults", {})}
+    matched = False
+    for pattern, overrides in section.get(TARGETS_KEY[kind], {}).items():
+        if pattern == name or (not exact and fnmatch.fnmatchcase(name, pattern)):
+            settings.update(overrides)
+            matched = True
+    return settings if matched and settings["enabled"] else None
+
+
+def plan_target(name: str, settings: dict, runs: list, now: float) -> dict:
+    """What it takes to bring one target to its desired state.
+
+    ``runs`` are the target's existing runs, newest first, as dicts with
+    ``created_at`` (epoch) and ``ok`` (False for failed runs) plus whatever
+    the caller needs to delete them.
+    """
+    usable = [run for run in runs if run["ok"]]
+    age = now - usable[0]["created_at"] if usable else None
+    create = age is None or age + settings["grace_minutes"] * 60 >= settings["max_age_hours"] * 3600
+    keep = settings["retention"] - 1 if create else settings["retention"]
+    return {
+        "name": name,
+        "settings": settings,
+        "age": age,
+        "create": create,
+        "expired": usable[keep:],
+        "failed": [run for run in runs if not run["ok"]],
+    }
+
+
+def deletions(step: dict, created: bool = True) -> list:
+    """Runs a step deletes.
+
+    ``created`` tells whether the step's planned run is ready; if not, the
+    oldest kept run stays.
+    """
+    expired = step["expired"][1:] if step["create"] and not created else step["expired"]
+    return expired + step["failed"]
+
+
+def describe(step: dict) -> str:
+    """One-line summary of a planned step."""
+    if step["age"] is None:
+        state = "no usable run"
+    else:
+        state = f"last run {step['age'] / 3600:.1f}h ago"
+    parts = [f"create ({state}, max {step['settings']['max_age_hours']:g}h)" if step["create"] else f"fresh ({state})"]
+    if step["expired"]:
+        parts.append(f"delete {len(step['expired'])} beyond retention {step['settings']['retention']}")
+    if step["failed"]:
+        parts.append(f"delete {len(step['failed'])} failed")
+    return ", ".join(parts)
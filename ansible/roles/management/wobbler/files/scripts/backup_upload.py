@@ -0,0 +1,209 @@
+"""
+Streaming multipart upload of exported backups to S3-compatible storage
+
+The export is read from its pre-signed URL as one stream, optionally
+compressed with zstd on the fly, cut into fixed-size parts and uploaded with
+an S3 multipart upload. Parts are uploaded concurrently, but only a bounded
+number are in flight at once, so memory use stays around
+``(concurrency + 1) * part_size`` whatever the size of the backup, and
+nothing is written to disk.
+
+`boto3` and `zstandard` are optional: they are only imported when an upload
+(or compression) is actually requested.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+# Keeps an upload around 320 MiB with the default part size
+DEFAULT_CONCURRENCY = 4
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Raised when an upload cannot be started or completed."""
+
+
+def _import(module: str):
+    try:
+        return __import__(module)
+    except ImportError:
+        raise UploadError(f"The {module} package is required for this action (pip install {module})")
+
+
+def s3_client(
+    endpoint_url: Optional[str] = None,
+    access_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    region: Optional[str] = None,
+):
+    """Create an S3 client, by default from the S3_* (or SCW_*) environment.
+
+    Path-style addressing is used so the same code works against Scaleway
+    Object Storage and a local MinIO.
+    """
+    boto3 = _import("boto3")
+    from botocore.config import Config
+
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url or os.environ.get("S3_ENDPOINT_URL") or None,
+        aws_access_key_id=access_key or os.environ.get("S3_ACCESS_KEY") or os.environ.get("SCW_ACCESS_KEY"),
+        aws_secret_access_key=secret_key or os.environ.get("S3_SECRET_KEY") or os.environ.get("SCW_SECRET_KEY"),
+        region_name=region or os.environ.get("S3_REGION", "fr-par"),
+        config=Config(s3={"addressing_style": "path"}, retries={"max_attempts": 5, "mode": "standard"}),
+    )
+
+
+class _PartUploader:
+    """Uploads parts on a thread pool with at most ``concurrency`` in flight."""
+
+    def __init__(self, client, bucket: str, key: str, upload_id: str, concurrency: int):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = upload_id
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._futures = []
+        self._error: Optional[BaseException] = None
+
+    @property
+    def count(self) -> int:
+        return len(self._futures)
+
+    def _upload(self, number: int, body: bytes) -> dict:
+        try:
+            md5 = base64.b64encode(hashlib.md5(body).digest()).decode("ascii")
+            response = self.client.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=number,
+                Body=body,
+                ContentMD5=md5,
+            )
+            return {"PartNumber": number, "ETag": response["ETag"]}
+        except BaseException as e:
+            self._error = self._error or e
+            raise
+        finally:
+            self._slots.release()
+
+    def submit(self, body: bytes) -> None:
+        # Blocks the reader while all slots are busy: this is what bounds memory
+        self._slots.acquire()
+        if self._error:
+            self._slots.release()
+            raise self._error
+        self._futures.append(self._pool.submit(self._upload, len(self._futures) + 1, body))
+
+    def finish(self) -> list:
+        """Wait for all parts and return them for complete_multipart_upload."""
+        try:
+            return [future.result() for future in self._futures]
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def abort(self) -> None:
+        """Drop queued parts and wait for the ones already uploading."""
+        for future in self._futures:
+            future.cancel()
+        self._pool.shutdown(wait=True)
+
+
+def stream_to_s3(
+    source_url: str,
+    client,
+    bucket: str,
+    key: str,
+    compress: bool = False,
+    level: int = 3,
+    part_size: int = DEFAULT_PART_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> dict:
+    """Stream ``source_url`` into ``s3://bucket/key``.
+
+    A ``<key>.sha256`` object is written next to the upload so the copy can
+    be verified after it is fetched back. Returns a summary dict with the
+    bytes read and written, the SHA-256 of the stored object and timing.
+    """
+    import requests
+
+    part_size = max(part_size, MIN_PART_SIZE)
+    compressor = None
+    if compress:
+        zstandard = _import("zstandard")
+        compressor = zstandard.ZstdCompressor(level=level, threads=-1).compressobj()
+
+    started = time.monotonic()
+    upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+    logger.info(f"Streaming to s3://{bucket}/{key} ({concurrency} parts of {part_size // (1024 * 1024)} MB in flight)")
+    uploader = _PartUploader(client, bucket, key, upload_id, max(1, concurrency))
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    bytes_in = bytes_out = 0
+
+    def emit(data: bytes) -> None:
+        nonlocal bytes_out
+        if not data:
+            return
+        digest.update(data)
+        bytes_out += len(data)
+        buffer.extend(data)
+        while len(buffer) >= part_size:
+            uploader.submit(bytes(buffer[:part_size]))
+            del buffer[:part_size]
+
+    try:
+        with requests.get(source_url, stream=True, timeout=60) as response:
+            if response.status_code >= 400:
+                raise UploadError(f"Source URL returned {response.status_code}")
+            for block in response.iter_content(STREAM_BLOCK_SIZE):
+                bytes_in += len(block)
+                emit(compressor.compress(block) if compressor else block)
+        if compressor:
+            emit(compressor.flush())
+        # The last part may be smaller than the minimum; an empty source still needs one part
+        if buffer or not uploader.count:
+            uploader.submit(bytes(buffer))
+            buffer.clear()
+
+        parts = uploader.finish()
+        client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        try:
+            uploader.abort()
+        finally:
+            client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    sha256 = digest.hexdigest()
+    client.put_object(
+        Bucket=bucket,
+        Key=f"{key}.sha256",
+        Body=f"{sha256}  {os.path.basename(key)}\n".encode("ascii"),
+    )
+
+    elapsed = time.monotonic() - started
+    return {
+        "key": key,
+        "parts": len(parts),
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "sha256": sha256,
+        "seconds": elapsed,
+        "mbps": (bytes_in * 8 / 1_000_000) / elapsed if elapsed > 0 else 0.0,
+    }
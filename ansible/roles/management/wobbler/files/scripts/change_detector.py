@@ -0,0 +1,148 @@
+"""
+Change detection for database backups
+
+A database that has not been written to since its last backup doesn't need
+a new one yet. Postgres keeps cumulative per-database write counters in
+`pg_stat_database` (rows inserted, updated and deleted, including catalog
+rows, so DDL counts too); one query over a direct connection to the
+instance returns them for every database at once. Their values, together
+with the time the statistics were last reset, form the activity
+fingerprint. The fingerprint taken right before each successful backup is
+kept in a state file, and a database is backed up again when its
+fingerprint changes or its last backup becomes too old.
+
+`xact_commit` is deliberately left out: read-only transactions (including
+monitoring and this query itself) increase it without changing any data.
+
+`psycopg2` is only imported when stats are read. Anything that prevents
+reading them (missing driver, credentials or connectivity) makes the
+detector report every database as changed, so backups are never skipped
+on doubt.
+
+Environment:
+    DB_STATS_USER / DB_STATS_PASSWORD: Role allowed to read pg_stat_database
+        (any role can; no table privileges are needed).
+    DB_STATS_HOST / DB_STATS_PORT: Override the instance endpoint, e.g. the
+        staging postgres-local container (default: the instance's endpoint).
+    DB_STATS_DBNAME: Database to connect to (default: rdb, which exists on
+        every Scaleway instance; use postgres for a plain Postgres server).
+    DB_STATS_SSLMODE: libpq sslmode (default: require).
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+from backup_catalog import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+STATS_QUERY = """
+SELECT datname, tup_inserted, tup_updated, tup_deleted,
+       COALESCE(EXTRACT(EPOCH FROM stats_reset), 0)::bigint
+FROM pg_stat_database
+WHERE datname IS NOT NULL
+"""
+
+
+class StatsUnavailable(Exception):
+    """Raised when activity statistics cannot be read."""
+
+
+def instance_endpoint(instance: dict) -> tuple:
+    """(host, port) to read stats from: the override, or the instance's first endpoint."""
+    endpoints = instance.get("endpoints") or ([instance["endpoint"]] if instance.get("endpoint") else [])
+    host = os.environ.get("DB_STATS_HOST") or (endpoints[0].get("ip") if endpoints else None)
+    port = os.environ.get("DB_STATS_PORT") or (endpoints[0].get("port") if endpoints else 5432)
+    if not host:
+        raise StatsUnavailable(f"no endpoint for instance {instance.get('name')}")
+    return host, int(port)
+
+
+def read_activity(host: str, port: int) -> dict:
+    """Activity fingerprint of every database on a server, in one query."""
+    user = os.environ.get("DB_STATS_USER")
+    if not user:
+        raise StatsUnavailable("DB_STATS_USER is not set")
+    try:
+        import psycopg2
+    except ImportError:
+        raise StatsUnavailable("the psycopg2 package is not installed")
+
+    try:
+        conn = psycopg2.connect(
+            host=host,
+            port=port,
+            user=user,
+            password=os.environ.get("DB_STATS_PASSWORD", ""),
+            dbname=os.environ.get("DB_STATS_DBNAME", "rdb"),
+            sslmode=os.environ.get("DB_STATS_SSLMODE", "require"),
+            connect_timeout=10,
+        )
+    except psycopg2.Error as e:
+        raise StatsUnavailable(str(e).strip())
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(STATS_QUERY)
+            rows = cursor.fetchall()
+    except psycopg2.Error as e:
+        raise StatsUnavailable(str(e).strip())
+    finally:
+        conn.close()
+    return {name: "/".join(str(v) for v in values) for name, *values in rows}
+
+
+class ChangeDetector:
+    """Decides which databases need a backup, from stored activity fingerprints."""
+
+    def __init__(self, max_staleness: float, path: Optional[str] = None):
+        self.max_staleness = max_staleness
+        self.path = path or os.path.join(STATE_DIR, "database-activity.json")
+        try:
+            with open(self.path) as f:
+                self._state = json.load(f)
+        except FileNotFoundError:
+            self._state = {}
+        except ValueError:
+            logger.warning(f"Ignoring unreadable activity state {self.path}")
+            self._state = {}
+
+    def activity(self, instance: dict) -> dict:
+        """Current fingerprints of an instance's databases ({} if unavailable)."""
+        try:
+            return read_activity(*instance_endpoint(instance))
+        except StatsUnavailable as e:
+            logger.warning(f"Cannot read activity of {instance.get('name')}, backing up everything: {e}")
+            return {}
+
+    def reason(self, key: str, fingerprint: Optional[str], now: Optional[float] = None) -> Optional[str]:
+        """Why ``key`` needs a backup, or None if it can be skipped."""
+        now = now or time.time()
+        last = self._state.get(key)
+        if fingerprint is None:
+            return "activity unknown"
+        if not last:
+            return "no previous backup recorded"
+        if last["fingerprint"] != fingerprint:
+            return "changed since last backup"
+        if now - last["backed_up_at"] >= self.max_staleness:
+            return "last backup too old"
+        return None
+
+    def last_backup(self, key: str) -> Optional[float]:
+        last = self._state.get(key)
+        return last["backed_up_at"] if last else None
+
+    def record(self, key: str, fingerprint: Optional[str], backed_up_at: Optional[float] = None) -> None:
+        """Remember the fingerprint a successful backup was taken at."""
+        if fingerprint is None:
+            return
+        self._state[key] = {"fingerprint": fingerprint, "backed_up_at": backed_up_at or time.time()}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".database-activity.")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -8,14 +8,33 @@ not instance snapshots (which are handled by Scaleway's automatic backup feature
 """
 
 import argparse
+import json
 import logging
 import os
+import shutil
+import statistics
 import sys
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+from urllib.parse import urlparse
 
-import requests
+# Local helpers; heavier dependencies (requests) are imported on first API call
+from scaleway_client import ScalewayAPIError, ScalewayClient
+from scw_records import Backup, group_by, newest_first
+from backup_catalog import STATE_DIR, BackupCatalog, format_time, parse_time
+import backup_policy
+from change_detector import ChangeDetector
+import backup_transfer
+import backup_upload
+import restore_verify
+import run_lease
+import storage_analytics
+import wobbler_daemon
+
+DAEMON_NAME = "database-backup"
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,11 +43,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Reconcile relists the databases of an instance at most this often
+DATABASE_LIST_TTL = float(os.environ.get("WOBBLER_DATABASE_LIST_TTL_HOURS", "6")) * 3600
+
 
-class ScalewayDatabaseBackupManager:
+class ScalewayDatabaseBackupManager(ScalewayClient):
     """Manages Scaleway managed database backups."""
 
-    API_BASE = "https://api.scaleway.com"
+    REQUEST_TIMEOUT = 60
 
     def __init__(
         self,
@@ -36,30 +58,13 @@ class ScalewayDatabaseBackupManager:
         secret_key: str,
         project_id: str,
         region: str = "fr-par",
+        get_cache_ttl: float = 0,
     ):
+        super().__init__(secret_key, get_cache_ttl=get_cache_ttl)
         self.access_key = access_key
         self.secret_key = secret_key
         self.project_id = project_id
         self.region = region
-        self.headers = {
-            "X-Auth-Token": secret_key,
-            "Content-Type": "application/json",
-        }
-
-    def _request(
-        self, method: str, endpoint: str, data: Optional[dict] = None
-    ) -> dict:
-        """Make an API request to Scaleway."""
-        url = f"{self.API_BASE}{endpoint}"
-        response = requests.request(
-            method, url, headers=self.headers, json=data, timeout=60
-        )
-
-        if response.status_code >= 400:
-            logger.error(f"API error: {response.status_code} - {response.text}")
-            response.raise_for_status()
-
-        return response.json() if response.text else {}
 
     def list_instances(self) -> list:
         """List all database instances."""
@@ -103,13 +108,46 @@ class ScalewayDatabaseBackupManager:
         result = self._request("GET", endpoint)
         return result.get("databases", [])
 
+    def recent_databases(self, instance_id: str, max_age: float = DATABASE_LIST_TTL) -> list:
+        """Database names of an instance from a listing at most ``max_age`` seconds old.
+
+        Listings are kept in the state directory, so that reconcile runs in
+        between make no per-instance calls.
+        """
+        path = os.path.join(STATE_DIR, "database-lists.json")
+        try:
+            with open(path) as f:
+                lists = json.load(f)
+        except (FileNotFoundError, ValueError):
+            lists = {}
+        cached = lists.get(instance_id)
+        if cached and time.time() - cached["listed_at"] < max_age:
+            return cached["names"]
+
+        names = [database["name"] for database in self.list_databases(instance_id)]
+        lists[instance_id] = {"listed_at": time.time(), "names": names}
+        os.makedirs(STATE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=STATE_DIR, prefix=".database-lists.")
+        with os.fdopen(fd, "w") as f:
+            json.dump(lists, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+        return names
+
     def list_backups(self, instance_id: str, database_name: Optional[str] = None) -> list:
         """List backups for an instance, optionally filtered by database name."""
         endpoint = f"/rdb/v1/regions/{self.region}/backups?instance_id={instance_id}"
         if database_name:
             endpoint += f"&database_name={database_name}"
         result = self._request("GET", endpoint)
-        return result.get("database_backups", [])
+        return [Backup.from_api(b) for b in result.get("database_backups", [])]
+
+    def list_all_backups(self) -> list:
+        """List the backups of every instance in the project, newest first."""
+        endpoint = (
+            f"/rdb/v1/regions/{self.region}/backups"
+            f"?project_id={self.project_id}&order_by=created_at_desc"
+        )
+        return [Backup.from_api(b) for b in self.paginate(endpoint, "database_backups")]
 
     def create_backup(
         self,
@@ -134,22 +172,240 @@ class ScalewayDatabaseBackupManager:
         endpoint = f"/rdb/v1/regions/{self.region}/backups/{backup_id}"
         self._request("DELETE", endpoint)
 
+    def get_backup(self, backup_id: str) -> dict:
+        """Get a single backup."""
+        endpoint = f"/rdb/v1/regions/{self.region}/backups/{backup_id}"
+        return self._request("GET", endpoint)
+
+    def wait_for_backup(
+        self, backup_id: str, timeout: int = 3600, poll_interval: int = 10
+    ) -> bool:
+        """Wait for a new backup to become ready."""
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            status = self.get_backup(backup_id).get("status", "unknown")
+            if status == "ready":
+                return True
+            if status in ("error", "deleting", "unknown"):
+                logger.error(f"Backup {backup_id} in unexpected state: {status}")
+                return False
+            time.sleep(poll_interval)
+        logger.error(f"Timeout waiting for backup {backup_id} to be ready (waited {timeout}s)")
+        return False
+
+    def export_backup(self, backup_id: str) -> dict:
+        """Request a download URL for a backup."""
+        endpoint = f"/rdb/v1/regions/{self.region}/backups/{backup_id}/export"
+        return self._request("POST", endpoint, {})
+
+    def wait_for_export(
+        self, backup_id: str, timeout: int = 600, poll_interval: int = 5
+    ) -> Optional[str]:
+        """Export a backup and wait for its download URL."""
+        backup = self.export_backup(backup_id)
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            if backup.get("download_url") and backup.get("status") == "ready":
+                return backup["download_url"]
+            if backup.get("status") == "error":
+                logger.error(f"Export of backup {backup_id} failed")
+                return None
+            time.sleep(poll_interval)
+            backup = self.get_backup(backup_id)
+        logger.error(f"Timeout waiting for export of backup {backup_id} (waited {timeout}s)")
+        return None
+
+    def latest_backups(
+        self, instance_id: str, databases: Optional[list] = None
+    ) -> list:
+        """Return the newest ready auto-backup of each database."""
+        latest: dict[str, Backup] = {}
+        for backup in self.list_backups(instance_id):
+            if not backup.name.startswith("auto-") or backup.status != "ready":
+                continue
+            if databases and backup.database_name not in databases:
+                continue
+            current = latest.get(backup.database_name)
+            if current is None or backup.created_at > current.created_at:
+                latest[backup.database_name] = backup
+        return [latest[name] for name in sorted(latest)]
+
+    def download_backup(
+        self,
+        backup: Backup,
+        output_dir: str,
+        parallel: int = backup_transfer.DEFAULT_WORKERS,
+        chunk_size: int = backup_transfer.DEFAULT_CHUNK_SIZE,
+    ) -> Optional[dict]:
+        """Export a backup and download it into ``output_dir``.
+
+        Returns the transfer summary, or None if the export failed.
+        """
+        url = self.wait_for_export(backup.id)
+        if not url:
+            return None
+
+        # Keep the extension Scaleway gives the export, if any
+        filename = os.path.basename(urlparse(url).path) or f"{backup.name}.dump"
+        instance_dir = backup.instance_name or backup.instance_id
+        dest = os.path.join(output_dir, instance_dir, backup.database_name, filename)
+        logger.info(f"Downloading {backup.name} to {dest} ({parallel} connections)")
+        return backup_transfer.download_file(url, dest, workers=parallel, chunk_size=chunk_size)
+
+    def upload_backup(
+        self,
+        backup: Backup,
+        client,
+        bucket: str,
+        prefix: str = "database-backups",
+        compress: bool = False,
+        part_size: int = backup_upload.DEFAULT_PART_SIZE,
+        concurrency: int = backup_upload.DEFAULT_CONCURRENCY,
+    ) -> Optional[dict]:
+        """Export a backup and stream it into an S3 bucket.
+
+        Returns the upload summary, or None if the export failed.
+        """
+        url = self.wait_for_export(backup.id)
+        if not url:
+            return None
+
+        filename = os.path.basename(urlparse(url).path) or f"{backup.name}.dump"
+        if compress:
+            filename += ".zst"
+        instance_dir = backup.instance_name or backup.instance_id
+        key = "/".join(p for p in (prefix.strip("/"), instance_dir, backup.database_name, filename) if p)
+        return backup_upload.stream_to_s3(
+            url,
+            client,
+            bucket,
+            key,
+            compress=compress,
+            part_size=part_size,
+            concurrency=concurrency,
+        )
+
+    def restore_backup(self, backup_id: str, instance_id: str, database_name: str) -> dict:
+        """Restore a backup into a database of an instance."""
+        endpoint = f"/rdb/v1/regions/{self.region}/backups/{backup_id}/restore"
+        data = {"instance_id": instance_id, "database_name": database_name}
+        return self._request("POST", endpoint, data)
+
+    @property
+    def catalog_source(self) -> str:
+        return f"rdb:{self.region}"
+
+    def refresh_catalog(self, catalog: BackupCatalog, full: bool = False) -> int:
+        """Bring the local backup catalog up to date."""
+        instance_names = {i["id"]: i["name"] for i in self.list_instances()}
+
+        def to_entry(backup: dict) -> dict:
+            instance_name = backup.get("instance_name") or instance_names.get(backup["instance_id"], backup["instance_id"])
+            created_at = parse_time(backup.get("created_at"))
+            return {
+                "id": backup["id"],
+                "target": f"{backup['instance_id']}/{backup['database_name']}",
+                "label": f"{instance_name}/{backup['database_name']}",
+                "name": backup["name"],
+                "created_at": created_at,
+                "status": backup.get("status", "unknown"),
+                "size": backup.get("size") or 0,
+                "data": {
+                    "instance_id": backup["instance_id"],
+                    "instance_name": instance_name,
+                    "database_name": backup["database_name"],
+                    "expires_at": parse_time(backup.get("expires_at")),
+                    # Approximates how long the backup ran: a ready backup is
+                    # last updated when it completes
+                    "duration": max(0, parse_time(backup.get("updated_at")) - created_at),
+                },
+            }
+
+        endpoint = (
+            f"/rdb/v1/regions/{self.region}/backups"
+            f"?project_id={self.project_id}&order_by=created_at_desc"
+        )
+        return catalog.refresh(
+            self.catalog_source,
+            self.paginate(endpoint, "database_backups"),
+            to_entry,
+            full=full,
+        )
+
+    def plan_restore(self, catalog: BackupCatalog, at: int) -> list:
+        """Newest ready, unexpired backup of each database at or before ``at``."""
+        now = int(time.time())
+        return [
+            entry
+            for entry in catalog.nearest(self.catalog_source, at, ("ready",))
+            if not entry["data"]["expires_at"] or entry["data"]["expires_at"] > now
+        ]
+
+    def storage_series(self, catalog: BackupCatalog) -> dict:
+        """Ready backups from the catalog as analytics points, per database."""
+        series: dict[str, dict] = {}
+        for entry in catalog.entries(self.catalog_source, ("ready",)):
+            key = f"{self.catalog_source}:{entry['target']}"
+            series.setdefault(key, {"label": entry["label"], "data": entry["data"], "points": []})
+            series[key]["points"].append({
+                "id": entry["id"],
+                "created_at": entry["created_at"],
+                "size": entry["size"],
+                "duration": entry["data"].get("duration") or None,
+            })
+        return series
+
+    def execute_restore(self, plan: list, database_suffix: str = "") -> list:
+        """Start the restores in ``plan``; returns (entry, error or None) pairs.
+
+        An instance only accepts one operation at a time, so restores run in
+        parallel across instances and one after another within an instance.
+        """
+        by_instance: dict[str, list] = {}
+        for entry in plan:
+            by_instance.setdefault(entry["data"]["instance_id"], []).append(entry)
+
+        def restore_instance(instance_id: str, entries: list) -> list:
+            results = []
+            for i, entry in enumerate(entries):
+                target_db = entry["data"]["database_name"] + database_suffix
+                try:
+                    logger.info(f"Restoring {entry['name']} into {entry['data']['instance_name']}/{target_db}")
+                    self.restore_backup(entry["id"], instance_id, target_db)
+                    results.append((entry, None))
+                except ScalewayAPIError as e:
+                    results.append((entry, str(e)))
+                if i < len(entries) - 1 and not self.wait_for_instance_ready(instance_id, timeout=1800):
+                    results.extend((e, "instance did not return to ready state") for e in entries[i + 1:])
+                    break
+            return results
+
+        if not by_instance:
+            return []
+        with ThreadPoolExecutor(max_workers=len(by_instance)) as pool:
+            futures = [pool.submit(restore_instance, iid, entries) for iid, entries in by_instance.items()]
+            return [result for future in futures for result in future.result()]
+
     def backup_instance(
         self,
         instance_name: str,
         databases: Optional[list] = None,
         retention_days: int = 7,
         exclude_system: bool = True,
-    ) -> tuple[int, int]:
+        detector: Optional[ChangeDetector] = None,
+    ) -> tuple[int, int, int]:
         """
         Create backups for all databases in an instance.
         
-        Returns: (success_count, total_count)
+        With a change detector, databases without writes since their last
+        backup are skipped until that backup becomes too old.
+        
+        Returns: (success_count, total_count, skipped_count)
         """
         instance = self.get_instance_by_name(instance_name)
         if not instance:
             logger.error(f"Instance not found: {instance_name}")
-            return (0, 0)
+            return (0, 0, 0)
 
         instance_id = instance["id"]
         all_databases = self.list_databases(instance_id)
@@ -167,7 +423,23 @@ class ScalewayDatabaseBackupManager:
 
         if not db_names:
             logger.warning(f"No databases to backup for instance: {instance_name}")
-            return (0, 0)
+            return (0, 0, 0)
+
+        activity = detector.activity(instance) if detector else {}
+        skipped = 0
+        if detector:
+            changed = []
+            for db_name in db_names:
+                reason = detector.reason(f"{instance_name}/{db_name}", activity.get(db_name))
+                if reason:
+                    logger.info(f"Backing up {db_name}: {reason}")
+                    changed.append(db_name)
+                else:
+                    logger.info(f"Skipping {db_name}: unchanged since last backup")
+                    skipped += 1
+            db_names = changed
+            if not db_names:
+                return (0, 0, skipped)
 
         timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
         expires_at = (datetime.now(timezone.utc) + timedelta(days=retention_days)).isoformat()
@@ -184,9 +456,14 @@ class ScalewayDatabaseBackupManager:
                     backup_name=backup_name,
                     expires_at=expires_at,
                 )
-                backup = result.get("database_backup", {})
+                backup = result.get("database_backup", result)
                 logger.info(f"Backup created: {backup.get('id', 'unknown')} (expires: {expires_at[:10]})")
                 success_count += 1
+                # Only a backup that became ready lets the next run skip the
+                # database; a failed one is retried then
+                if detector and backup.get("id") and self.wait_for_backup(backup["id"]):
+                    # Fingerprint from before the backup: writes during it show up next run
+                    detector.record(f"{instance_name}/{db_name}", activity.get(db_name))
                 
                 # Wait for instance to be ready before next backup
                 # (Scaleway only allows one backup operation at a time)
@@ -196,7 +473,7 @@ class ScalewayDatabaseBackupManager:
                         logger.error("Instance did not return to ready state, aborting remaining backups")
                         break
                         
-            except requests.HTTPError as e:
+            except ScalewayAPIError as e:
                 logger.error(f"Failed to create backup for {db_name}: {e}")
                 # Wait anyway in case instance is in transient state
                 time.sleep(5)
@@ -204,7 +481,31 @@ class ScalewayDatabaseBackupManager:
                     logger.error("Instance did not return to ready state, aborting remaining backups")
                     break
 
-        return (success_count, len(db_names))
+        return (success_count, len(db_names), skipped)
+
+    def create_backups(self, instance: dict, requests: list) -> set:
+        """Back up ``(database, retention_days)`` pairs of one instance in turn.
+
+        Returns the databases whose backup was created and became ready.
+        """
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        created = set()
+        for i, (db_name, retention_days) in enumerate(requests):
+            # Scaleway only allows one backup operation per instance at a time
+            if i and not self.wait_for_instance_ready(instance["id"], timeout=600):
+                logger.error(f"Instance {instance['name']} did not return to ready state, aborting remaining backups")
+                break
+            backup_name = f"auto-{instance['name']}-{db_name}-{timestamp}"
+            expires_at = (datetime.now(timezone.utc) + timedelta(days=retention_days)).isoformat()
+            try:
+                result = self.create_backup(instance["id"], db_name, backup_name, expires_at)
+                logger.info(f"Backup created: {backup_name} (expires: {expires_at[:10]})")
+                # Reconcile deletes the runs beyond retention once this one counts
+                if self.wait_for_backup(result.get("database_backup", result)["id"]):
+                    created.add(db_name)
+            except ScalewayAPIError as e:
+                logger.error(f"Failed to create backup for {instance['name']}/{db_name}: {e}")
+        return created
 
     def cleanup_old_backups(
         self,
@@ -220,22 +521,12 @@ class ScalewayDatabaseBackupManager:
         instance_id = instance["id"]
         all_backups = self.list_backups(instance_id)
         
-        # Filter to only auto-created backups
-        auto_backups = [b for b in all_backups if b["name"].startswith("auto-")]
-        
-        # Group by database name
-        by_database: dict[str, list] = {}
-        for backup in auto_backups:
-            db_name = backup["database_name"]
-            if db_name not in by_database:
-                by_database[db_name] = []
-            by_database[db_name].append(backup)
+        # Only auto-created backups, per database, newest first
+        auto_backups = newest_first(b for b in all_backups if b.name.startswith("auto-"))
+        by_database = group_by(auto_backups, "database_name")
 
         total_deleted = 0
         for db_name, backups in by_database.items():
-            # Sort by creation date (newest first)
-            backups.sort(key=lambda b: b.get("created_at", ""), reverse=True)
-            
             if len(backups) > retention_count:
                 to_delete = backups[retention_count:]
                 logger.info(
@@ -244,14 +535,12 @@ class ScalewayDatabaseBackupManager:
                 )
                 
                 for backup in to_delete:
-                    backup_id = backup["id"]
-                    backup_name = backup["name"]
-                    logger.info(f"Deleting backup: {backup_name}")
+                    logger.info(f"Deleting backup: {backup.name}")
                     try:
-                        self.delete_backup(backup_id)
+                        self.delete_backup(backup.id)
                         total_deleted += 1
-                    except requests.HTTPError as e:
-                        logger.error(f"Failed to delete backup {backup_name}: {e}")
+                    except ScalewayAPIError as e:
+                        logger.error(f"Failed to delete backup {backup.name}: {e}")
             else:
                 logger.info(
                     f"Database {db_name}: {len(backups)} backups, "
@@ -261,13 +550,13 @@ class ScalewayDatabaseBackupManager:
         return total_deleted
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Scaleway Managed Database Backup Manager"
     )
     parser.add_argument(
         "--action",
-        choices=["backup", "list", "cleanup"],
+        choices=["backup", "list", "cleanup", "download", "upload", "restore-plan", "analytics", "reconcile", "verify"],
         default="backup",
         help="Action to perform (default: backup)",
     )
@@ -279,32 +568,187 @@ def main():
         "--database",
         help="Target specific databases (comma-separated). Leave empty for all.",
     )
+    parser.add_argument(
+        "--policy",
+        default=backup_policy.DEFAULT_PATH,
+        help=f"With reconcile: desired-state policy file (default: {backup_policy.DEFAULT_PATH})",
+    )
     parser.add_argument(
         "--retention-days",
         type=int,
         default=7,
         help="Number of days before backup expires (default: 7)",
     )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="Skip databases without writes since their last backup (reads pg_stat_database, see DB_STATS_*)",
+    )
+    parser.add_argument(
+        "--max-staleness-hours",
+        type=float,
+        default=72,
+        help="With --skip-unchanged: back up unchanged databases anyway after this long (default: 72)",
+    )
     parser.add_argument(
         "--retention-count",
         type=int,
         default=3,
         help="Max backups to keep per database during cleanup (default: 3)",
     )
+    parser.add_argument(
+        "--backup-id",
+        help="Backup to download (default: latest auto-backup of each database)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=os.environ.get("WOBBLER_EXPORT_DIR", "/app/conf/exports"),
+        help="Directory for downloaded backups (default: /app/conf/exports)",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        help="Parallel connections per download (default: 8), or parts in flight per upload "
+        "(default: 4, each holding a part in memory)",
+    )
+    parser.add_argument(
+        "--chunk-size-mb",
+        type=int,
+        default=32,
+        help="Size of each ranged request in MB (default: 32)",
+    )
+    parser.add_argument(
+        "--s3-bucket",
+        default=os.environ.get("S3_BUCKET", ""),
+        help="Bucket to upload backups to (default: $S3_BUCKET)",
+    )
+    parser.add_argument(
+        "--s3-endpoint",
+        default=os.environ.get("S3_ENDPOINT_URL", ""),
+        help="S3 endpoint URL, e.g. a local MinIO (default: $S3_ENDPOINT_URL)",
+    )
+    parser.add_argument(
+        "--s3-prefix",
+        default="database-backups",
+        help="Key prefix for uploaded backups (default: database-backups)",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Compress uploads with zstd on the fly",
+    )
+    parser.add_argument(
+        "--part-size-mb",
+        type=int,
+        default=64,
+        help="Multipart upload part size in MB, at least 5 (default: 64)",
+    )
+    parser.add_argument(
+        "--at",
+        help="Point in time to restore to, ISO 8601, UTC if no offset (default: now)",
+    )
+    parser.add_argument(
+        "--execute",
+        action="store_true",
+        help="With restore-plan: start the planned restores",
+    )
+    parser.add_argument(
+        "--restore-suffix",
+        default="",
+        help="With restore-plan --execute: restore into <database><suffix> instead of the original database",
+    )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="With restore-plan or analytics: rebuild the local catalog instead of updating it",
+    )
+    parser.add_argument(
+        "--what-if-retention",
+        default="1,3,7,14",
+        help="With analytics: retention counts to compare (comma-separated, default: 1,3,7,14)",
+    )
+    parser.add_argument(
+        "--storage-budget-gb",
+        type=float,
+        help="With analytics: forecast when stored backups reach this many GB",
+    )
+    parser.add_argument(
+        "--backup-window-minutes",
+        type=int,
+        help="With analytics: forecast when a backup run no longer fits in this window",
+    )
     parser.add_argument(
         "--include-system",
         action="store_true",
         help="Include system databases (rdb, postgres, etc.)",
     )
+    parser.add_argument(
+        "--verify-sample",
+        type=int,
+        default=2,
+        help="With verify: databases to restore per run, least recently verified first (default: 2)",
+    )
+    parser.add_argument(
+        "--verify-max-age-hours",
+        type=float,
+        default=48,
+        help="With verify: only sample backups younger than this (default: 48)",
+    )
+    parser.add_argument(
+        "--verify-parallel",
+        type=int,
+        default=2,
+        help="With verify: restores running at the same time, one scratch container each (default: 2)",
+    )
+    parser.add_argument(
+        "--restore-jobs",
+        type=int,
+        default=4,
+        help="With verify: pg_restore jobs per restore (default: 4)",
+    )
+    parser.add_argument(
+        "--verify-max-shrink",
+        type=float,
+        default=0.5,
+        help="With verify: warn when a table lost more than this fraction of its rows (default: 0.5)",
+    )
+    parser.add_argument(
+        "--verify-memory",
+        help="With verify: memory limit of each scratch container, e.g. 1g",
+    )
+    parser.add_argument(
+        "--on-overlap",
+        choices=run_lease.POLICIES,
+        default=run_lease.DEFAULT_POLICY,
+        help="When another run holds some of the targets: wait for it, merge into it if it runs "
+        "the same action, or fail right away (default: WOBBLER_ON_OVERLAP or wait)",
+    )
+    parser.add_argument(
+        "--overlap-timeout",
+        type=int,
+        default=3600,
+        help="Seconds to wait for overlapping runs before giving up (default: 3600)",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
         help="Show what would be done without making changes",
     )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Always run in this process, even if a daemon is listening",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help=argparse.SUPPRESS,
+    )
+    return parser
 
-    args = parser.parse_args()
 
-    # Get credentials from environment
+def create_manager(get_cache_ttl: float = 0) -> ScalewayDatabaseBackupManager:
+    """Create a manager from the SCW_* environment variables."""
     access_key = os.environ.get("SCW_ACCESS_KEY", "")
     secret_key = os.environ.get("SCW_SECRET_KEY", "")
     project_id = os.environ.get("SCW_PROJECT_ID", "")
@@ -313,18 +757,373 @@ def main():
         logger.error("Missing Scaleway credentials (SCW_ACCESS_KEY, SCW_SECRET_KEY, SCW_PROJECT_ID)")
         sys.exit(1)
 
-    manager = ScalewayDatabaseBackupManager(
+    return ScalewayDatabaseBackupManager(
         access_key=access_key,
         secret_key=secret_key,
         project_id=project_id,
+        get_cache_ttl=get_cache_ttl,
     )
 
+
+def is_read_only(args: argparse.Namespace) -> bool:
+    """Whether a run makes no changes and may be answered by the daemon."""
+    if args.action == "restore-plan":
+        return not args.execute or args.dry_run
+    return args.action in ("list", "analytics") or args.dry_run
+
+
+LEASED_ACTIONS = (
+    "backup", "cleanup", "reconcile", "restore-plan",
+    # These export or restore existing backups, which cleanup and reconcile may delete
+    "download", "upload", "verify",
+)
+
+
+def needs_lease(args: argparse.Namespace) -> bool:
+    """Whether a run changes or exports backups and must not overlap other such runs."""
+    return args.action in LEASED_ACTIONS and not is_read_only(args)
+
+
+def select_backups(
+    args: argparse.Namespace,
+    manager: ScalewayDatabaseBackupManager,
+    instances: list,
+    databases: Optional[list],
+) -> list:
+    """Backups to export: --backup-id, or the latest of each database."""
+    if args.backup_id:
+        return [Backup.from_api(manager.get_backup(args.backup_id))]
+    selected = []
+    for instance_name in instances:
+        instance = manager.get_instance_by_name(instance_name)
+        if instance:
+            selected.extend(manager.latest_backups(instance["id"], databases))
+    return selected
+
+
+def run_restore_plan(
+    args: argparse.Namespace,
+    manager: ScalewayDatabaseBackupManager,
+    instances: list,
+    databases: Optional[list],
+) -> None:
+    """Print (and optionally start) the restores for a point in time."""
+    at = parse_time(args.at) if args.at else int(time.time())
+    catalog = BackupCatalog()
+    try:
+        updated = manager.refresh_catalog(catalog, full=args.full_refresh)
+        started = time.perf_counter()
+        plan = [
+            entry
+            for entry in manager.plan_restore(catalog, at)
+            if entry["data"]["instance_name"] in instances
+            and (not databases or entry["data"]["database_name"] in databases)
+        ]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    finally:
+        catalog.close()
+
+    print(f"=== Restore plan for {format_time(at)} ===")
+    print(f"Catalog: {updated} entries updated, plan computed in {elapsed_ms:.1f} ms")
+    print("")
+    if not plan:
+        print("No usable backups at or before that time")
+        sys.exit(1)
+
+    for entry in plan:
+        age = timedelta(seconds=at - entry["created_at"])
+        print(f"  {entry['label']}")
+        print(f"    {entry['name']} ({entry['id']})")
+        print(f"    Created: {format_time(entry['created_at'])} ({age} before target), Size: {entry['size'] / (1024 * 1024):.1f} MB")
+
+    if not args.execute:
+        return
+    if args.dry_run:
+        print(f"\n[DRY RUN] Would start {len(plan)} restores")
+        return
+
+    print(f"\n=== Starting {len(plan)} restores ===")
+    failed = 0
+    for entry, error in manager.execute_restore(plan, database_suffix=args.restore_suffix):
+        if error:
+            print(f"[FAILED] {entry['label']}: {error}")
+            failed += 1
+        else:
+            print(f"[OK] Restore started: {entry['label']}{args.restore_suffix}")
+    if failed:
+        sys.exit(1)
+
+
+def run_analytics(
+    args: argparse.Namespace,
+    manager: ScalewayDatabaseBackupManager,
+    instances: list,
+    databases: Optional[list],
+) -> None:
+    """Record backup sizes and print growth, retention and capacity forecasts."""
+    what_if = sorted({int(n) for n in args.what_if_retention.split(",") if n.strip()} | {args.retention_count})
+    window = args.backup_window_minutes * 60 if args.backup_window_minutes else None
+    budget = int(args.storage_budget_gb * 1024 ** 3) if args.storage_budget_gb else None
+
+    catalog = BackupCatalog()
+    history = storage_analytics.StorageHistory()
+    try:
+        manager.refresh_catalog(catalog, full=args.full_refresh)
+        results = []
+        for key, series in sorted(manager.storage_series(catalog).items(), key=lambda item: item[1]["label"]):
+            if series["data"]["instance_name"] not in instances or (
+                databases and series["data"]["database_name"] not in databases
+            ):
+                continue
+            history.record(key, series["label"], series["points"])
+            results.append(storage_analytics.analyze_series(
+                series["label"],
+                history.points(key),
+                series["points"],
+                args.retention_count,
+                what_if,
+                window_seconds=window,
+            ))
+    finally:
+        history.close()
+        catalog.close()
+
+    if not results:
+        print("No ready backups found")
+        return
+    totals = storage_analytics.summarize(results, args.retention_count, what_if, budget)
+    storage_analytics.print_report("database backups", results, totals, args.retention_count, window)
+
+
+def run_reconcile(
+    args: argparse.Namespace,
+    manager: ScalewayDatabaseBackupManager,
+    policy: dict,
+    instances: list,
+    databases: Optional[list],
+    inventory: Optional[list] = None,
+) -> None:
+    """Create and delete backups until every database matches the policy.
+
+    ``inventory`` is the instance listing run() already made, if any.
+    """
+    # The only read when nothing is due: one listing of all backups. Instance
+    # ids come from it (or run()'s listing) and database names from it, the
+    # policy and a database listing cached for DATABASE_LIST_TTL.
+    backups = manager.list_all_backups()
+    by_name = {b.instance_name: {"id": b.instance_id, "name": b.instance_name} for b in backups if b.instance_name}
+    if inventory is None and any(name not in by_name for name in instances):
+        inventory = manager.list_instances()
+    by_name.update((instance["name"], instance) for instance in inventory or [])
+    now = time.time()
+
+    steps = []
+    for instance_name in instances:
+        instance = by_name.get(instance_name)
+        if not instance:
+            logger.error(f"Instance not found: {instance_name}")
+            continue
+        by_database = group_by(
+            newest_first(b for b in backups if b.instance_id == instance["id"] and b.name.startswith("auto-")),
+            "database_name",
+        )
+        named = {
+            target.split("/", 1)[1]
+            for target in backup_policy.target_names(policy, "databases")
+            if target.startswith(f"{instance_name}/") and not any(c in target for c in "*?[")
+        }
+        db_names = set(by_database) | named | set(manager.recent_databases(instance["id"]))
+        for db_name in sorted(db_names):
+            if databases and db_name not in databases:
+                continue
+            # System databases are only managed when the policy names them
+            settings = backup_policy.settings_for(
+                policy, "databases", f"{instance_name}/{db_name}", exact=db_name in {"rdb", "postgres"}
+            )
+            if settings:
+                runs = [
+                    {"created_at": b.created_at, "ok": b.status != "error", "backup": b}
+                    for b in by_database.get(db_name, [])
+                ]
+                step = backup_policy.plan_target(db_name, settings, runs, now)
+                step["instance"] = instance
+                steps.append(step)
+
+    print(f"=== Reconciling database backups with {args.policy} ===")
+    for step in steps:
+        print(f"  {step['instance']['name']}/{step['name']}: {backup_policy.describe(step)}")
+
+    to_create = [step for step in steps if step["create"]]
+    if not to_create and not any(backup_policy.deletions(step) for step in steps):
+        print("\nNothing to do")
+        return
+    if args.dry_run:
+        deleted = sum(len(backup_policy.deletions(step)) for step in steps)
+        print(f"\n[DRY RUN] Would create {len(to_create)} backups and delete {deleted}")
+        return
+
+    failed = 0
+    created = set()
+    if to_create:
+        print(f"\n=== Creating {len(to_create)} backups ===")
+        # Instances in parallel, the databases of one instance in turn
+        per_instance: dict[str, list] = {}
+        for step in to_create:
+            per_instance.setdefault(step["instance"]["name"], []).append(step)
+        with ThreadPoolExecutor(max_workers=len(per_instance)) as pool:
+            results = pool.map(
+                lambda instance_steps: manager.create_backups(
+                    instance_steps[0]["instance"],
+                    [(step["name"], step["settings"]["expires_days"]) for step in instance_steps],
+                ),
+                per_instance.values(),
+            )
+            for instance_name, done in zip(per_instance, results):
+                created.update((instance_name, db_name) for db_name in done)
+        for step in to_create:
+            if (step["instance"]["name"], step["name"]) in created:
+                print(f"[OK] Backup created for {step['instance']['name']}/{step['name']}")
+            else:
+                failed += 1
+                print(f"[FAILED] Could not back up {step['instance']['name']}/{step['name']}")
+
+    to_delete = [
+        run["backup"]
+        for step in steps
+        for run in backup_policy.deletions(step, created=(step["instance"]["name"], step["name"]) in created)
+    ]
+    if to_delete:
+        print(f"\n=== Deleting {len(to_delete)} backups ===")
+
+        def delete(backup: Backup) -> bool:
+            try:
+                manager.delete_backup(backup.id)
+                logger.info(f"Deleted backup: {backup.name}")
+                return True
+            except ScalewayAPIError as e:
+                logger.error(f"Failed to delete backup {backup.name}: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=min(len(to_delete), 8)) as pool:
+            deleted = sum(pool.map(delete, to_delete))
+        failed += len(to_delete) - deleted
+        print(f"[OK] Deleted {deleted}/{len(to_delete)} backups")
+
+    print(f"\n=== Reconcile Complete ===")
+    if failed:
+        sys.exit(1)
+
+
+def run_verify(
+    args: argparse.Namespace,
+    manager: ScalewayDatabaseBackupManager,
+    instances: list,
+    databases: Optional[list],
+) -> None:
+    """Restore a sample of recent backups into scratch containers and check them."""
+    candidates = []
+    for instance_name in instances:
+        instance = manager.get_instance_by_name(instance_name)
+        if instance:
+            for backup in manager.latest_backups(instance["id"], databases):
+                candidates.append((f"{instance_name}/{backup.database_name}", backup))
+
+    history = restore_verify.VerificationHistory()
+    try:
+        picked = restore_verify.sample(
+            candidates, history.last_verified(), args.verify_sample, args.verify_max_age_hours * 3600
+        )
+        print("=== Verifying database backups ===")
+        print(f"Sample: {len(picked)} of {len(candidates)} databases, {args.verify_parallel} at a time")
+        print("")
+        if not picked:
+            print("No recent backups to verify")
+            return
+        if args.dry_run:
+            for key, backup in picked:
+                print(f"[DRY RUN] Would restore {backup.name} ({backup.size / (1024 * 1024):.1f} MB) into a scratch {restore_verify.VERIFY_IMAGE}")
+            return
+
+        # Reference tables are read up front: the SQLite connection stays in this thread
+        references = {key: (history.tables(key, backup.id), history.tables(key)) for key, backup in picked}
+        workdir = os.path.join(args.output_dir, ".verify")
+
+        def verify(item: tuple) -> tuple:
+            key, backup = item
+            download_dir = os.path.join(workdir, backup.id)
+            download = None
+            try:
+                download = manager.download_backup(
+                    backup,
+                    output_dir=download_dir,
+                    parallel=args.parallel or backup_transfer.DEFAULT_WORKERS,
+                    chunk_size=args.chunk_size_mb * 1024 * 1024,
+                )
+                if not download:
+                    result = restore_verify.failure("export failed")
+                else:
+                    same_backup, previous = references[key]
+                    result = restore_verify.verify_dump(
+                        download["path"],
+                        backup.database_name,
+                        jobs=args.restore_jobs,
+                        same_backup=same_backup,
+                        previous=previous,
+                        max_shrink=args.verify_max_shrink,
+                        memory=args.verify_memory,
+                    )
+            except (ScalewayAPIError, backup_transfer.DownloadError, OSError) as e:
+                result = restore_verify.failure(f"download failed: {e}")
+            except Exception as e:
+                # One broken verification must not drop the results of the others
+                logger.exception(f"Verification of {backup.name} failed")
+                result = restore_verify.failure(f"verification failed: {e}")
+            finally:
+                shutil.rmtree(download_dir, ignore_errors=True)
+            return key, backup, download, result
+
+        with ThreadPoolExecutor(max_workers=max(1, args.verify_parallel)) as pool:
+            results = list(pool.map(verify, picked))
+
+        failed = 0
+        for key, backup, download, result in results:
+            download_seconds = download["seconds"] if download else None
+            history.record(key, backup, result, download_seconds)
+            size_mb = backup.size / (1024 * 1024)
+            if not result["ok"]:
+                failed += 1
+                print(f"[FAILED] {key}: {backup.name} ({size_mb:.1f} MB): {result['error']}")
+                continue
+            rows = sum(stats[0] for stats in result["tables"].values())
+            restore_seconds = result["restore_seconds"]
+            print(f"[OK] {key}: {backup.name} ({size_mb:.1f} MB)")
+            print(
+                f"     {len(result['tables'])} tables, {rows} rows; downloaded in {download_seconds:.1f}s, "
+                f"restored in {restore_seconds:.1f}s ({size_mb / max(restore_seconds, 0.001):.1f} MB/s)"
+            )
+            rates = history.restore_rates(key)
+            if rates:
+                estimate = backup.size / statistics.median(rates)
+                print(f"     Restore time at the median of the last {len(rates)} runs: {estimate:.0f}s + download")
+            for warning in result["warnings"]:
+                print(f"     [WARNING] {warning}")
+    finally:
+        history.close()
+
+    print("\n=== Verify Complete ===")
+    print(f"Backups verified: {len(results) - failed}/{len(results)}")
+    if failed:
+        sys.exit(1)
+
+
+def run(args: argparse.Namespace, manager: ScalewayDatabaseBackupManager) -> None:
     # Get instances to backup
+    inventory = None
     if args.instance:
         instances = [args.instance]
     else:
-        all_instances = manager.list_instances()
-        instances = [i["name"] for i in all_instances]
+        inventory = manager.list_instances()
+        instances = [i["name"] for i in inventory]
 
     if not instances:
         logger.error("No database instances found")
@@ -335,6 +1134,47 @@ def main():
     if args.database:
         databases = [d.strip() for d in args.database.split(",")]
 
+    if not needs_lease(args):
+        run_action(args, manager, instances, databases, inventory)
+        return
+    run_lease.coordinated(
+        "database",
+        instances,
+        args.action,
+        args.on_overlap,
+        args.overlap_timeout,
+        lambda leased: run_action(args, manager, leased, databases, inventory),
+    )
+
+
+def run_action(
+    args: argparse.Namespace,
+    manager: ScalewayDatabaseBackupManager,
+    instances: list,
+    databases: Optional[list],
+    inventory: Optional[list] = None,
+) -> None:
+    if args.action == "reconcile":
+        try:
+            policy = backup_policy.load_policy(args.policy)
+        except backup_policy.PolicyError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        run_reconcile(args, manager, policy, instances, databases, inventory)
+        return
+
+    if args.action == "restore-plan":
+        run_restore_plan(args, manager, instances, databases)
+        return
+
+    if args.action == "analytics":
+        run_analytics(args, manager, instances, databases)
+        return
+
+    if args.action == "verify":
+        run_verify(args, manager, instances, databases)
+        return
+
     if args.action == "list":
         for instance_name in instances:
             instance = manager.get_instance_by_name(instance_name)
@@ -348,24 +1188,14 @@ def main():
             if not backups:
                 print("  No backups found")
             else:
-                # Group by database
-                by_db: dict[str, list] = {}
-                for b in backups:
-                    db = b["database_name"]
-                    if db not in by_db:
-                        by_db[db] = []
-                    by_db[db].append(b)
-                
+                by_db = group_by(newest_first(backups), "database_name")
                 for db_name, db_backups in sorted(by_db.items()):
                     print(f"\n  Database: {db_name}")
-                    db_backups.sort(key=lambda b: b.get("created_at", ""), reverse=True)
                     for b in db_backups:
-                        status = b.get("status", "unknown")
-                        created = b.get("created_at", "unknown")[:19]
-                        expires = b.get("expires_at", "never")[:10] if b.get("expires_at") else "never"
-                        size_mb = b.get("size", 0) / (1024 * 1024)
-                        print(f"    - {b['name']}")
-                        print(f"      Status: {status}, Created: {created}, Expires: {expires}, Size: {size_mb:.1f} MB")
+                        expires = format_time(b.expires_at)[:10] if b.expires_at else "never"
+                        size_mb = b.size / (1024 * 1024)
+                        print(f"    - {b.name}")
+                        print(f"      Status: {b.status}, Created: {format_time(b.created_at)}, Expires: {expires}, Size: {size_mb:.1f} MB")
         return
 
     if args.action == "backup":
@@ -374,10 +1204,17 @@ def main():
         print(f"Retention: {args.retention_days} days")
         if databases:
             print(f"Databases: {', '.join(databases)}")
+        detector = None
+        if args.skip_unchanged:
+            # Never skip for so long that the newest backup expires
+            max_staleness = min(args.max_staleness_hours * 3600, max(args.retention_days - 1, 0) * 86400)
+            detector = ChangeDetector(max_staleness)
+            print(f"Skipping unchanged databases for up to {max_staleness / 3600:g} hours")
         print("")
 
         total_success = 0
         total_count = 0
+        total_skipped = 0
         
         for instance_name in instances:
             print(f"--- Backing up: {instance_name} ---")
@@ -389,28 +1226,44 @@ def main():
                     db_names = [d["name"] for d in dbs if d["name"] not in {"rdb", "postgres"} or args.include_system]
                     if databases:
                         db_names = [d for d in db_names if d in databases]
+                    if detector:
+                        activity = detector.activity(instance)
+                        unchanged = [
+                            d for d in db_names
+                            if not detector.reason(f"{instance_name}/{d}", activity.get(d))
+                        ]
+                        db_names = [d for d in db_names if d not in unchanged]
+                        if unchanged:
+                            print(f"[DRY RUN] Would skip unchanged databases: {', '.join(unchanged)}")
+                        total_skipped += len(unchanged)
                     print(f"[DRY RUN] Would backup databases: {', '.join(db_names)}")
                     total_count += len(db_names)
                     total_success += len(db_names)
             else:
-                success, count = manager.backup_instance(
+                success, count, skipped = manager.backup_instance(
                     instance_name=instance_name,
                     databases=databases,
                     retention_days=args.retention_days,
                     exclude_system=not args.include_system,
+                    detector=detector,
                 )
                 total_success += success
                 total_count += count
+                total_skipped += skipped
                 
+                if skipped:
+                    print(f"[OK] Skipped {skipped} unchanged databases")
                 if success == count and count > 0:
                     print(f"[OK] Backed up {success}/{count} databases")
                 elif success > 0:
                     print(f"[PARTIAL] Backed up {success}/{count} databases")
-                else:
+                elif not skipped:
                     print(f"[FAILED] Could not backup any databases")
 
         print(f"\n=== Backup Complete ===")
         print(f"Databases backed up: {total_success}/{total_count}")
+        if detector:
+            print(f"Unchanged databases skipped: {total_skipped}")
 
     if args.action == "cleanup":
         print("=== Cleaning up old database backups ===")
@@ -425,14 +1278,10 @@ def main():
                 instance = manager.get_instance_by_name(instance_name)
                 if instance:
                     backups = manager.list_backups(instance["id"])
-                    auto_backups = [b for b in backups if b["name"].startswith("auto-")]
-                    by_db: dict[str, int] = {}
-                    for b in auto_backups:
-                        db = b["database_name"]
-                        by_db[db] = by_db.get(db, 0) + 1
-                    for db, count in by_db.items():
-                        if count > args.retention_count:
-                            print(f"[DRY RUN] {db}: would delete {count - args.retention_count} old backups")
+                    by_db = group_by((b for b in backups if b.name.startswith("auto-")), "database_name")
+                    for db, db_backups in by_db.items():
+                        if len(db_backups) > args.retention_count:
+                            print(f"[DRY RUN] {db}: would delete {len(db_backups) - args.retention_count} old backups")
             else:
                 deleted = manager.cleanup_old_backups(
                     instance_name=instance_name,
@@ -447,6 +1296,142 @@ def main():
         print(f"\n=== Cleanup Complete ===")
         print(f"Total backups deleted: {total_deleted}")
 
+    if args.action == "download":
+        print("=== Downloading database backups ===")
+        print(f"Output: {args.output_dir}")
+        print("")
+
+        to_download = select_backups(args, manager, instances, databases)
+
+        if not to_download:
+            print("No backups to download")
+            return
+
+        failed = 0
+        for backup in to_download:
+            size_mb = backup.size / (1024 * 1024)
+            if args.dry_run:
+                print(f"[DRY RUN] Would download {backup.name} ({size_mb:.1f} MB)")
+                continue
+
+            try:
+                result = manager.download_backup(
+                    backup,
+                    output_dir=args.output_dir,
+                    parallel=args.parallel or backup_transfer.DEFAULT_WORKERS,
+                    chunk_size=args.chunk_size_mb * 1024 * 1024,
+                )
+            except (ScalewayAPIError, backup_transfer.DownloadError, OSError) as e:
+                logger.error(f"Failed to download {backup.name}: {e}")
+                result = None
+
+            if result:
+                resumed = " (resumed)" if result["resumed"] else ""
+                print(
+                    f"[OK] {backup.name}: {result['size'] / (1024 * 1024):.1f} MB "
+                    f"in {result['seconds']:.1f}s ({result['mbps']:.0f} Mbit/s){resumed}"
+                )
+                print(f"     {result['path']} sha256={result['sha256']}")
+            else:
+                print(f"[FAILED] {backup.name}")
+                failed += 1
+
+        if args.dry_run:
+            return
+
+        print(f"\n=== Download Complete ===")
+        print(f"Backups downloaded: {len(to_download) - failed}/{len(to_download)}")
+        if failed:
+            sys.exit(1)
+
+    if args.action == "upload":
+        if not args.s3_bucket:
+            logger.error("No bucket given (--s3-bucket or S3_BUCKET)")
+            sys.exit(1)
+
+        print("=== Uploading database backups to object storage ===")
+        print(f"Destination: s3://{args.s3_bucket}/{args.s3_prefix}")
+        print(f"Compression: {'zstd' if args.compress else 'none'}")
+        print("")
+
+        to_upload = select_backups(args, manager, instances, databases)
+        if not to_upload:
+            print("No backups to upload")
+            return
+
+        client = None
+        failed = 0
+        for backup in to_upload:
+            size_mb = backup.size / (1024 * 1024)
+            if args.dry_run:
+                print(f"[DRY RUN] Would upload {backup.name} ({size_mb:.1f} MB)")
+                continue
+
+            try:
+                if client is None:
+                    client = backup_upload.s3_client(endpoint_url=args.s3_endpoint)
+                result = manager.upload_backup(
+                    backup,
+                    client=client,
+                    bucket=args.s3_bucket,
+                    prefix=args.s3_prefix,
+                    compress=args.compress,
+                    part_size=args.part_size_mb * 1024 * 1024,
+                    concurrency=args.parallel or backup_upload.DEFAULT_CONCURRENCY,
+                )
+            except Exception as e:
+                # boto3 raises its own exception hierarchy; report and move on
+                logger.error(f"Failed to upload {backup.name}: {e}")
+                result = None
+
+            if result:
+                ratio = result["bytes_out"] / result["bytes_in"] if result["bytes_in"] else 1.0
+                print(
+                    f"[OK] {backup.name}: {result['bytes_in'] / (1024 * 1024):.1f} MB "
+                    f"in {result['seconds']:.1f}s ({result['mbps']:.0f} Mbit/s), "
+                    f"{result['parts']} parts, stored {ratio:.0%}"
+                )
+                print(f"     s3://{args.s3_bucket}/{result['key']} sha256={result['sha256']}")
+            else:
+                print(f"[FAILED] {backup.name}")
+                failed += 1
+
+        if args.dry_run:
+            return
+
+        print(f"\n=== Upload Complete ===")
+        print(f"Backups uploaded: {len(to_upload) - failed}/{len(to_upload)}")
+        if failed:
+            sys.exit(1)
+
+
+def main(argv: Optional[list] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        manager = create_manager(
+            get_cache_ttl=float(os.environ.get("WOBBLER_DAEMON_CACHE_TTL", "30"))
+        )
+
+        def run_forwarded(forwarded: list) -> None:
+            forwarded_args = parser.parse_args(forwarded)
+            if not is_read_only(forwarded_args):
+                print("[ERROR] The daemon only serves read-only actions (list, restore-plan, analytics, --dry-run)")
+                sys.exit(2)
+            run(forwarded_args, manager)
+
+        wobbler_daemon.serve(DAEMON_NAME, run_forwarded)
+        return
+
+    if is_read_only(args) and not args.no_daemon:
+        code = wobbler_daemon.forward(DAEMON_NAME, argv)
+        if code is not None:
+            sys.exit(code)
+
+    run(args, create_manager())
+
 
 if __name__ == "__main__":
     main()
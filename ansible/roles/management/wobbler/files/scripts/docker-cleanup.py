@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+Docker Cleanup
+
+Prunes unused Docker resources, truncates oversized container logs and
+vacuums the systemd journal on the managed servers. Hosts are cleaned in
+parallel, each over a single multiplexed SSH connection (management runs
+locally), and every host produces a structured result that is printed as a
+report or as JSON.
+
+With --target-free-percent, the fixed thresholds are replaced by a planner:
+it sizes every container log, unused image and the journal in one pass per
+host and reclaims the largest ones until the target free space is reached.
+"""
+
+import argparse
+import json
+import re
+import shlex
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from remote_host import KNOWN_HOSTS, Host
+
+DEFAULT_SERVERS = "management,tools-prod,authentik-prod"
+FIND_LOGS = "find /var/lib/docker/containers -maxdepth 2 -name '*-json.log'"
+
+# Everything the planner needs from a host, in a single command
+SURVEY_SCRIPT = f"""
+df -B1 --output=size,avail / | tail -n 1
+echo '#logs'
+{FIND_LOGS} -printf '%s\\t%p\\n'
+echo '#images'
+docker image ls --format '{{{{json .}}}}'
+echo '#used'
+docker ps -aq | xargs -r docker inspect --format '{{{{.Image}}}}'
+echo '#journal'
+du -sb /var/log/journal 2>/dev/null | cut -f1
+"""
+
+_UNITS = {"": 1, "B": 1, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+
+
+class CommandError(Exception):
+    """Raised when a cleanup step fails on a host."""
+
+
+def _run(host: Host, command: str, sudo: bool = False) -> str:
+    result = host.run(command, sudo=sudo)
+    if result.returncode != 0:
+        raise CommandError((result.stderr or result.stdout).strip() or f"exit status {result.returncode}")
+    return result.stdout
+
+
+def _size(value: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if abs(value) < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}GB"
+
+
+def disk_usage(host: Host) -> dict:
+    """Root filesystem and `docker system df` usage, in one round trip."""
+    output = _run(host, "df -B1 --output=size,avail / | tail -n 1 && docker system df --format '{{json .}}'")
+    lines = output.strip().splitlines()
+    total, free = (int(v) for v in lines[0].split())
+    return {
+        "total": total,
+        "free": free,
+        "docker": [json.loads(line) for line in lines[1:] if line.startswith("{")],
+    }
+
+
+def _parse_logs(lines: list) -> list:
+    logs = []
+    for line in lines:
+        size, path = line.split("\t", 1)
+        logs.append({"id": path.split("/")[-2], "path": path, "size": int(size), "container": ""})
+    return logs
+
+
+def large_logs(host: Host, min_bytes: int) -> list:
+    """Container logs larger than ``min_bytes``, with container names.
+
+    Sizes come from a single `find`, and names from a single batched
+    `docker inspect` instead of one per log.
+    """
+    output = _run(host, f"{FIND_LOGS} -size +{min_bytes}c -printf '%s\\t%p\\n'", sudo=True)
+    logs = _parse_logs(output.splitlines())
+    if not logs:
+        return logs
+
+    add_container_names(host, logs)
+    return sorted(logs, key=lambda log: log["size"], reverse=True)
+
+
+def add_container_names(host: Host, logs: list) -> None:
+    """Fill in the container name of each log with one batched `docker inspect`."""
+    if not logs:
+        return
+    ids = " ".join(log["id"] for log in logs)
+    result = host.run(f"docker inspect --format '{{{{.Id}}}}\\t{{{{.Name}}}}' {ids}")
+    names = {}
+    for line in result.stdout.splitlines():
+        if "\t" in line:
+            container_id, name = line.split("\t", 1)
+            names[container_id] = name.lstrip("/")
+    for log in logs:
+        log["container"] = names.get(log["id"], log["id"][:12])
+
+
+def truncate_logs(host: Host, logs: list) -> None:
+    paths = " ".join(shlex.quote(log["path"]) for log in logs)
+    _run(host, f"truncate -s 0 -- {paths}", sudo=True)
+
+
+def journal_size(host: Host) -> int:
+    output = _run(host, "du -sb /var/log/journal 2>/dev/null | cut -f1", sudo=True).strip()
+    return int(output) if output.isdigit() else 0
+
+
+def vacuum_journal(host: Host, max_size: str) -> None:
+    _run(host, f"journalctl --vacuum-size={max_size}", sudo=True)
+
+
+def prune_command(prune_volumes: bool) -> str:
+    return "docker system prune -af --volumes" if prune_volumes else "docker system prune -f"
+
+
+def prune(host: Host, prune_volumes: bool) -> str:
+    """Run docker prune and return the reclaimed space as Docker reports it."""
+    output = _run(host, prune_command(prune_volumes))
+    match = re.search(r"Total reclaimed space:\s*(\S+)", output)
+    return match.group(1) if match else "0B"
+
+
+def _parse_size(value: str) -> int:
+    """Parse Docker's human-readable sizes ("1.2GB", "850kB"), which use SI units."""
+    match = re.fullmatch(r"([\d.]+)\s*([kKMGT]?B?)", value.strip())
+    if not match:
+        return 0
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def _parse_journal_size(value: str) -> int:
+    """Parse a journalctl size ("500M"), which uses binary units."""
+    match = re.fullmatch(r"(\d+)([KMGT]?)", value.strip().upper())
+    if not match:
+        raise ValueError(f"Invalid journal size: {value}")
+    return int(match.group(1)) * 1024 ** " KMGT".index(match.group(2) or " ")
+
+
+def survey(host: Host) -> dict:
+    """Disk usage, every container log, every image and the journal size in one round trip."""
+    sections: dict[str, list] = {"df": []}
+    current = "df"
+    for line in _run(host, SURVEY_SCRIPT, sudo=True).splitlines():
+        if line.startswith("#"):
+            current = line[1:]
+            sections[current] = []
+        elif line.strip():
+            sections[current].append(line)
+
+    total, free = (int(v) for v in sections["df"][0].split())
+    used = {image.split(":", 1)[-1] for image in sections.get("used", [])}
+    # `docker image ls` lists an image once per tag; its size only counts once
+    images: dict[str, dict] = {}
+    for line in sections.get("images", []):
+        image = json.loads(line)
+        image_id = image.get("ID", "").split(":", 1)[-1]
+        name = f"{image.get('Repository', '<none>')}:{image.get('Tag', '<none>')}"
+        if image_id in images:
+            images[image_id]["names"].append(name)
+            continue
+        images[image_id] = {
+            "id": image_id,
+            "names": [name],
+            "size": _parse_size(image.get("Size", "0B")),
+            "in_use": any(full_id.startswith(image_id) for full_id in used),
+        }
+    for image in images.values():
+        image["name"] = ", ".join(sorted(image.pop("names")))
+    journal = sections.get("journal", [])
+    return {
+        "total": total,
+        "free": free,
+        "logs": _parse_logs(sections.get("logs", [])),
+        "images": list(images.values()),
+        "journal": int(journal[0]) if journal and journal[0].isdigit() else 0,
+    }
+
+
+def plan_reclaim(
+    usage: dict,
+    target_free_percent: float,
+    journal_max_bytes: Optional[int],
+    truncate_logs: bool = True,
+) -> dict:
+    """Pick the largest candidates until the target free space is reached.
+
+    Candidates are container logs (truncated), images not used by any
+    container (removed) and journal space above ``journal_max_bytes``
+    (vacuumed). Image sizes include layers shared with other images, so
+    their reclaim is an upper bound.
+    """
+    candidates = [] if not truncate_logs else [
+        {"kind": "log", "target": log["path"], "id": log["id"], "label": log["id"][:12], "bytes": log["size"]}
+        for log in usage["logs"]
+        if log["size"] > 0
+    ]
+    candidates += [
+        {"kind": "image", "target": image["id"], "label": image["name"], "bytes": image["size"]}
+        for image in usage["images"]
+        if not image["in_use"]
+    ]
+    if journal_max_bytes is not None and usage["journal"] > journal_max_bytes:
+        candidates.append({
+            "kind": "journal",
+            "target": "/var/log/journal",
+            "label": "systemd journal",
+            "bytes": usage["journal"] - journal_max_bytes,
+        })
+    candidates.sort(key=lambda c: c["bytes"], reverse=True)
+
+    target_free = int(usage["total"] * target_free_percent / 100)
+    needed = max(0, target_free - usage["free"])
+    selected, planned = [], 0
+    for candidate in candidates:
+        if planned >= needed:
+            break
+        selected.append(candidate)
+        planned += candidate["bytes"]
+
+    return {
+        "target_free_percent": target_free_percent,
+        "target_free": target_free,
+        "needed": needed,
+        "candidates": len(candidates),
+        "candidate_bytes": sum(c["bytes"] for c in candidates),
+        "selected": selected,
+        "planned_bytes": planned,
+    }
+
+
+def apply_plan(host: Host, plan: dict, journal_max_size: str) -> list:
+    """Carry out a reclaim plan, one batched command per kind. Returns errors."""
+    errors = []
+    logs = [c for c in plan["selected"] if c["kind"] == "log"]
+    images = [c["target"] for c in plan["selected"] if c["kind"] == "image"]
+    steps = []
+    if logs:
+        steps.append(("Truncate container logs", lambda: truncate_logs(host, [{"path": c["target"]} for c in logs])))
+    if images:
+        # No container uses any tag of these images (usage is by ID), so -f only
+        # drops their other tags instead of refusing an image with several
+        steps.append(("Remove images", lambda: _run(host, f"docker image rm -f {' '.join(images)}")))
+    if any(c["kind"] == "journal" for c in plan["selected"]):
+        steps.append(("Vacuum journal", lambda: vacuum_journal(host, journal_max_size)))
+    for label, func in steps:
+        try:
+            func()
+        except (CommandError, OSError) as e:
+            errors.append(f"{label}: {e}")
+    return errors
+
+
+def _plan_host(host: Host, args: argparse.Namespace, result: dict) -> dict:
+    try:
+        usage = survey(host)
+    except (CommandError, OSError, ValueError, IndexError) as e:
+        result.update(ok=False, errors=[f"Could not survey host: {e}"])
+        return result
+
+    result["disk_before"] = {"total": usage["total"], "free": usage["free"], "docker": []}
+    journal_max = _parse_journal_size(args.journal_max_size) if args.vacuum_journal else None
+    plan = plan_reclaim(usage, args.target_free_percent, journal_max, args.truncate_logs)
+    # Names only for the logs we report on, in one batched lookup
+    add_container_names(host, [c for c in plan["selected"] if c["kind"] == "log"])
+    for candidate in plan["selected"]:
+        if candidate["kind"] == "log":
+            candidate["label"] = candidate.pop("container")
+    result["plan"] = plan
+
+    if not args.dry_run and plan["selected"]:
+        result["errors"] += apply_plan(host, plan, args.journal_max_size)
+        try:
+            result["disk_after"] = disk_usage(host)
+        except (CommandError, OSError) as e:
+            result["errors"].append(f"Disk usage: {e}")
+    return result
+
+
+def cleanup_host(name: str, args: argparse.Namespace) -> dict:
+    """Clean one host and return its structured result."""
+    started = time.monotonic()
+    result = _cleanup_host(name, args)
+    result["seconds"] = round(time.monotonic() - started, 2)
+    return result
+
+
+def _cleanup_host(name: str, args: argparse.Namespace) -> dict:
+    result = {
+        "host": name,
+        "ok": True,
+        "dry_run": args.dry_run,
+        "errors": [],
+        "disk_before": None,
+        "disk_after": None,
+        "logs": [],
+        "journal_before": None,
+        "journal_after": None,
+        "prune_command": prune_command(args.prune_volumes),
+        "prune_reclaimed": None,
+    }
+
+    if name not in KNOWN_HOSTS:
+        result.update(ok=False, errors=[f"Unknown server: {name}"])
+        return result
+
+    with Host(name) as host:
+        if args.target_free_percent is not None:
+            return _plan_host(host, args, result)
+
+        try:
+            result["disk_before"] = disk_usage(host)
+        except (CommandError, OSError) as e:
+            result.update(ok=False, errors=[f"Could not connect: {e}"])
+            return result
+
+        def step(label: str, func, *func_args):
+            try:
+                return func(*func_args)
+            except (CommandError, OSError) as e:
+                result["errors"].append(f"{label}: {e}")
+                return None
+
+        if args.truncate_logs:
+            result["logs"] = step("List container logs", large_logs, host, args.log_max_size_mb * 1024 * 1024) or []
+            if result["logs"] and not args.dry_run:
+                step("Truncate container logs", truncate_logs, host, result["logs"])
+
+        if args.vacuum_journal:
+            result["journal_before"] = step("Journal size", journal_size, host)
+            if not args.dry_run:
+                step("Vacuum journal", vacuum_journal, host, args.journal_max_size)
+                result["journal_after"] = step("Journal size", journal_size, host)
+
+        if not args.dry_run:
+            result["prune_reclaimed"] = step("Docker prune", prune, host, args.prune_volumes)
+            result["disk_after"] = step("Disk usage", disk_usage, host)
+
+    return result
+
+
+def print_plan_report(result: dict, args: argparse.Namespace) -> None:
+    before, plan = result["disk_before"], result["plan"]
+    free_percent = 100 * before["free"] / before["total"] if before["total"] else 0
+    print(f"Free disk: {_size(before['free'])} of {_size(before['total'])} ({free_percent:.1f}%), target {plan['target_free_percent']:g}%")
+    print(f"Candidates: {plan['candidates']} ({_size(plan['candidate_bytes'])} reclaimable)")
+
+    if not plan["needed"]:
+        print("[OK] Already above target, nothing to reclaim")
+    else:
+        verb = "Would reclaim" if args.dry_run else "Reclaiming"
+        print(f"{verb} {_size(plan['planned_bytes'])} of {_size(plan['needed'])} needed, largest first:")
+        for candidate in plan["selected"]:
+            print(f"  {candidate['kind']:<8} {_size(candidate['bytes']):>10}  {candidate['label']}")
+        if plan["planned_bytes"] < plan["needed"]:
+            print("[WARNING] Not enough reclaimable space to reach the target")
+
+    after = result["disk_after"]
+    if after:
+        print(f"Free disk after: {_size(after['free'])} (+{_size(after['free'] - before['free'])})")
+    for error in result["errors"]:
+        print(f"  [WARNING] {error}")
+    print(f"Done in {result['seconds']}s")
+    print("")
+
+
+def print_report(result: dict, args: argparse.Namespace) -> None:
+    print(f"=== Cleaning up: {result['host']} ===")
+    before = result["disk_before"]
+    if not result["ok"]:
+        print(f"[ERROR] {result['errors'][0]}")
+        print("")
+        return
+    if "plan" in result:
+        print_plan_report(result, args)
+        return
+
+    print(f"Free disk: {_size(before['free'])} of {_size(before['total'])}")
+    for row in before["docker"]:
+        print(f"  {row.get('Type', ''):<15} {row.get('Size', ''):>10}  reclaimable {row.get('Reclaimable', '')}")
+
+    if args.truncate_logs:
+        verb = "Would truncate" if args.dry_run else "Truncated"
+        if result["logs"]:
+            print(f"{verb} container logs larger than {args.log_max_size_mb}MB:")
+            for log in result["logs"]:
+                print(f"  {log['container']} ({log['id'][:12]}): {_size(log['size'])}")
+            print(f"  Total: {_size(sum(log['size'] for log in result['logs']))}")
+        else:
+            print(f"No container logs larger than {args.log_max_size_mb}MB")
+
+    if args.vacuum_journal and result["journal_before"] is not None:
+        if args.dry_run:
+            print(f"Journal size: {_size(result['journal_before'])} (would vacuum to {args.journal_max_size})")
+        elif result["journal_after"] is not None:
+            print(f"Journal: {_size(result['journal_before'])} -> {_size(result['journal_after'])}")
+
+    if args.dry_run:
+        print(f"[DRY RUN] Would run: {result['prune_command']}")
+    else:
+        print(f"Docker prune reclaimed: {result['prune_reclaimed'] or 'n/a'}")
+        after = result["disk_after"]
+        if after:
+            print(f"Free disk after: {_size(after['free'])} (+{_size(after['free'] - before['free'])})")
+
+    for error in result["errors"]:
+        print(f"  [WARNING] {error}")
+    print(f"Done in {result['seconds']}s")
+    print("")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Docker Cleanup")
+    parser.add_argument(
+        "--server",
+        default=DEFAULT_SERVERS,
+        help=f"Servers to clean up, comma-separated (default: {DEFAULT_SERVERS})",
+    )
+    parser.add_argument(
+        "--prune-volumes",
+        action="store_true",
+        help="Also remove unused volumes and images (WARNING: may delete data)",
+    )
+    parser.add_argument(
+        "--no-truncate-logs",
+        dest="truncate_logs",
+        action="store_false",
+        help="Don't truncate oversized container logs",
+    )
+    parser.add_argument(
+        "--log-max-size-mb",
+        type=int,
+        default=100,
+        help="Truncate container logs larger than this (default: 100)",
+    )
+    parser.add_argument(
+        "--no-vacuum-journal",
+        dest="vacuum_journal",
+        action="store_false",
+        help="Don't vacuum the systemd journal",
+    )
+    parser.add_argument(
+        "--journal-max-size",
+        default="500M",
+        help="Journal size to vacuum down to (default: 500M)",
+    )
+    parser.add_argument(
+        "--target-free-percent",
+        type=float,
+        help=(
+            "Instead of the fixed cleanup, reclaim only what is needed to reach this much "
+            "free disk space: largest container logs, unused images and journal first"
+        ),
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the per-host results as JSON",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show what would be done without making changes",
+    )
+    return parser
+
+
+def main(argv: Optional[list] = None) -> None:
+    args = build_parser().parse_args(argv)
+    servers = [s.strip() for s in args.server.split(",") if s.strip()]
+
+    if not args.json:
+        print("=== Docker Cleanup ===")
+        print(f"Servers: {', '.join(servers)}")
+        if args.target_free_percent is not None:
+            print(f"Target free space: {args.target_free_percent:g}%")
+            print(f"Truncate logs: {str(args.truncate_logs).lower()}")
+        else:
+            print(f"Prune volumes: {str(args.prune_volumes).lower()}")
+            print(f"Truncate logs: {str(args.truncate_logs).lower()} (max: {args.log_max_size_mb}MB)")
+        print(f"Vacuum journal: {str(args.vacuum_journal).lower()} (max: {args.journal_max_size})")
+        print(f"Dry run: {str(args.dry_run).lower()}")
+        print("")
+
+    with ThreadPoolExecutor(max_workers=max(1, len(servers))) as pool:
+        results = list(pool.map(lambda name: cleanup_host(name, args), servers))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print_report(result, args)
+        print("=== Cleanup Complete ===")
+
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
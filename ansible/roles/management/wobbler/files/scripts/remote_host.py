@@ -0,0 +1,71 @@
+"""
+Command execution on the hosts wobbler manages
+
+Remote hosts are reached with the wobbler SSH setup (~/.ssh/config). Every
+command to a host goes through one multiplexed SSH connection (OpenSSH
+ControlMaster), so only the first command pays for the SSH handshake.
+management is the host wobbler itself runs on; its commands run locally.
+"""
+
+import os
+import shlex
+import subprocess
+from typing import Optional
+
+CONTROL_DIR = os.environ.get("WOBBLER_SSH_CONTROL_DIR", "/tmp/wobbler-ssh")
+LOCAL_HOSTS = {"management"}
+REMOTE_HOSTS = {"tools-prod", "authentik-prod"}
+KNOWN_HOSTS = LOCAL_HOSTS | REMOTE_HOSTS
+
+
+class Host:
+    """A managed host that runs shell commands, locally or over SSH."""
+
+    def __init__(self, name: str, timeout: int = 600):
+        self.name = name
+        self.local = name in LOCAL_HOSTS
+        self.timeout = timeout
+
+    def _ssh_options(self) -> list:
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={CONTROL_DIR}/%C",
+            "-o", "ControlPersist=120",
+            "-o", "BatchMode=yes",
+        ]
+
+    def run(
+        self,
+        command: str,
+        sudo: bool = False,
+        timeout: Optional[int] = None,
+    ) -> subprocess.CompletedProcess:
+        """Run a shell command and return the completed process (never raises on exit status)."""
+        if self.local:
+            argv = ["bash", "-c", command]
+            if sudo and os.geteuid() != 0:
+                argv = ["sudo"] + argv
+        else:
+            os.makedirs(CONTROL_DIR, mode=0o700, exist_ok=True)
+            remote = f"sudo bash -c {shlex.quote(command)}" if sudo else command
+            argv = ["ssh", *self._ssh_options(), self.name, remote]
+        return subprocess.run(
+            argv,
+            capture_output=True,
+            text=True,
+            timeout=timeout or self.timeout,
+        )
+
+    def close(self) -> None:
+        """Shut down the multiplexed SSH connection, if one was opened."""
+        if not self.local:
+            subprocess.run(
+                ["ssh", *self._ssh_options(), "-O", "exit", self.name],
+                capture_output=True,
+            )
+
+    def __enter__(self) -> "Host":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,299 @@
+"""
+Restore verification of database backups in scratch Postgres containers
+
+A backup only counts once it has been restored. The verify action downloads
+a sample of recent backups and restores each into its own disposable
+Postgres container, several at a time. Containers are started through the
+Docker CLI on the socket wobbler already has, and dumps are copied in with
+`docker cp` rather than bind-mounted, since bind mounts would resolve
+against the host's filesystem, not wobbler's.
+
+After a restore, every table is read once for its row count and an
+order-independent checksum (a sum of per-row hashes, so no sort is needed).
+A verification fails when the restore reports errors, when a table listed
+in the dump is missing afterwards, or when the same backup restored earlier
+gave different checksums. Tables that shrank a lot since the previous
+verification of the database are reported as warnings.
+
+Results, including download and restore throughput, are kept in a SQLite
+history next to the backup catalog. The history also decides what to sample
+next: the databases verified longest ago go first.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+import time
+import uuid
+from typing import Optional
+
+from backup_catalog import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+VERIFY_IMAGE = os.environ.get("VERIFY_POSTGRES_IMAGE", "postgres:16-alpine")
+CONTAINER_PREFIX = "wobbler-verify-"
+
+# One row per user table: name, row count and a checksum that doesn't depend on row order
+TABLE_STATS_SQL = """
+SELECT format(
+    'SELECT %L, count(*), coalesce(sum((''x'' || left(md5(t::text), 15))::bit(60)::bigint), 0) FROM %I.%I t',
+    n.nspname || '.' || c.relname, n.nspname, c.relname
+)
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname NOT LIKE 'pg_toast%'
+ORDER BY 1
+\\gexec
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verifications (
+    database TEXT NOT NULL,
+    backup_id TEXT NOT NULL,
+    backup_created_at INTEGER NOT NULL,
+    verified_at INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    download_seconds REAL,
+    restore_seconds REAL,
+    ok INTEGER NOT NULL,
+    error TEXT,
+    tables TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS verifications_by_database ON verifications (database, verified_at);
+"""
+
+
+class VerifyError(Exception):
+    """Raised when a scratch container cannot be started or used."""
+
+
+def _docker(args: list, timeout: int = 60, input: Optional[str] = None) -> subprocess.CompletedProcess:
+    try:
+        return subprocess.run(["docker", *args], input=input, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise VerifyError(f"docker {args[0]}: {e}")
+
+
+def _tail(text: str, lines: int = 5) -> str:
+    return " | ".join(line for line in text.strip().splitlines()[-lines:])
+
+
+def is_custom_dump(path: str) -> bool:
+    """Whether a dump is a pg_dump archive (pg_restore) rather than plain SQL (psql)."""
+    with open(path, "rb") as f:
+        return f.read(5) == b"PGDMP"
+
+
+class ScratchPostgres:
+    """A disposable Postgres container, removed again on exit."""
+
+    def __init__(self, image: str = VERIFY_IMAGE, memory: Optional[str] = None, ready_timeout: int = 120):
+        self.image = image
+        self.memory = memory
+        self.ready_timeout = ready_timeout
+        self.name = f"{CONTAINER_PREFIX}{uuid.uuid4().hex[:12]}"
+
+    def __enter__(self) -> "ScratchPostgres":
+        args = [
+            "run", "-d", "--rm", "--name", self.name,
+            "--label", "wobbler.verify=true",
+            "-e", "POSTGRES_HOST_AUTH_METHOD=trust",
+        ]
+        if self.memory:
+            args += ["--memory", self.memory]
+        result = _docker(args + [self.image], timeout=300)
+        if result.returncode != 0:
+            raise VerifyError(f"Could not start {self.image}: {_tail(result.stderr)}")
+        try:
+            self._wait_ready()
+        except VerifyError:
+            self.__exit__()
+            raise
+        return self
+
+    def __exit__(self, *exc) -> None:
+        # -v: also drop the anonymous volume holding the restored data
+        _docker(["rm", "-f", "-v", self.name], timeout=120)
+
+    def _wait_ready(self) -> None:
+        # Over TCP: the temporary server of the image's init phase only listens on the socket
+        deadline = time.monotonic() + self.ready_timeout
+        while time.monotonic() < deadline:
+            if self.exec(["pg_isready", "-q", "-h", "127.0.0.1", "-U", "postgres"], timeout=10).returncode == 0:
+                return
+            time.sleep(1)
+        raise VerifyError(f"Postgres in {self.name} not ready after {self.ready_timeout}s")
+
+    def exec(self, argv: list, timeout: int = 60, input: Optional[str] = None) -> subprocess.CompletedProcess:
+        return _docker(["exec", "-i", self.name, *argv] if input else ["exec", self.name, *argv], timeout=timeout, input=input)
+
+    def psql(self, database: str, script: str, timeout: int = 3600) -> subprocess.CompletedProcess:
+        """Run a psql script (from stdin, so it may use backslash commands)."""
+        return self.exec(
+            ["psql", "-U", "postgres", "-d", database, "-X", "-q", "-At", "-F", "|", "-v", "ON_ERROR_STOP=1", "-f", "-"],
+            timeout=timeout,
+            input=script,
+        )
+
+    def restore(self, dump_path: str, database: str, jobs: int = 4, timeout: int = 4 * 3600) -> tuple:
+        """Restore a dump into a new database.
+
+        Returns (seconds, tables listed in the dump or None for plain SQL).
+        """
+        target = "/tmp/restore.dump"
+        result = _docker(["cp", dump_path, f"{self.name}:{target}"], timeout=timeout)
+        if result.returncode != 0:
+            raise VerifyError(f"Could not copy the dump into {self.name}: {_tail(result.stderr)}")
+        result = self.exec(["createdb", "-U", "postgres", database])
+        if result.returncode != 0:
+            raise VerifyError(f"Could not create database {database}: {_tail(result.stderr)}")
+
+        custom = is_custom_dump(dump_path)
+        expected = None
+        if custom:
+            listing = self.exec(["pg_restore", "-l", target], timeout=300)
+            if listing.returncode != 0:
+                raise VerifyError(f"Unreadable dump: {_tail(listing.stderr)}")
+            expected = set()
+            for line in listing.stdout.splitlines():
+                # 3345; 0 16390 TABLE DATA public users owner
+                if not line.startswith(";") and " TABLE DATA " in line:
+                    schema, table = line.split(" TABLE DATA ", 1)[1].split()[:2]
+                    expected.add(f"{schema}.{table}")
+            argv = [
+                "pg_restore", "-U", "postgres", "-d", database,
+                "--no-owner", "--no-privileges", "-j", str(jobs), target,
+            ]
+        else:
+            argv = ["psql", "-U", "postgres", "-d", database, "-X", "-q", "-v", "ON_ERROR_STOP=1", "-f", target]
+
+        started = time.monotonic()
+        result = self.exec(argv, timeout=timeout)
+        seconds = time.monotonic() - started
+        if result.returncode != 0:
+            raise VerifyError(f"Restore failed: {_tail(result.stderr)}")
+        return seconds, expected
+
+    def table_stats(self, database: str) -> dict:
+        """{schema.table: [rows, checksum]} of every user table."""
+        result = self.psql(database, TABLE_STATS_SQL)
+        if result.returncode != 0:
+            raise VerifyError(f"Table checks failed: {_tail(result.stderr)}")
+        tables = {}
+        for line in result.stdout.splitlines():
+            try:
+                name, rows, checksum = line.rsplit("|", 2)
+                tables[name] = [int(rows), checksum]
+            except ValueError:
+                raise VerifyError(f"Unexpected table check output: {line[:200]!r}")
+        return tables
+
+
+def check_tables(tables: dict, expected: Optional[set], same_backup: Optional[dict], previous: Optional[dict], max_shrink: float) -> tuple:
+    """(errors, warnings) from comparing restored tables with the dump and earlier runs."""
+    errors, warnings = [], []
+    if expected is not None:
+        missing = sorted(expected - set(tables))
+        if missing:
+            errors.append(f"tables missing after restore: {', '.join(missing)}")
+    if same_backup:
+        changed = sorted(t for t, stats in same_backup.items() if tables.get(t, stats) != stats)
+        if changed:
+            errors.append(f"checksums differ from an earlier restore of this backup: {', '.join(changed)}")
+    if previous:
+        for table, (rows, _) in sorted(previous.items()):
+            now = tables.get(table, [0])[0]
+            if rows and now < rows * (1 - max_shrink):
+                warnings.append(f"{table}: {rows} -> {now} rows since the previous verification")
+    return errors, warnings
+
+
+def failure(error: str) -> dict:
+    """Result of a verification that didn't get to check any tables."""
+    return {"ok": False, "error": error, "warnings": [], "tables": {}, "restore_seconds": None}
+
+
+def verify_dump(
+    dump_path: str,
+    database: str,
+    jobs: int = 4,
+    same_backup: Optional[dict] = None,
+    previous: Optional[dict] = None,
+    max_shrink: float = 0.5,
+    memory: Optional[str] = None,
+) -> dict:
+    """Restore one dump into a scratch container and check its tables."""
+    result = failure("")
+    try:
+        with ScratchPostgres(memory=memory) as postgres:
+            result["restore_seconds"], expected = postgres.restore(dump_path, database, jobs=jobs)
+            result["tables"] = postgres.table_stats(database)
+    except VerifyError as e:
+        result["error"] = str(e)
+        return result
+    errors, result["warnings"] = check_tables(result["tables"], expected, same_backup, previous, max_shrink)
+    result["ok"] = not errors
+    result["error"] = "; ".join(errors) or None
+    return result
+
+
+class VerificationHistory:
+    """Every verification run, for sampling and restore-time reporting."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(STATE_DIR, "restore-verifications.sqlite3")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def record(self, database: str, backup, result: dict, download_seconds: Optional[float]) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT INTO verifications VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    database, backup.id, backup.created_at, int(time.time()), backup.size,
+                    download_seconds, result["restore_seconds"], int(result["ok"]), result["error"],
+                    json.dumps(result["tables"]),
+                ),
+            )
+
+    def last_verified(self) -> dict:
+        """{database: epoch of its latest verification}"""
+        rows = self._db.execute("SELECT database, max(verified_at) FROM verifications GROUP BY database")
+        return {database: verified_at for database, verified_at in rows}
+
+    def tables(self, database: str, backup_id: Optional[str] = None) -> Optional[dict]:
+        """Tables of the latest successful verification of a database (or of one backup)."""
+        query = "SELECT tables FROM verifications WHERE database = ? AND ok = 1"
+        params: tuple = (database,)
+        if backup_id:
+            query += " AND backup_id = ?"
+            params += (backup_id,)
+        row = self._db.execute(query + " ORDER BY verified_at DESC LIMIT 1", params).fetchone()
+        return json.loads(row["tables"]) if row else None
+
+    def restore_rates(self, database: str, limit: int = 10) -> list:
+        """Bytes per second of the latest successful restores of a database."""
+        rows = self._db.execute(
+            "SELECT size, restore_seconds FROM verifications "
+            "WHERE database = ? AND ok = 1 AND restore_seconds > 0 ORDER BY verified_at DESC LIMIT ?",
+            (database, limit),
+        )
+        return [size / seconds for size, seconds in rows]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def sample(backups: list, last_verified: dict, count: int, max_age: float, now: Optional[float] = None) -> list:
+    """Up to ``count`` recent backups, of the databases verified longest ago first.
+
+    ``backups`` are ("<instance>/<database>", latest backup) pairs.
+    """
+    now = now or time.time()
+    recent = [(key, backup) for key, backup in backups if now - backup.created_at <= max_age]
+    recent.sort(key=lambda item: (last_verified.get(item[0], 0), item[1].created_at))
+    return recent[:count]
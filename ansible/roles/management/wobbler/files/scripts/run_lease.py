@@ -0,0 +1,293 @@
+"""
+Run coordination for the wobbler scripts
+
+Wobbler schedules each script on its own, so a run that overruns its slot
+can overlap the next scheduled or a manual one. Runs that change things
+therefore hold a lease on every instance or server they work on: one JSON
+file per target in the state directory, naming the run's process, action
+and start time. A background thread refreshes the lease's heartbeat while
+the run is alive.
+
+A lease is stale, and is taken over, once its heartbeat is older than
+WOBBLER_LEASE_STALE_AFTER seconds, or right away when its process is gone
+(for runs on the same host). This covers runs killed without cleaning up,
+such as by a container restart.
+
+A run that finds targets leased by another run resolves the overlap by
+its policy:
+
+    wait   Poll until all its targets are free, then run.
+    merge  Leave targets already being handled by a run of the same action
+           to that run, go ahead with the rest, then wait for that run and
+           report its exit code with its own. Other overlaps are waited for.
+    fail   Exit right away with BUSY_EXIT.
+
+Leases of one run are taken all at once or not at all, so two runs waiting
+for each other's targets can't deadlock. Every read and write of lease
+files happens under a short flock on a guard file in the lease directory.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from backup_catalog import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+LEASE_DIR = os.path.join(STATE_DIR, "leases")
+HEARTBEAT_INTERVAL = float(os.environ.get("WOBBLER_LEASE_HEARTBEAT", "15"))
+STALE_AFTER = float(os.environ.get("WOBBLER_LEASE_STALE_AFTER", "120"))
+POLL_INTERVAL = 5
+POLICIES = ("wait", "merge", "fail")
+DEFAULT_POLICY = os.environ.get("WOBBLER_ON_OVERLAP", "wait")
+# EX_TEMPFAIL: the targets were busy, try again later
+BUSY_EXIT = 75
+
+
+class LeaseBusy(Exception):
+    """Raised when targets stay leased by other runs."""
+
+
+def _path(scope: str, suffix: str = "json") -> str:
+    return os.path.join(LEASE_DIR, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', scope)}.{suffix}")
+
+
+def _read(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        # Only a crash halfway through a write leaves this; nobody can own it
+        return {}
+
+
+def _write(path: str, data: dict) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=LEASE_DIR, prefix=".lease.")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_stale(lease: dict, now: Optional[float] = None) -> bool:
+    """Whether a lease's run is gone (or hung) and the lease may be taken over."""
+    now = now or time.time()
+    if not lease.get("owner") or now - lease.get("heartbeat_at", 0) > STALE_AFTER:
+        return True
+    return lease.get("host") == socket.gethostname() and not _alive(lease.get("pid", 0))
+
+
+def describe(lease: dict) -> str:
+    started = time.strftime("%H:%M:%S", time.localtime(lease.get("started_at", 0)))
+    return f"{lease.get('action')} run {lease.get('owner', '?')[:8]} (pid {lease.get('pid')}, started {started})"
+
+
+@contextmanager
+def _guard():
+    os.makedirs(LEASE_DIR, exist_ok=True)
+    with open(os.path.join(LEASE_DIR, ".guard"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Lease:
+    """The leases of one run, on targets of one kind (e.g. "database")."""
+
+    def __init__(self, kind: str, action: str):
+        self.kind = kind
+        self.action = action
+        self.owner = uuid.uuid4().hex
+        self.held: list = []
+        # target: lease of the run of the same action it was merged into
+        self.merged: dict = {}
+        self.lost: set = set()
+        self.started_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def scope(self, target: str) -> str:
+        return f"{self.kind}-{target}"
+
+    def _record(self, now: float) -> dict:
+        return {
+            "owner": self.owner,
+            "action": self.action,
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "argv": sys.argv[1:],
+            "started_at": self.started_at,
+            "heartbeat_at": now,
+        }
+
+    def try_acquire(self, targets: list, merge: bool = False) -> dict:
+        """Lease all free targets or none; returns {target: holder} of the busy ones.
+
+        With ``merge``, targets held by a run of the same action don't count
+        as busy: they are remembered in ``merged`` and the others are leased.
+        """
+        with _guard():
+            now = time.time()
+            holders = {}
+            for target in targets:
+                lease = _read(_path(self.scope(target)))
+                if lease is not None and not is_stale(lease, now):
+                    holders[target] = lease
+            busy = {t: h for t, h in holders.items() if not (merge and h.get("action") == self.action)}
+            if busy:
+                return busy
+
+            self.started_at = now
+            for target in targets:
+                if target in holders:
+                    self.merged[target] = holders[target]
+                    continue
+                lease = _read(_path(self.scope(target)))
+                if lease:
+                    logger.warning(f"Taking over stale lease on {target} from {describe(lease)}")
+                _write(_path(self.scope(target)), self._record(now))
+                self.held.append(target)
+        if self.held:
+            self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self._thread.start()
+        return {}
+
+    def acquire(self, targets: list, policy: str, timeout: float) -> None:
+        """Lease ``targets`` according to an overlap policy (see the module docstring).
+
+        Raises LeaseBusy when they are still busy after ``timeout`` seconds,
+        or right away with the fail policy.
+        """
+        deadline = time.monotonic() + timeout
+        reported = set()
+        while True:
+            busy = self.try_acquire(targets, merge=policy == "merge")
+            if not busy:
+                return
+            summary = "; ".join(f"{t} by {describe(h)}" for t, h in sorted(busy.items()))
+            if policy == "fail" or time.monotonic() >= deadline:
+                raise LeaseBusy(f"Busy: {summary}")
+            new = {h.get("owner") for h in busy.values()} - reported
+            if new:
+                logger.info(f"Waiting for {summary}")
+                reported |= new
+            time.sleep(POLL_INTERVAL)
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            with _guard():
+                now = time.time()
+                for target in self.held:
+                    path = _path(self.scope(target))
+                    lease = _read(path)
+                    if lease and lease.get("owner") == self.owner:
+                        lease["heartbeat_at"] = now
+                        _write(path, lease)
+                    elif target not in self.lost:
+                        self.lost.add(target)
+                        holder = describe(lease) if lease else "nobody"
+                        logger.error(f"Lost the lease on {target}, now held by {holder}")
+
+    def release(self, code: int) -> None:
+        """Drop the leases, leaving the exit code for runs merged into this one."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        with _guard():
+            now = time.time()
+            for target in self.held:
+                path = _path(self.scope(target))
+                lease = _read(path)
+                if lease and lease.get("owner") == self.owner:
+                    _write(_path(self.scope(target), "last.json"), {**lease, "exit": code, "finished_at": now})
+                    os.unlink(path)
+        self.held = []
+
+    def wait_merged(self, timeout: float) -> int:
+        """Wait for the runs this one merged into; returns the worst exit code."""
+        deadline = time.monotonic() + timeout
+        codes = {}
+        pending = dict(self.merged)
+        while pending:
+            with _guard():
+                for target, holder in list(pending.items()):
+                    lease = _read(_path(self.scope(target)))
+                    if lease and lease.get("owner") == holder["owner"] and not is_stale(lease):
+                        continue
+                    last = _read(_path(self.scope(target), "last.json")) or {}
+                    if last.get("owner") == holder["owner"]:
+                        codes[target] = last["exit"]
+                    else:
+                        logger.error(f"{describe(holder)} ended without a result for {target}")
+                        codes[target] = 1
+                    del pending[target]
+            if pending and time.monotonic() >= deadline:
+                logger.error(f"Gave up waiting for {', '.join(sorted(pending))} after {timeout:.0f}s")
+                codes.update((target, BUSY_EXIT) for target in pending)
+                break
+            if pending:
+                time.sleep(POLL_INTERVAL)
+
+        for target, code in sorted(codes.items()):
+            status = "OK" if code == 0 else f"FAILED (exit {code})"
+            print(f"[MERGED] {target}: handled by {describe(self.merged[target])}: {status}")
+        return max(codes.values(), default=0)
+
+
+def _exit_code(e: SystemExit) -> int:
+    return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+
+
+def coordinated(kind: str, targets: list, action: str, policy: str, timeout: float, run: Callable[[list], None]) -> None:
+    """Call ``run`` with the targets this run leased, under the overlap policy.
+
+    Exits with BUSY_EXIT when the targets stay busy, and with the worst exit
+    code of this run and the runs it merged into.
+    """
+    lease = Lease(kind, action)
+    try:
+        lease.acquire(targets, policy, timeout)
+    except LeaseBusy as e:
+        print(f"[BUSY] {e}")
+        sys.exit(BUSY_EXIT)
+
+    code = 0
+    try:
+        if lease.held:
+            run(lease.held)
+    except SystemExit as e:
+        code = _exit_code(e)
+    except BaseException:
+        code = 1
+        raise
+    finally:
+        lease.release(code)
+
+    if lease.merged:
+        code = max(code, lease.wait_merged(timeout))
+    if code:
+        sys.exit(code)
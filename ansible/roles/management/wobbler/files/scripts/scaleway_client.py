@@ -0,0 +1,272 @@
+"""
+Shared Scaleway API client for the wobbler scripts
+
+`requests` is only imported when the first API call is made, so code paths
+that never reach the API (argument errors, --help, forwarding to a running
+daemon) don't pay for it. Calls go through one `requests.Session`, which keeps
+connections to the API open between calls.
+
+Two guards keep a slow or failing API from stalling a run:
+
+- GETs are idempotent, so one that takes longer than the SCW_HEDGE_PERCENTILE
+  (default 95th) percentile of recent calls to the same endpoint gets a
+  duplicate; whichever answers first wins. At most a tenth of the requests
+  are hedged, so a brownout doesn't double the load on the API.
+- Each endpoint (method and path, ids and query left out) has a circuit
+  breaker. After SCW_BREAKER_THRESHOLD consecutive failures (transport
+  errors, 5xx, 429) it fails calls immediately with CircuitOpenError, then
+  lets one probe through every SCW_BREAKER_COOLDOWN seconds until one
+  succeeds.
+"""
+
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScalewayAPIError(Exception):
+    """Raised when the Scaleway API answers with an HTTP error status."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code} - {message}")
+        self.status_code = status_code
+
+
+class CircuitOpenError(ScalewayAPIError):
+    """Raised without calling the API while an endpoint's circuit breaker is open."""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(503, f"circuit open for {endpoint}, next probe in {retry_in:.0f}s")
+
+
+ID_PATTERN = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def endpoint_key(method: str, endpoint: str) -> str:
+    """Method and path of a call, with resource ids and the query left out."""
+    return f"{method} {ID_PATTERN.sub('{id}', endpoint.split('?', 1)[0])}"
+
+
+class LatencyTracker:
+    """Recent GET latencies per endpoint, and how many requests were hedged."""
+
+    def __init__(self, percentile: float, window: int = 100, min_samples: int = 20, max_hedge_ratio: float = 0.1):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self._samples: dict[str, deque] = {}
+        self._all: deque = deque(maxlen=window)
+        self._hedged: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+            self._all.append(seconds)
+
+    def threshold(self, key: str) -> Optional[float]:
+        """Latency after which a GET is hedged, or None to not hedge it.
+
+        Endpoints without enough history of their own use the latencies of
+        all endpoints.
+        """
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples or len(samples) < self.min_samples:
+                samples = self._all
+            if len(samples) < self.min_samples:
+                return None
+            if sum(self._hedged) >= self.max_hedge_ratio * self.window:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def requested(self, hedged: bool) -> None:
+        with self._lock:
+            self._hedged.append(hedged)
+
+
+class CircuitBreaker:
+    """Fails calls to an endpoint fast after repeated failures."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        # endpoint -> (consecutive failures, opened at or None, probe in flight)
+        self._state: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def before(self, key: str) -> None:
+        """Raise CircuitOpenError unless a call to ``key`` may go out now."""
+        with self._lock:
+            failures, opened_at, probing = self._state.get(key, (0, None, False))
+            if opened_at is None:
+                return
+            retry_in = opened_at + self.cooldown - time.monotonic()
+            if retry_in > 0 or probing:
+                raise CircuitOpenError(key, max(retry_in, 0))
+            # Half-open: this call is the probe, everything else keeps failing fast
+            self._state[key] = (failures, opened_at, True)
+        logger.info(f"Probing {key} after {self.cooldown:.0f}s cool-down")
+
+    def success(self, key: str) -> None:
+        with self._lock:
+            failures, opened_at, probing = self._state.pop(key, (0, None, False))
+        if opened_at is not None:
+            logger.info(f"Circuit for {key} closed again")
+
+    def failure(self, key: str) -> None:
+        with self._lock:
+            failures, opened_at, probing = self._state.get(key, (0, None, False))
+            failures += 1
+            if probing or (opened_at is None and failures >= self.threshold):
+                self._state[key] = (failures, time.monotonic(), False)
+                opened = True
+            else:
+                self._state[key] = (failures, opened_at, probing)
+                opened = False
+        if opened:
+            logger.warning(f"Circuit for {key} opened after {failures} failures, failing fast for {self.cooldown:.0f}s")
+
+
+class ScalewayClient:
+    """Minimal Scaleway API client shared by the backup and snapshot managers."""
+
+    API_BASE = os.environ.get("SCW_API_URL", "https://api.scaleway.com")
+    REQUEST_TIMEOUT = 60
+    # 0 disables hedging
+    HEDGE_PERCENTILE = float(os.environ.get("SCW_HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_DELAY = 0.05
+    BREAKER_THRESHOLD = int(os.environ.get("SCW_BREAKER_THRESHOLD", "5"))
+    BREAKER_COOLDOWN = float(os.environ.get("SCW_BREAKER_COOLDOWN", "30"))
+
+    def __init__(self, secret_key: str, get_cache_ttl: float = 0):
+        self.headers = {
+            "X-Auth-Token": secret_key,
+            "Content-Type": "application/json",
+        }
+        self._session = None
+        # Hedged GETs run on threads that may all reach for the session first
+        self._session_lock = threading.Lock()
+        # GET responses are only cached by long-lived processes (see wobbler_daemon)
+        self.get_cache_ttl = get_cache_ttl
+        self._get_cache: dict[str, tuple[float, dict]] = {}
+        self.latency = LatencyTracker(self.HEDGE_PERCENTILE)
+        self.breaker = CircuitBreaker(self.BREAKER_THRESHOLD, self.BREAKER_COOLDOWN)
+
+    @property
+    def session(self):
+        """HTTP session, created on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+
+                    session = requests.Session()
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    def _request(
+        self, method: str, endpoint: str, data: Optional[dict] = None
+    ) -> dict:
+        """Make an API request to Scaleway."""
+        if method == "GET" and self.get_cache_ttl > 0:
+            cached = self._get_cache.get(endpoint)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+        elif method != "GET":
+            # Any write may change what later GETs return
+            self._get_cache.clear()
+
+        key = endpoint_key(method, endpoint)
+        self.breaker.before(key)
+        url = f"{self.API_BASE}{endpoint}"
+        try:
+            if method == "GET":
+                response = self._get(key, url)
+            else:
+                response = self.session.request(
+                    method, url, json=data, timeout=self.REQUEST_TIMEOUT
+                )
+        except Exception:
+            self.breaker.failure(key)
+            raise
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.failure(key)
+        else:
+            self.breaker.success(key)
+
+        if response.status_code >= 400:
+            logger.error(f"API error: {response.status_code} - {response.text}")
+            raise ScalewayAPIError(response.status_code, response.text)
+
+        result = response.json() if response.text else {}
+        if method == "GET" and self.get_cache_ttl > 0:
+            self._get_cache[endpoint] = (time.monotonic() + self.get_cache_ttl, result)
+        return result
+
+    def _get(self, key: str, url: str):
+        """GET ``url``, hedged with a duplicate once it is slower than usual.
+
+        Attempts run on daemon threads: the slower one is left to finish in
+        the background and never holds up the process exiting.
+        """
+        delay = self.latency.threshold(key) if self.HEDGE_PERCENTILE > 0 else None
+        answers: queue.Queue = queue.Queue()
+
+        def attempt() -> None:
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, timeout=self.REQUEST_TIMEOUT)
+            except Exception as e:
+                answers.put((None, e))
+                return
+            if response.status_code < 500:
+                self.latency.record(key, time.monotonic() - started)
+            answers.put((response, None))
+
+        first, hedged = None, False
+        if delay is None:
+            attempt()
+        else:
+            threading.Thread(target=attempt, daemon=True).start()
+            try:
+                first = answers.get(timeout=max(delay, self.HEDGE_MIN_DELAY))
+            except queue.Empty:
+                logger.debug(f"Hedging {key} after {delay * 1000:.0f} ms")
+                threading.Thread(target=attempt, daemon=True).start()
+                hedged = True
+        self.latency.requested(hedged)
+
+        response, error = first or answers.get()
+        if hedged and (error or response.status_code >= 500):
+            # The other attempt may still succeed
+            response, error = answers.get()
+        if error:
+            raise error
+        return response
+
+    def paginate(self, endpoint: str, key: str, page_size: int = 100) -> Iterator[dict]:
+        """Yield the ``key`` items of a list endpoint page by page.
+
+        Pages are fetched lazily, so a caller that stops iterating early
+        doesn't pay for the rest of the listing.
+        """
+        separator = "&" if "?" in endpoint else "?"
+        page = 1
+        while True:
+            result = self._request("GET", f"{endpoint}{separator}page={page}&page_size={page_size}")
+            items = result.get(key, [])
+            yield from items
+            if len(items) < page_size or page * page_size >= result.get("total_count", 0):
+                return
+            page += 1
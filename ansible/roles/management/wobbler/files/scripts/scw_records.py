@@ -0,0 +1,108 @@
+"""
+Typed records for Scaleway backup and snapshot inventories
+
+List calls return one JSON object per backup or snapshot, with every field
+the API knows and timestamps as ISO strings. The scripts use a handful of
+those fields, so inventories are turned into records as they are listed:
+dataclasses with ``__slots__`` (no per-object ``__dict__``) holding only
+those fields, with timestamps parsed once into epoch seconds and repeated
+values (states, APIs, instance ids) interned. Sorting and grouping then
+compare integers and read attributes instead of calling ``dict.get`` and
+comparing strings on every comparison.
+
+Records are built from the API objects without modifying them, so
+responses cached by a daemon stay exactly as the API returned them.
+"""
+
+import re
+import sys
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import Iterable
+
+from backup_catalog import parse_time
+
+GROUP_TAG_PREFIX = "snapshot-group:"
+RUN_TIMESTAMP = re.compile(r"(\d{8}-\d{6})$")
+
+
+def _intern(value) -> str:
+    return sys.intern(value) if value else ""
+
+
+@dataclass
+class Snapshot:
+    """A volume snapshot from the Instance or Block Storage API."""
+
+    __slots__ = ("id", "name", "api", "created_at", "size", "state", "group")
+    id: str
+    name: str
+    api: str
+    created_at: int
+    size: int
+    state: str
+    # Snapshots taken in the same run share this key
+    group: str
+
+    @classmethod
+    def from_api(cls, item: dict, api: str) -> "Snapshot":
+        group = next((t for t in item.get("tags") or () if t.startswith(GROUP_TAG_PREFIX)), None)
+        if group is None:
+            # Snapshots from before groups existed: all volumes of a run share the name's timestamp
+            match = RUN_TIMESTAMP.search(item["name"])
+            group = f"untagged:{match.group(1) if match else item['id']}"
+        return cls(
+            id=item["id"],
+            name=item["name"],
+            api=_intern(api),
+            created_at=parse_time(item.get("creation_date") or item.get("created_at")),
+            size=item.get("size") or 0,
+            state=_intern(item.get("state") or item.get("status") or "unknown"),
+            group=_intern(group),
+        )
+
+
+@dataclass
+class Backup:
+    """A managed database backup."""
+
+    __slots__ = (
+        "id", "name", "instance_id", "instance_name", "database_name", "created_at", "expires_at", "status", "size",
+    )
+    id: str
+    name: str
+    instance_id: str
+    instance_name: str
+    database_name: str
+    created_at: int
+    # 0 when the backup never expires
+    expires_at: int
+    status: str
+    size: int
+
+    @classmethod
+    def from_api(cls, item: dict) -> "Backup":
+        return cls(
+            id=item["id"],
+            name=item["name"],
+            instance_id=_intern(item["instance_id"]),
+            instance_name=_intern(item.get("instance_name")),
+            database_name=_intern(item["database_name"]),
+            created_at=parse_time(item.get("created_at")),
+            expires_at=parse_time(item.get("expires_at")),
+            status=_intern(item.get("status") or "unknown"),
+            size=item.get("size") or 0,
+        )
+
+
+def newest_first(records: Iterable) -> list:
+    return sorted(records, key=attrgetter("created_at"), reverse=True)
+
+
+def group_by(records: Iterable, field: str) -> dict:
+    """Records keyed by the value of one field, in the order they came."""
+    key = attrgetter(field)
+    groups: dict = {}
+    for record in records:
+        groups.setdefault(key(record), []).append(record)
+    return groups
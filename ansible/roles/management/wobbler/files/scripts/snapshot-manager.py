@@ -7,14 +7,29 @@ Supports both Instance volumes (l_ssd) and Block Storage volumes (sbs_*).
 """
 
 import argparse
-import json
 import logging
 import os
+import re
+import select
+import shlex
+import subprocess
 import sys
-from datetime import datetime, timezone
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-import requests
+# Local helpers; heavier dependencies (requests) are imported on first API call
+from backup_catalog import BackupCatalog, format_time, parse_time
+import backup_policy
+from remote_host import LOCAL_HOSTS
+import run_lease
+from scaleway_client import ScalewayAPIError, ScalewayClient
+from scw_records import GROUP_TAG_PREFIX, Snapshot, group_by
+import storage_analytics
+import wobbler_daemon
+
+DAEMON_NAME = "snapshot-manager"
 
 logging.basicConfig(
     level=logging.INFO,
@@ -24,10 +39,103 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-class ScalewaySnapshotManager:
+class FreezeError(Exception):
+    """Raised when filesystems cannot be frozen or thawed."""
+
+
+class FilesystemFreeze:
+    """Freeze filesystems on a server over SSH for the duration of a snapshot.
+
+    Freeze and thaw run inside one remote shell that is started before
+    freezing, so thawing needs no new SSH login or sudo (both of which may
+    write to a frozen filesystem and hang). The shell thaws on its own when
+    told to, when the SSH connection drops, or after ``timeout`` seconds,
+    whichever comes first.
+    """
+
+    def __init__(self, server: str, mounts: list, timeout: int = 30):
+        self.server = server
+        self.mounts = mounts
+        self.timeout = timeout
+        self._proc: Optional[subprocess.Popen] = None
+        self._frozen_at = 0.0
+
+    def _remote_script(self) -> str:
+        mounts = " ".join(shlex.quote(m) for m in self.mounts)
+        return (
+            # Load fsfreeze (and update its atime) before anything is frozen
+            "fsfreeze --version >/dev/null 2>&1 || exit 3; "
+            "frozen=''; "
+            f"for m in {mounts}; do "
+            '  if fsfreeze -f "$m"; then frozen="$frozen $m"; '
+            '  else for f in $frozen; do fsfreeze -u "$f"; done; echo FAILED; exit 1; fi; '
+            "done; "
+            "echo FROZEN; "
+            f"read -r -t {int(self.timeout)} _; "
+            'for f in $frozen; do fsfreeze -u "$f"; done; '
+            "echo THAWED"
+        )
+
+    @staticmethod
+    def _read_line(proc: subprocess.Popen, timeout: float) -> str:
+        ready, _, _ = select.select([proc.stdout], [], [], timeout)
+        return proc.stdout.readline().strip() if ready else ""
+
+    def freeze(self) -> None:
+        if self.server in LOCAL_HOSTS:
+            raise FreezeError(f"Cannot freeze filesystems on {self.server} from inside the wobbler container")
+
+        command = f"sudo bash -c {shlex.quote(self._remote_script())}"
+        self._proc = subprocess.Popen(
+            ["ssh", self.server, command],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        logger.info(f"Freezing {', '.join(self.mounts)} on {self.server}")
+        line = self._read_line(self._proc, timeout=30)
+        if line != "FROZEN":
+            self._proc.kill()
+            self._proc = None
+            raise FreezeError(f"Could not freeze {', '.join(self.mounts)} on {self.server} ({line or 'no response'})")
+        self._frozen_at = time.monotonic()
+
+    def thaw(self) -> float:
+        """Thaw and return how long the filesystems were frozen."""
+        if self._proc is None:
+            return 0.0
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.write("thaw\n")
+            proc.stdin.flush()
+        except OSError:
+            pass  # Connection gone: the remote side thaws on EOF
+        line = self._read_line(proc, timeout=max(self.timeout, 10))
+        frozen_for = time.monotonic() - self._frozen_at
+        proc.stdin.close()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        if line != "THAWED":
+            raise FreezeError(f"No thaw confirmation from {self.server}; it will thaw within {self.timeout}s")
+        return frozen_for
+
+
+def group_snapshots(snapshots: list) -> list:
+    """Group snapshots per run (see Snapshot.group), newest group first."""
+    return sorted(
+        group_by(snapshots, "group").values(),
+        key=lambda group: max(s.created_at for s in group),
+        reverse=True,
+    )
+
+
+class ScalewaySnapshotManager(ScalewayClient):
     """Manages Scaleway instance and block storage snapshots."""
 
-    API_BASE = "https://api.scaleway.com"
+    REQUEST_TIMEOUT = 30
 
     def __init__(
         self,
@@ -36,31 +144,14 @@ class ScalewaySnapshotManager:
         project_id: str,
         region: str = "fr-par",
         zone: str = "fr-par-1",
+        get_cache_ttl: float = 0,
     ):
+        super().__init__(secret_key, get_cache_ttl=get_cache_ttl)
         self.access_key = access_key
         self.secret_key = secret_key
         self.project_id = project_id
         self.region = region
         self.zone = zone
-        self.headers = {
-            "X-Auth-Token": secret_key,
-            "Content-Type": "application/json",
-        }
-
-    def _request(
-        self, method: str, endpoint: str, data: Optional[dict] = None
-    ) -> dict:
-        """Make an API request to Scaleway."""
-        url = f"{self.API_BASE}{endpoint}"
-        response = requests.request(
-            method, url, headers=self.headers, json=data, timeout=30
-        )
-
-        if response.status_code >= 400:
-            logger.error(f"API error: {response.status_code} - {response.text}")
-            response.raise_for_status()
-
-        return response.json() if response.text else {}
 
     def get_server_by_name(self, server_name: str) -> Optional[dict]:
         """Get server details by name."""
@@ -86,7 +177,9 @@ class ScalewaySnapshotManager:
         vol_type = volume.get("volume_type", "")
         return vol_type.startswith("sbs_") or vol_type.startswith("b_")
 
-    def create_instance_snapshot(self, volume_id: str, name: str) -> dict:
+    def create_instance_snapshot(
+        self, volume_id: str, name: str, tags: Optional[list] = None
+    ) -> dict:
         """Create a snapshot using Instance API (for l_ssd volumes)."""
         endpoint = f"/instance/v1/zones/{self.zone}/snapshots"
         data = {
@@ -94,9 +187,13 @@ class ScalewaySnapshotManager:
             "volume_id": volume_id,
             "project": self.project_id,
         }
+        if tags:
+            data["tags"] = tags
         return self._request("POST", endpoint, data)
 
-    def create_block_snapshot(self, volume_id: str, name: str) -> dict:
+    def create_block_snapshot(
+        self, volume_id: str, name: str, tags: Optional[list] = None
+    ) -> dict:
         """Create a snapshot using Block Storage API (for sbs_* volumes)."""
         endpoint = f"/block/v1alpha1/zones/{self.zone}/snapshots"
         data = {
@@ -104,37 +201,29 @@ class ScalewaySnapshotManager:
             "volume_id": volume_id,
             "project_id": self.project_id,
         }
+        if tags:
+            data["tags"] = tags
         return self._request("POST", endpoint, data)
 
     def list_instance_snapshots(self, name_prefix: Optional[str] = None) -> list:
         """List Instance API snapshots."""
         endpoint = f"/instance/v1/zones/{self.zone}/snapshots?project={self.project_id}"
         result = self._request("GET", endpoint)
-        snapshots = result.get("snapshots", [])
-
-        if name_prefix:
-            snapshots = [s for s in snapshots if s["name"].startswith(name_prefix)]
-
-        # Normalize format
-        for s in snapshots:
-            s["_api"] = "instance"
-        return snapshots
+        return [
+            Snapshot.from_api(s, "instance")
+            for s in result.get("snapshots", [])
+            if not name_prefix or s["name"].startswith(name_prefix)
+        ]
 
     def list_block_snapshots(self, name_prefix: Optional[str] = None) -> list:
         """List Block Storage API snapshots."""
         endpoint = f"/block/v1alpha1/zones/{self.zone}/snapshots?project_id={self.project_id}"
         result = self._request("GET", endpoint)
-        snapshots = result.get("snapshots", [])
-
-        if name_prefix:
-            snapshots = [s for s in snapshots if s["name"].startswith(name_prefix)]
-
-        # Normalize format - block API uses created_at instead of creation_date
-        for s in snapshots:
-            s["_api"] = "block"
-            if "created_at" in s and "creation_date" not in s:
-                s["creation_date"] = s["created_at"]
-        return snapshots
+        return [
+            Snapshot.from_api(s, "block")
+            for s in result.get("snapshots", [])
+            if not name_prefix or s["name"].startswith(name_prefix)
+        ]
 
     def list_snapshots(self, name_prefix: Optional[str] = None) -> list:
         """List all snapshots from both APIs."""
@@ -142,6 +231,36 @@ class ScalewaySnapshotManager:
         block_snaps = self.list_block_snapshots(name_prefix)
         return instance_snaps + block_snaps
 
+    def get_snapshot(self, snapshot: Snapshot) -> Snapshot:
+        """Get the current state of a snapshot from its API."""
+        if snapshot.api == "block":
+            endpoint = f"/block/v1alpha1/zones/{self.zone}/snapshots/{snapshot.id}"
+        else:
+            endpoint = f"/instance/v1/zones/{self.zone}/snapshots/{snapshot.id}"
+        result = self._request("GET", endpoint)
+        return Snapshot.from_api(result.get("snapshot", result), snapshot.api)
+
+    def wait_for_snapshots(self, snapshots: list, timeout: int = 3600, poll_interval: int = 10) -> list:
+        """Wait for new snapshots to become available.
+
+        Returns an error for each snapshot that failed or timed out.
+        """
+        pending = list(snapshots)
+        errors = []
+        start_time = time.time()
+        while pending and time.time() - start_time < timeout:
+            for snapshot in list(pending):
+                state = self.get_snapshot(snapshot).state
+                if state in ("available", "in_use"):
+                    pending.remove(snapshot)
+                elif state in ("error", "invalid_data", "deleting", "deleted", "unknown"):
+                    errors.append(f"{snapshot.name}: snapshot in unexpected state: {state}")
+                    pending.remove(snapshot)
+            if pending:
+                time.sleep(poll_interval)
+        errors.extend(f"{s.name}: timeout waiting for snapshot (waited {timeout}s)" for s in pending)
+        return errors
+
     def delete_instance_snapshot(self, snapshot_id: str) -> None:
         """Delete an Instance API snapshot."""
         endpoint = f"/instance/v1/zones/{self.zone}/snapshots/{snapshot_id}"
@@ -152,17 +271,155 @@ class ScalewaySnapshotManager:
         endpoint = f"/block/v1alpha1/zones/{self.zone}/snapshots/{snapshot_id}"
         self._request("DELETE", endpoint)
 
-    def delete_snapshot(self, snapshot: dict) -> None:
+    def delete_snapshot(self, snapshot: Snapshot) -> None:
         """Delete a snapshot using the appropriate API."""
-        snapshot_id = snapshot["id"]
-        if snapshot.get("_api") == "block":
-            self.delete_block_snapshot(snapshot_id)
+        if snapshot.api == "block":
+            self.delete_block_snapshot(snapshot.id)
         else:
-            self.delete_instance_snapshot(snapshot_id)
+            self.delete_instance_snapshot(snapshot.id)
+
+    def create_volume_from_snapshot(self, entry: dict, name: str) -> dict:
+        """Create a new volume from a cataloged snapshot using the matching API."""
+        if entry["data"]["api"] == "block":
+            endpoint = f"/block/v1alpha1/zones/{self.zone}/volumes"
+            data = {
+                "name": name,
+                "project_id": self.project_id,
+                "from_snapshot": {"snapshot_id": entry["id"]},
+            }
+        else:
+            endpoint = f"/instance/v1/zones/{self.zone}/volumes"
+            data = {
+                "name": name,
+                "project": self.project_id,
+                "base_snapshot": entry["id"],
+                "volume_type": entry["data"].get("volume_type") or "l_ssd",
+            }
+        result = self._request("POST", endpoint, data)
+        return result.get("volume", result)
+
+    def refresh_catalog(self, catalog: BackupCatalog, full: bool = False) -> int:
+        """Bring the local snapshot catalog up to date for both APIs."""
+
+        def entry_for(api: str):
+            def to_entry(snapshot: dict) -> dict:
+                volume = snapshot.get("base_volume") or snapshot.get("parent_volume") or {}
+                created = parse_time(snapshot.get("creation_date") or snapshot.get("created_at"))
+                updated = parse_time(snapshot.get("modification_date") or snapshot.get("updated_at"))
+                return {
+                    "id": snapshot["id"],
+                    "target": volume.get("id") or snapshot["id"],
+                    # auto-<server>-<volume>-<timestamp> -> auto-<server>-<volume>
+                    "label": re.sub(r"-\d{8}-\d{6}$", "", snapshot["name"]),
+                    "name": snapshot["name"],
+                    "created_at": created,
+                    "status": snapshot.get("state") or snapshot.get("status") or "unknown",
+                    "size": snapshot.get("size") or 0,
+                    "data": {
+                        "api": api,
+                        "volume_type": snapshot.get("volume_type"),
+                        # Approximates how long the snapshot took to become available
+                        "duration": max(0, updated - created),
+                    },
+                }
+            return to_entry
+
+        instance_endpoint = (
+            f"/instance/v1/zones/{self.zone}/snapshots"
+            f"?project={self.project_id}&order_by=created_at_desc"
+        )
+        block_endpoint = (
+            f"/block/v1alpha1/zones/{self.zone}/snapshots"
+            f"?project_id={self.project_id}&order_by=created_at_desc"
+        )
+        return catalog.refresh(
+            f"instance:{self.zone}",
+            self.paginate(instance_endpoint, "snapshots"),
+            entry_for("instance"),
+            full=full,
+        ) + catalog.refresh(
+            f"block:{self.zone}",
+            self.paginate(block_endpoint, "snapshots"),
+            entry_for("block"),
+            full=full,
+        )
 
-    def create_server_snapshot(self, server_name: str) -> bool:
-        """Create snapshots for all volumes of a server."""
-        logger.info(f"Creating snapshot for server: {server_name}")
+    def plan_restore(self, catalog: BackupCatalog, server_name: str, at: int) -> list:
+        """Newest available snapshot of each volume of a server at or before ``at``."""
+        prefix = f"auto-{server_name}-"
+        return [
+            entry
+            for source in (f"instance:{self.zone}", f"block:{self.zone}")
+            for entry in catalog.nearest(source, at, ("available",), name_prefix=prefix)
+        ]
+
+    def storage_series(self, catalog: BackupCatalog, server_name: str) -> list:
+        """A server's snapshot runs from the catalog as analytics points.
+
+        All volumes snapshotted in one run share the timestamp in their
+        name; a run's size is their total and its duration the slowest one.
+        """
+        runs: dict[str, dict] = {}
+        for source in (f"instance:{self.zone}", f"block:{self.zone}"):
+            for entry in catalog.entries(source, ("available",), name_prefix=f"auto-{server_name}-"):
+                match = re.search(r"(\d{8}-\d{6})$", entry["name"])
+                run = runs.setdefault(match.group(1) if match else entry["id"], {
+                    "id": match.group(1) if match else entry["id"],
+                    "created_at": entry["created_at"],
+                    "size": 0,
+                    "duration": None,
+                })
+                run["created_at"] = min(run["created_at"], entry["created_at"])
+                run["size"] += entry["size"]
+                duration = entry["data"].get("duration")
+                if duration:
+                    run["duration"] = max(run["duration"] or 0, duration)
+        return sorted(runs.values(), key=lambda run: run["created_at"])
+
+    def execute_restore(self, plan: list) -> list:
+        """Create a volume from every snapshot in ``plan`` in parallel.
+
+        Returns (entry, volume id or None, error or None) tuples. The volumes
+        are left detached; attaching them requires stopping the server.
+        """
+        def restore(entry: dict) -> tuple:
+            try:
+                volume = self.create_volume_from_snapshot(entry, f"restore-{entry['name']}")
+                return (entry, volume.get("id"), None)
+            except ScalewayAPIError as e:
+                return (entry, None, str(e))
+
+        if not plan:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(plan), 8)) as pool:
+            return list(pool.map(restore, plan))
+
+    def _submit_snapshot(self, volume: dict, name: str, tags: list) -> Snapshot:
+        """Create one volume snapshot and return it."""
+        if self._is_sbs_volume(volume):
+            result = self.create_block_snapshot(volume["id"], name, tags)
+            return Snapshot.from_api(result.get("snapshot", result), "block")
+        result = self.create_instance_snapshot(volume["id"], name, tags)
+        return Snapshot.from_api(result.get("snapshot", result), "instance")
+
+    def create_server_snapshot(
+        self,
+        server_name: str,
+        freeze_mounts: Optional[list] = None,
+        freeze_timeout: int = 30,
+        wait: bool = False,
+    ) -> bool:
+        """Snapshot all volumes of a server as one group.
+
+        All snapshot requests are submitted at the same time and tagged with
+        the group id. If ``freeze_mounts`` is given, those filesystems are
+        frozen over SSH while the requests are in flight. A group is all or
+        nothing: if any volume fails, the snapshots already created for the
+        group are deleted again. With ``wait``, that includes a snapshot that
+        fails after it was accepted: the group only succeeds once every
+        snapshot is available.
+        """
+        logger.info(f"Creating snapshot group for server: {server_name}")
 
         server = self.get_server_by_name(server_name)
         if not server:
@@ -175,92 +432,189 @@ class ScalewaySnapshotManager:
             return False
 
         timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
-
-        for volume in volumes:
-            volume_id = volume["id"]
-            volume_name = volume.get("name", "root")
-            snapshot_name = f"auto-{server_name}-{volume_name}-{timestamp}"
-            is_sbs = self._is_sbs_volume(volume)
-
-            logger.info(f"Creating {'SBS' if is_sbs else 'Instance'} snapshot: {snapshot_name} for volume {volume_id}")
+        tags = [f"{GROUP_TAG_PREFIX}{server_name}-{timestamp}"]
+        names = [
+            f"auto-{server_name}-{volume.get('name', 'root')}-{timestamp}" for volume in volumes
+        ]
+
+        freeze = FilesystemFreeze(server_name, freeze_mounts, freeze_timeout) if freeze_mounts else None
+        created, errors = [], []
+        try:
+            if freeze:
+                freeze.freeze()
+            # One thread per volume so every request leaves at the same moment
+            with ThreadPoolExecutor(max_workers=len(volumes)) as pool:
+                futures = {
+                    pool.submit(self._submit_snapshot, volume, name, tags): name
+                    for volume, name in zip(volumes, names)
+                }
+                for future, name in futures.items():
+                    try:
+                        snapshot = future.result()
+                        created.append(snapshot)
+                        logger.info(f"Snapshot created: {name} ({snapshot.id}, {snapshot.api} API)")
+                    except Exception as e:
+                        # Transport errors too: the group must still be rolled back
+                        errors.append(f"{name}: {e}")
+        except FreezeError as e:
+            errors.append(str(e))
+        finally:
+            if freeze:
+                try:
+                    frozen_for = freeze.thaw()
+                    logger.info(f"Filesystems on {server_name} were frozen for {frozen_for:.2f}s")
+                except FreezeError as e:
+                    errors.append(str(e))
+        if wait and not errors:
             try:
-                if is_sbs:
-                    result = self.create_block_snapshot(volume_id, snapshot_name)
-                else:
-                    result = self.create_instance_snapshot(volume_id, snapshot_name)
-                snapshot = result.get("snapshot", {})
-                logger.info(f"Snapshot created: {snapshot.get('id', 'unknown')}")
-            except requests.HTTPError as e:
-                logger.error(f"Failed to create snapshot for {volume_name}: {e}")
-                return False
+                errors.extend(self.wait_for_snapshots(created))
+            except Exception as e:
+                errors.append(f"waiting for the snapshots: {e}")
+
+        if errors:
+            for error in errors:
+                logger.error(f"Snapshot group for {server_name} failed: {error}")
+            for snapshot in created:
+                logger.info(f"Rolling back partial group: deleting {snapshot.name}")
+                try:
+                    self.delete_snapshot(snapshot)
+                except Exception as e:
+                    logger.error(f"Failed to delete {snapshot.name}: {e}")
+            return False
 
+        logger.info(f"Snapshot group {tags[0][len(GROUP_TAG_PREFIX):]} created ({len(created)} volumes)")
         return True
 
-    def cleanup_old_snapshots(self, server_name: str, retention_count: int = 3) -> int:
-        """Delete old snapshots beyond the retention count."""
-        prefix = f"auto-{server_name}-"
-        snapshots = self.list_snapshots(name_prefix=prefix)
+    def list_snapshot_groups(self, server_name: str) -> list:
+        """Snapshots of a server grouped per run, newest group first."""
+        return group_snapshots(self.list_snapshots(name_prefix=f"auto-{server_name}-"))
 
-        # Sort by creation date (newest first)
-        snapshots.sort(
-            key=lambda s: s.get("creation_date", ""), reverse=True
-        )
+    def cleanup_old_snapshots(self, server_name: str, retention_count: int = 3) -> int:
+        """Delete snapshot groups beyond the retention count, a whole group at a time."""
+        groups = self.list_snapshot_groups(server_name)
 
         deleted_count = 0
-        if len(snapshots) > retention_count:
-            to_delete = snapshots[retention_count:]
+        if len(groups) > retention_count:
+            to_delete = groups[retention_count:]
             logger.info(
-                f"Found {len(snapshots)} snapshots for {server_name}, "
-                f"deleting {len(to_delete)} old snapshots (keeping {retention_count})"
+                f"Found {len(groups)} snapshot groups for {server_name}, "
+                f"deleting {len(to_delete)} old groups (keeping {retention_count})"
             )
 
-            for snapshot in to_delete:
-                snapshot_id = snapshot["id"]
-                snapshot_name = snapshot["name"]
-                logger.info(f"Deleting snapshot: {snapshot_name} ({snapshot_id})")
-                try:
-                    self.delete_snapshot(snapshot)
-                    deleted_count += 1
-                except requests.HTTPError as e:
-                    logger.error(f"Failed to delete snapshot {snapshot_name}: {e}")
+            for group in to_delete:
+                for snapshot in group:
+                    logger.info(f"Deleting snapshot: {snapshot.name} ({snapshot.id})")
+                    try:
+                        self.delete_snapshot(snapshot)
+                        deleted_count += 1
+                    except ScalewayAPIError as e:
+                        logger.error(f"Failed to delete snapshot {snapshot.name}: {e}")
         else:
             logger.info(
-                f"Found {len(snapshots)} snapshots for {server_name}, "
+                f"Found {len(groups)} snapshot groups for {server_name}, "
                 f"no cleanup needed (retention: {retention_count})"
             )
 
         return deleted_count
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Scaleway Disk Snapshot Manager"
     )
     parser.add_argument(
         "--action",
-        choices=["backup", "list", "cleanup"],
+        choices=["backup", "list", "cleanup", "restore-plan", "analytics", "reconcile"],
         default="backup",
         help="Action to perform (default: backup)",
     )
     parser.add_argument(
         "--server",
-        help="Target a specific server (comma-separated for multiple)",
+        help="Target a specific server (comma-separated for multiple, default: the servers in the policy)",
+    )
+    parser.add_argument(
+        "--policy",
+        default=backup_policy.DEFAULT_PATH,
+        help=f"Desired-state policy file for reconcile and the default servers (default: {backup_policy.DEFAULT_PATH})",
     )
     parser.add_argument(
         "--retention",
         type=int,
         default=3,
-        help="Number of snapshots to retain per server (default: 3)",
+        help="Number of snapshot groups (one per run) to retain per server (default: 3)",
+    )
+    parser.add_argument(
+        "--freeze",
+        help="Mount points to fsfreeze over SSH while snapshotting (comma-separated)",
+    )
+    parser.add_argument(
+        "--freeze-timeout",
+        type=int,
+        default=30,
+        help="Seconds after which frozen filesystems thaw on their own (default: 30)",
+    )
+    parser.add_argument(
+        "--at",
+        help="Point in time to restore to, ISO 8601, UTC if no offset (default: now)",
+    )
+    parser.add_argument(
+        "--execute",
+        action="store_true",
+        help="With restore-plan: create volumes from the planned snapshots",
+    )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="With restore-plan or analytics: rebuild the local catalog instead of updating it",
+    )
+    parser.add_argument(
+        "--what-if-retention",
+        default="1,3,7,14",
+        help="With analytics: retention counts to compare (comma-separated, default: 1,3,7,14)",
+    )
+    parser.add_argument(
+        "--storage-budget-gb",
+        type=float,
+        help="With analytics: forecast when stored snapshots reach this many GB",
+    )
+    parser.add_argument(
+        "--backup-window-minutes",
+        type=int,
+        help="With analytics: forecast when a snapshot run no longer fits in this window",
+    )
+    parser.add_argument(
+        "--on-overlap",
+        choices=run_lease.POLICIES,
+        default=run_lease.DEFAULT_POLICY,
+        help="When another run holds some of the targets: wait for it, merge into it if it runs "
+        "the same action, or fail right away (default: WOBBLER_ON_OVERLAP or wait)",
+    )
+    parser.add_argument(
+        "--overlap-timeout",
+        type=int,
+        default=3600,
+        help="Seconds to wait for overlapping runs before giving up (default: 3600)",
     )
     parser.add_argument(
         "--dry-run",
         action="store_true",
         help="Show what would be done without making changes",
     )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Always run in this process, even if a daemon is listening",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help=argparse.SUPPRESS,
+    )
+    return parser
 
-    args = parser.parse_args()
 
-    # Get credentials from environment
+def create_manager(get_cache_ttl: float = 0) -> ScalewaySnapshotManager:
+    """Create a manager from the SCW_* environment variables."""
     access_key = os.environ.get("SCW_ACCESS_KEY", "")
     secret_key = os.environ.get("SCW_SECRET_KEY", "")
     project_id = os.environ.get("SCW_PROJECT_ID", "")
@@ -270,40 +624,280 @@ def main():
         logger.error("Missing Scaleway credentials (SCW_ACCESS_KEY, SCW_SECRET_KEY, SCW_PROJECT_ID)")
         sys.exit(1)
 
-    manager = ScalewaySnapshotManager(
+    return ScalewaySnapshotManager(
         access_key=access_key,
         secret_key=secret_key,
         project_id=project_id,
         zone=zone,
+        get_cache_ttl=get_cache_ttl,
     )
 
-    # Default servers if not specified
-    default_servers = ["tools-prod", "management", "authentik-prod"]
-    
+
+def is_read_only(args: argparse.Namespace) -> bool:
+    """Whether a run makes no changes and may be answered by the daemon."""
+    if args.action == "restore-plan":
+        return not args.execute or args.dry_run
+    return args.action in ("list", "analytics") or args.dry_run
+
+
+def needs_lease(args: argparse.Namespace) -> bool:
+    """Whether a run changes snapshots or volumes and must not overlap other such runs."""
+    return args.action in ("backup", "cleanup", "reconcile", "restore-plan") and not is_read_only(args)
+
+
+def run_restore_plan(
+    args: argparse.Namespace,
+    manager: ScalewaySnapshotManager,
+    servers: list,
+) -> None:
+    """Print (and optionally start) the volume restores for a point in time."""
+    at = parse_time(args.at) if args.at else int(time.time())
+    catalog = BackupCatalog()
+    try:
+        updated = manager.refresh_catalog(catalog, full=args.full_refresh)
+        started = time.perf_counter()
+        plans = {server_name: manager.plan_restore(catalog, server_name, at) for server_name in servers}
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    finally:
+        catalog.close()
+
+    print(f"=== Restore plan for {format_time(at)} ===")
+    print(f"Catalog: {updated} entries updated, plan computed in {elapsed_ms:.1f} ms")
+
+    for server_name, plan in plans.items():
+        print(f"\n--- {server_name} ---")
+        if not plan:
+            print("  No usable snapshots at or before that time")
+        for entry in plan:
+            age = timedelta(seconds=at - entry["created_at"])
+            print(f"  Volume {entry['target']}")
+            print(f"    {entry['name']} ({entry['id']}, {entry['data']['api']} API)")
+            print(f"    Created: {format_time(entry['created_at'])} ({age} before target), Size: {entry['size'] / (1024**3):.2f} GB")
+
+    plan = [entry for entries in plans.values() for entry in entries]
+    if not plan:
+        sys.exit(1)
+    if not args.execute:
+        return
+    if args.dry_run:
+        print(f"\n[DRY RUN] Would create {len(plan)} volumes from snapshots")
+        return
+
+    print(f"\n=== Creating {len(plan)} volumes from snapshots ===")
+    failed = 0
+    for entry, volume_id, error in manager.execute_restore(plan):
+        if error:
+            print(f"[FAILED] {entry['name']}: {error}")
+            failed += 1
+        else:
+            print(f"[OK] Volume {volume_id} created from {entry['name']}")
+    print("Attach the new volumes to the (stopped) servers to complete the restore.")
+    if failed:
+        sys.exit(1)
+
+
+def run_analytics(
+    args: argparse.Namespace,
+    manager: ScalewaySnapshotManager,
+    servers: list,
+) -> None:
+    """Record snapshot run sizes and print growth, retention and capacity forecasts."""
+    what_if = sorted({int(n) for n in args.what_if_retention.split(",") if n.strip()} | {args.retention})
+    window = args.backup_window_minutes * 60 if args.backup_window_minutes else None
+    budget = int(args.storage_budget_gb * 1024 ** 3) if args.storage_budget_gb else None
+
+    catalog = BackupCatalog()
+    history = storage_analytics.StorageHistory()
+    try:
+        manager.refresh_catalog(catalog, full=args.full_refresh)
+        results = []
+        for server_name in servers:
+            runs = manager.storage_series(catalog, server_name)
+            if not runs:
+                continue
+            key = f"snapshots:{manager.zone}:{server_name}"
+            history.record(key, server_name, runs)
+            results.append(storage_analytics.analyze_series(
+                server_name,
+                history.points(key),
+                runs,
+                args.retention,
+                what_if,
+                window_seconds=window,
+            ))
+    finally:
+        history.close()
+        catalog.close()
+
+    if not results:
+        print("No snapshots found")
+        return
+    totals = storage_analytics.summarize(results, args.retention, what_if, budget)
+    storage_analytics.print_report("server snapshots", results, totals, args.retention, window)
+
+
+def snapshot_runs(snapshots: list) -> list:
+    """Snapshot groups as reconcile runs, newest first."""
+    return [
+        {
+            "created_at": max(s.created_at for s in group),
+            "ok": all(s.state != "error" for s in group),
+            "snapshots": group,
+        }
+        for group in group_snapshots(snapshots)
+    ]
+
+
+def run_reconcile(
+    args: argparse.Namespace,
+    manager: ScalewaySnapshotManager,
+    policy: dict,
+    servers: list,
+) -> None:
+    """Create and delete snapshot groups until every server matches the policy."""
+    # The only read when nothing is due: one snapshot listing per API
+    snapshots = manager.list_snapshots()
+    now = time.time()
+    steps = []
+    for server_name in servers:
+        settings = backup_policy.settings_for(policy, "snapshots", server_name)
+        if not settings:
+            logger.info(f"Server {server_name} is not managed by the policy, skipping")
+            continue
+        runs = snapshot_runs([s for s in snapshots if s.name.startswith(f"auto-{server_name}-")])
+        steps.append(backup_policy.plan_target(server_name, settings, runs, now))
+
+    print(f"=== Reconciling snapshots with {args.policy} ===")
+    for step in steps:
+        print(f"  {step['name']}: {backup_policy.describe(step)}")
+
+    to_create = [step for step in steps if step["create"]]
+    if not to_create and not any(backup_policy.deletions(step) for step in steps):
+        print("\nNothing to do")
+        return
+    if args.dry_run:
+        deleted = sum(len(run["snapshots"]) for step in steps for run in backup_policy.deletions(step))
+        print(f"\n[DRY RUN] Would create {len(to_create)} snapshot groups and delete {deleted} snapshots")
+        return
+
+    failed = 0
+    created = set()
+    if to_create:
+        print(f"\n=== Creating {len(to_create)} snapshot groups ===")
+        with ThreadPoolExecutor(max_workers=len(to_create)) as pool:
+            results = pool.map(
+                lambda step: manager.create_server_snapshot(
+                    step["name"],
+                    freeze_mounts=step["settings"]["freeze"] or None,
+                    freeze_timeout=args.freeze_timeout,
+                    # Runs beyond retention are deleted once this one counts
+                    wait=True,
+                ),
+                to_create,
+            )
+            for step, ok in zip(to_create, results):
+                if ok:
+                    created.add(step["name"])
+                    print(f"[OK] Snapshot created for {step['name']}")
+                else:
+                    failed += 1
+                    print(f"[FAILED] Could not create snapshot for {step['name']}")
+
+    to_delete = [
+        snapshot
+        for step in steps
+        for run in backup_policy.deletions(step, created=step["name"] in created)
+        for snapshot in run["snapshots"]
+    ]
+    if to_delete:
+        print(f"\n=== Deleting {len(to_delete)} snapshots ===")
+
+        def delete(snapshot: Snapshot) -> bool:
+            try:
+                manager.delete_snapshot(snapshot)
+                logger.info(f"Deleted snapshot: {snapshot.name} ({snapshot.id})")
+                return True
+            except ScalewayAPIError as e:
+                logger.error(f"Failed to delete snapshot {snapshot.name}: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=min(len(to_delete), 8)) as pool:
+            deleted = sum(pool.map(delete, to_delete))
+        failed += len(to_delete) - deleted
+        print(f"[OK] Deleted {deleted}/{len(to_delete)} snapshots")
+
+    print(f"\n=== Reconcile Complete ===")
+    if failed:
+        sys.exit(1)
+
+
+def run(args: argparse.Namespace, manager: ScalewaySnapshotManager) -> None:
+    policy = None
+    if args.action == "reconcile" or not args.server:
+        try:
+            policy = backup_policy.load_policy(args.policy)
+        except backup_policy.PolicyError as e:
+            logger.error(str(e))
+            sys.exit(1)
+
     if args.server:
         servers = [s.strip() for s in args.server.split(",")]
     else:
-        servers = default_servers
+        servers = backup_policy.target_names(policy, "snapshots")
+
+    if not needs_lease(args):
+        run_action(args, manager, policy, servers)
+        return
+    run_lease.coordinated(
+        "server",
+        servers,
+        args.action,
+        args.on_overlap,
+        args.overlap_timeout,
+        lambda leased: run_action(args, manager, policy, leased),
+    )
+
+
+def run_action(
+    args: argparse.Namespace,
+    manager: ScalewaySnapshotManager,
+    policy: Optional[dict],
+    servers: list,
+) -> None:
+    if args.action == "reconcile":
+        run_reconcile(args, manager, policy, servers)
+        return
+
+    freeze_mounts = [m.strip() for m in args.freeze.split(",") if m.strip()] if args.freeze else None
+
+    if args.action == "restore-plan":
+        run_restore_plan(args, manager, servers)
+        return
+
+    if args.action == "analytics":
+        run_analytics(args, manager, servers)
+        return
 
     if args.action == "list":
         for server_name in servers:
-            prefix = f"auto-{server_name}-"
-            snapshots = manager.list_snapshots(name_prefix=prefix)
+            groups = manager.list_snapshot_groups(server_name)
             print(f"\n=== Snapshots for {server_name} ===")
-            if not snapshots:
+            if not groups:
                 print("  No snapshots found")
-            else:
-                snapshots.sort(key=lambda s: s.get("creation_date", ""), reverse=True)
-                for s in snapshots:
-                    print(f"  - {s['name']}")
-                    print(f"    Created: {s.get('creation_date', 'unknown')}")
-                    print(f"    Size: {s.get('size', 0) / (1024**3):.2f} GB")
+            for i, group in enumerate(groups, 1):
+                print(f"  Group {i} ({len(group)} volumes):")
+                for s in sorted(group, key=lambda s: s.name):
+                    print(f"  - {s.name}")
+                    print(f"    Created: {format_time(s.created_at)}")
+                    print(f"    Size: {s.size / (1024**3):.2f} GB")
         return
 
     if args.action == "backup":
         print("=== Starting Scaleway Disk Snapshot Backup ===")
         print(f"Servers: {', '.join(servers)}")
-        print(f"Retention: {args.retention} snapshots per server")
+        print(f"Retention: {args.retention} snapshot groups per server")
+        if freeze_mounts:
+            print(f"Freeze: {', '.join(freeze_mounts)} (timeout {args.freeze_timeout}s)")
         print("")
 
         success_count = 0
@@ -312,7 +906,11 @@ def main():
                 print(f"[DRY RUN] Would create snapshot for: {server_name}")
                 success_count += 1
             else:
-                if manager.create_server_snapshot(server_name):
+                if manager.create_server_snapshot(
+                    server_name,
+                    freeze_mounts=freeze_mounts,
+                    freeze_timeout=args.freeze_timeout,
+                ):
                     success_count += 1
                     print(f"[OK] Snapshot created for {server_name}")
                 else:
@@ -323,10 +921,13 @@ def main():
         total_deleted = 0
         for server_name in servers:
             if args.dry_run:
-                prefix = f"auto-{server_name}-"
-                snapshots = manager.list_snapshots(name_prefix=prefix)
-                if len(snapshots) > args.retention:
-                    print(f"[DRY RUN] Would delete {len(snapshots) - args.retention} old snapshots for {server_name}")
+                groups = manager.list_snapshot_groups(server_name)
+                if len(groups) > args.retention:
+                    old = groups[args.retention:]
+                    print(
+                        f"[DRY RUN] Would delete {len(old)} old snapshot groups "
+                        f"({sum(len(g) for g in old)} snapshots) for {server_name}"
+                    )
             else:
                 deleted = manager.cleanup_old_snapshots(server_name, args.retention)
                 total_deleted += deleted
@@ -345,10 +946,13 @@ def main():
         total_deleted = 0
         for server_name in servers:
             if args.dry_run:
-                prefix = f"auto-{server_name}-"
-                snapshots = manager.list_snapshots(name_prefix=prefix)
-                if len(snapshots) > args.retention:
-                    print(f"[DRY RUN] Would delete {len(snapshots) - args.retention} old snapshots for {server_name}")
+                groups = manager.list_snapshot_groups(server_name)
+                if len(groups) > args.retention:
+                    old = groups[args.retention:]
+                    print(
+                        f"[DRY RUN] Would delete {len(old)} old snapshot groups "
+                        f"({sum(len(g) for g in old)} snapshots) for {server_name}"
+                    )
             else:
                 deleted = manager.cleanup_old_snapshots(server_name, args.retention)
                 total_deleted += deleted
@@ -357,6 +961,34 @@ def main():
         print(f"\nTotal deleted: {total_deleted}")
 
 
+def main(argv: Optional[list] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        manager = create_manager(
+            get_cache_ttl=float(os.environ.get("WOBBLER_DAEMON_CACHE_TTL", "30"))
+        )
+
+        def run_forwarded(forwarded: list) -> None:
+            forwarded_args = parser.parse_args(forwarded)
+            if not is_read_only(forwarded_args):
+                print("[ERROR] The daemon only serves read-only actions (list, restore-plan, analytics, --dry-run)")
+                sys.exit(2)
+            run(forwarded_args, manager)
+
+        wobbler_daemon.serve(DAEMON_NAME, run_forwarded)
+        return
+
+    if is_read_only(args) and not args.no_daemon:
+        code = wobbler_daemon.forward(DAEMON_NAME, argv)
+        if code is not None:
+            sys.exit(code)
+
+    run(args, create_manager())
+
+
 if __name__ == "__main__":
     main()
 
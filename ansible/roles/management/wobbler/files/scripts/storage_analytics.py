@@ -0,0 +1,232 @@
+"""
+Storage footprint history and growth forecasts for backups and snapshots
+
+The backup catalog only knows what exists right now, and retention keeps
+deleting the oldest entries. The analytics action therefore copies every
+backup (or snapshot run) it sees into a small SQLite time series that is
+never pruned. From that history it derives, per series (a database, or a server's snapshot runs):
+
+- the growth rate, as a least-squares fit of size over time,
+- the storage that other retention counts would use at the current size,
+- when growth pushes a run past the backup window, estimated from the
+  throughput of the latest run,
+- and, over all series, when the total reaches the storage budget.
+"""
+
+import os
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from backup_catalog import STATE_DIR, format_time
+
+DAY = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    series TEXT NOT NULL,
+    id TEXT NOT NULL,
+    label TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    duration INTEGER,
+    PRIMARY KEY (series, id)
+);
+CREATE INDEX IF NOT EXISTS observations_by_time ON observations (series, created_at);
+"""
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def _format_rate(rate: float) -> str:
+    return f"{'-' if rate < 0 else '+'}{format_size(abs(rate))}/day"
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s"
+
+
+class StorageHistory:
+    """Time series of backup and snapshot sizes, kept beyond retention."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(STATE_DIR, "storage-history.sqlite3")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def record(self, series: str, label: str, points: list) -> None:
+        """Store the currently existing ``points`` of a series.
+
+        Each point is a dict with id, created_at (epoch), size and duration
+        (seconds, or None when unknown).
+        """
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?)",
+                [(series, p["id"], label, p["created_at"], p["size"], p.get("duration")) for p in points],
+            )
+
+    def points(self, series: str) -> list:
+        """Every observation of a series, oldest first."""
+        rows = self._db.execute(
+            "SELECT id, created_at, size, duration FROM observations WHERE series = ? ORDER BY created_at",
+            (series,),
+        )
+        return [dict(row) for row in rows]
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def growth_per_day(points: list) -> Optional[float]:
+    """Least-squares slope of size over time, in bytes per day."""
+    points = [p for p in points if p["size"] > 0]
+    if len(points) < 2:
+        return None
+    xs = [p["created_at"] / DAY for p in points]
+    ys = [p["size"] for p in points]
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+def interval_days(points: list) -> float:
+    """Typical spacing between runs, in days (the median of the recent gaps)."""
+    times = [p["created_at"] for p in points[-20:]]
+    gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+    return statistics.median(gaps) / DAY if gaps else 1.0
+
+
+def retention_footprint(latest_size: int, rate: float, interval: float, count: int) -> int:
+    """Storage used when keeping ``count`` runs, the oldest ones smaller by the growth rate."""
+    return int(sum(max(0.0, latest_size - rate * interval * k) for k in range(count)))
+
+
+def days_until(current: float, rate: Optional[float], limit: float) -> Optional[float]:
+    """Days until ``current`` growing by ``rate`` per day reaches ``limit`` (None: never)."""
+    if current >= limit:
+        return 0.0
+    if not rate or rate <= 0:
+        return None
+    return (limit - current) / rate
+
+
+def analyze_series(
+    label: str,
+    points: list,
+    stored: list,
+    retention_count: int,
+    what_if: list,
+    window_seconds: Optional[int] = None,
+) -> dict:
+    """Growth, retention what-if and backup window forecast of one series.
+
+    ``points`` is the full history, ``stored`` what exists now.
+    """
+    latest = points[-1]
+    rate = growth_per_day(points)
+    interval = interval_days(points)
+    result = {
+        "label": label,
+        "stored_count": len(stored),
+        "stored_size": sum(p["size"] for p in stored),
+        "latest_size": latest["size"],
+        "latest_at": latest["created_at"],
+        "history_days": (latest["created_at"] - points[0]["created_at"]) / DAY,
+        "growth_per_day": rate,
+        "interval_days": interval,
+        "footprint": retention_footprint(latest["size"], rate or 0.0, interval, retention_count),
+        "what_if": {n: retention_footprint(latest["size"], rate or 0.0, interval, n) for n in what_if},
+        "duration": None,
+        "window_days": None,
+    }
+
+    timed = [p for p in points if p.get("duration") and p["size"] > 0]
+    if window_seconds and timed:
+        # Assume the run time scales with size at the latest observed throughput
+        newest = timed[-1]
+        throughput = newest["size"] / newest["duration"]
+        result["duration"] = newest["duration"]
+        result["window_days"] = days_until(latest["size"], rate, window_seconds * throughput)
+    return result
+
+
+def summarize(results: list, retention_count: int, what_if: list, budget: Optional[int] = None) -> dict:
+    """Totals over all series, and when they reach the storage budget."""
+    growth = sum((r["growth_per_day"] or 0.0) for r in results)
+    footprint = sum(r["footprint"] for r in results)
+    totals = {
+        "stored_size": sum(r["stored_size"] for r in results),
+        "footprint": footprint,
+        # Every retained copy grows along with the latest one
+        "growth_per_day": growth * retention_count,
+        "what_if": {n: sum(r["what_if"][n] for r in results) for n in what_if},
+        "budget": budget,
+        "budget_days": None,
+    }
+    if budget:
+        totals["budget_days"] = days_until(footprint, totals["growth_per_day"], budget)
+    return totals
+
+
+def _forecast(days: Optional[float]) -> str:
+    if days is None:
+        return "not at the current growth rate"
+    if days == 0:
+        return "already exceeded"
+    when = datetime.fromtimestamp(time.time() + days * DAY, timezone.utc).strftime("%Y-%m-%d")
+    return f"in ~{days:.0f} days ({when})"
+
+
+def print_report(
+    title: str,
+    results: list,
+    totals: dict,
+    retention_count: int,
+    window_seconds: Optional[int] = None,
+) -> None:
+    print(f"=== Storage analytics: {title} ===")
+    for r in results:
+        print(f"\n  {r['label']}")
+        print(
+            f"    Stored: {r['stored_count']} ({format_size(r['stored_size'])}), "
+            f"latest {format_size(r['latest_size'])} at {format_time(r['latest_at'])}"
+        )
+        if r["growth_per_day"] is None:
+            print("    Growth: not enough history yet")
+        else:
+            monthly = 100 * r["growth_per_day"] * 30 / r["latest_size"] if r["latest_size"] else 0
+            print(
+                f"    Growth: {_format_rate(r['growth_per_day'])} ({monthly:+.1f}% per 30 days) "
+                f"over {r['history_days']:.0f} days, one run every {r['interval_days']:.1f} days"
+            )
+        print("    Retention: " + " | ".join(f"{n}: {format_size(size)}" for n, size in r["what_if"].items()))
+        if r["duration"] is not None:
+            print(
+                f"    Backup window: latest run took {_format_duration(r['duration'])} of "
+                f"{_format_duration(window_seconds)}, exceeded {_forecast(r['window_days'])}"
+            )
+
+    print("\n  Total")
+    print(
+        f"    Stored now: {format_size(totals['stored_size'])}, "
+        f"at retention {retention_count}: {format_size(totals['footprint'])} "
+        f"growing {_format_rate(totals['growth_per_day'])}"
+    )
+    print("    Retention: " + " | ".join(f"{n}: {format_size(size)}" for n, size in totals["what_if"].items()))
+    if totals["budget"]:
+        print(f"    Budget {format_size(totals['budget'])}: reached {_forecast(totals['budget_days'])}")
@@ -0,0 +1,148 @@
+"""
+Optional long-lived daemon for the wobbler scripts
+
+Wobbler starts a new Python process for every run. When a script is also
+running with --serve, read-only invocations (list, dry runs) are forwarded
+over a Unix socket to that process instead, which answers from its warm API
+session and response cache.
+
+Protocol: the client sends one JSON line {"argv": [...]}; the daemon streams
+back JSON lines {"out": "..."} followed by a final {"exit": <code>}.
+"""
+
+import json
+import logging
+import os
+import socket
+import sys
+from typing import Callable, Optional
+
+DAEMON_DIR = os.environ.get("WOBBLER_DAEMON_DIR", "/tmp/wobbler")
+CONNECT_TIMEOUT = 2
+
+
+def socket_path(name: str) -> str:
+    """Return the socket path used by the daemon for script ``name``."""
+    return os.path.join(DAEMON_DIR, f"{name}.sock")
+
+
+def forward(name: str, argv: list) -> Optional[int]:
+    """Run ``argv`` in the daemon for ``name`` and relay its output.
+
+    Returns the exit code, or ``None`` when no daemon is reachable and the
+    caller should run the command itself.
+    """
+    path = socket_path(name)
+    if not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    # Runs can take a while once connected; only the connect is time-bounded
+    sock.settimeout(None)
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(json.dumps({"argv": argv}).encode("utf-8") + b"\n")
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+            elif "exit" in message:
+                return message["exit"]
+
+    # Daemon went away mid-run
+    print("[ERROR] Daemon connection closed unexpectedly")
+    return 1
+
+
+class _SocketWriter:
+    """File-like object that streams writes to the client as JSON lines."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.disconnected = False
+
+    def write(self, text: str) -> int:
+        # A client that hangs up must not abort the run (or the daemon)
+        if text and not self.disconnected:
+            try:
+                self._stream.write(json.dumps({"out": text}).encode("utf-8") + b"\n")
+            except OSError:
+                self.disconnected = True
+        return len(text)
+
+    def flush(self) -> None:
+        if not self.disconnected:
+            try:
+                self._stream.flush()
+            except OSError:
+                self.disconnected = True
+
+
+def serve(name: str, run: Callable[[list], None]) -> None:
+    """Serve requests for script ``name`` until interrupted.
+
+    ``run`` is called with the forwarded argv and should behave like the
+    script's main(); stdout and log output are streamed back to the client.
+    Requests are handled one at a time.
+    """
+    os.makedirs(DAEMON_DIR, mode=0o700, exist_ok=True)
+    path = socket_path(name)
+    if os.path.exists(path):
+        os.unlink(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(8)
+    logging.getLogger(__name__).info(f"Daemon for {name} listening on {path}")
+
+    log_handlers = [
+        h for h in logging.getLogger().handlers if isinstance(h, logging.StreamHandler)
+    ]
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("rwb") as stream:
+                try:
+                    request = json.loads(stream.readline())
+                except ValueError:
+                    continue
+
+                writer = _SocketWriter(stream)
+                previous_stdout = sys.stdout
+                previous_streams = [h.setStream(writer) for h in log_handlers]
+                sys.stdout = writer
+                code = 0
+                try:
+                    run(list(request.get("argv", [])))
+                except SystemExit as e:
+                    code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                except Exception as e:
+                    print(f"[ERROR] {e}")
+                    code = 1
+                finally:
+                    sys.stdout = previous_stdout
+                    for handler, stream_ in zip(log_handlers, previous_streams):
+                        handler.setStream(stream_)
+
+                if not writer.disconnected:
+                    try:
+                        stream.write(json.dumps({"exit": code}).encode("utf-8") + b"\n")
+                        stream.flush()
+                    except OSError:
+                        pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
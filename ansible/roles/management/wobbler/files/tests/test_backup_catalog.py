@@ -0,0 +1,31 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
+
+from backup_catalog import parse_time  # noqa: E402
+
+# 2026-01-02T03:04:05Z
+EPOCH = 1767323045
+
+
+class ParseTimeTest(unittest.TestCase):
+    def test_fraction_of_any_length(self):
+        for value in (
+            "2026-01-02T03:04:05.1Z",
+            "2026-01-02T03:04:05.12345Z",
+            "2026-01-02T03:04:05.123456789Z",
+            "2026-01-02T03:04:05.123456789+00:00",
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(parse_time(value), EPOCH)
+
+    def test_without_fraction(self):
+        self.assertEqual(parse_time("2026-01-02T03:04:05Z"), EPOCH)
+        self.assertEqual(parse_time("2026-01-02 03:04:05"), EPOCH)
+        self.assertEqual(parse_time(None), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
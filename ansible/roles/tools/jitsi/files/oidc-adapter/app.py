@@ -2,16 +2,24 @@
 Jitsi OIDC Adapter - Generic OpenID Connect authentication for Jitsi Meet
 Based on https://github.com/aadpM2hhdixoJm3u/jitsi-OIDC-adapter
 Modified to use environment variables for Docker deployment
+
+The app is built by create_app(). Gunicorn preloads it (see gunicorn.conf.py),
+so the secret key, the discovery metadata and the parsed JWKS are loaded once
+in the master and inherited by every worker, instead of each worker fetching
+them on its own and generating its own secret key.
 """
 
 import os
-import datetime
 import hashlib
 import secrets
 import logging
 import base64
+import struct
+import threading
+import time
+from contextlib import contextmanager
 
-from flask import Flask, request, session, url_for, redirect
+from flask import Blueprint, Flask, Response, g, jsonify, request, session, url_for, redirect
 from authlib.integrations.flask_client import OAuth
 from flask_session import Session
 from werkzeug.middleware.proxy_fix import ProxyFix
@@ -20,8 +28,21 @@ from jwt import PyJWTError
 from urllib.parse import urljoin
 import requests
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import rsa
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from jitsi_token import JitsiTokenMinter
+from rate_limit import MemoryBackend, RateLimiter, RedisBackend
 
 # Configuration from environment variables
 OIDC_CLIENT_ID = os.environ.get('OIDC_CLIENT_ID', '')
@@ -33,27 +54,169 @@ JITSI_BASE_URL = os.environ.get('JITSI_BASE_URL', 'https://meet.example.com')
 JWT_APP_ID = os.environ.get('JWT_APP_ID', 'jitsi')
 JWT_APP_SECRET = os.environ.get('JWT_APP_SECRET', '')
 JWT_SUBJECT = os.environ.get('JWT_SUBJECT', 'meet.example.com')
+JWT_LIFETIME_SECONDS = int(os.environ.get('JWT_LIFETIME_SECONDS', str(3 * 3600)))
+JWT_CACHE_TTL_SECONDS = int(os.environ.get('JWT_CACHE_TTL_SECONDS', '60'))
+
+# A login stays valid for new rooms for this long without another IdP round trip (0 disables)
+SESSION_FRESHNESS_SECONDS = int(os.environ.get('SESSION_FRESHNESS_SECONDS', '3600'))
+# Once that expires, try prompt=none first, which needs no user interaction while the IdP session lasts
+OIDC_SILENT_REAUTH = os.environ.get('OIDC_SILENT_REAUTH', 'false').lower() in ('1', 'true', 'yes')
+
+# Signs the session cookie; generated once per container start when empty
+SECRET_KEY = os.environ.get('SECRET_KEY', '')
 
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
 
+SESSION_FILE_DIR = os.environ.get('SESSION_FILE_DIR', '/app/flask_session')
+
+# Requests per client address and window on the login endpoints (0 disables)
+RATE_LIMIT_REQUESTS = int(os.environ.get('RATE_LIMIT_REQUESTS', '30'))
+RATE_LIMIT_WINDOW_SECONDS = int(os.environ.get('RATE_LIMIT_WINDOW_SECONDS', '60'))
+# Share the counters between workers through Redis; per-worker memory when empty
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', '')
+
 # Setup logging
 logging.basicConfig(
     level=getattr(logging, LOG_LEVEL.upper(), logging.INFO),
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-app = Flask(__name__)
-app.secret_key = secrets.token_urlsafe(32)
-app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
+bp = Blueprint('oidc', __name__)
+
+oauth = OAuth()
+
+token_minter = JitsiTokenMinter(
+    app_id=JWT_APP_ID,
+    subject=JWT_SUBJECT,
+    secret=JWT_APP_SECRET,
+    lifetime=JWT_LIFETIME_SECONDS,
+    cache_ttl=JWT_CACHE_TTL_SECONDS,
+)
+
+# Metrics - exported on /metrics (not routed by Traefik, scraped over the private network)
+# Gunicorn runs several workers, so values are aggregated through PROMETHEUS_MULTIPROC_DIR when set
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_SECONDS = Histogram(
+    'jitsi_oidc_request_duration_seconds',
+    'HTTP request latency by route',
+    ['route', 'method', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    'jitsi_oidc_login_stage_duration_seconds',
+    'Time spent in each stage of the login flow',
+    ['stage'],
+    buckets=LATENCY_BUCKETS,
+)
+LOGIN_SECONDS = Histogram(
+    'jitsi_oidc_login_duration_seconds',
+    'End-to-end login time, from /oidc/auth to the redirect into the meeting',
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+LOGINS_TOTAL = Counter(
+    'jitsi_oidc_logins_total',
+    'Successful logins',
+)
+SESSION_REUSES = Counter(
+    'jitsi_oidc_session_reuses_total',
+    'Logins answered from a fresh session, without going to the identity provider',
+)
+SILENT_REAUTHS = Counter(
+    'jitsi_oidc_silent_reauths_total',
+    'Silent (prompt=none) re-authentications by outcome',
+    ['outcome'],
+)
+LOGIN_FAILURES = Counter(
+    'jitsi_oidc_login_failures_total',
+    'Failed logins by reason',
+    ['reason'],
+)
+RATE_LIMITED = Counter(
+    'jitsi_oidc_rate_limited_total',
+    'Requests rejected with 429 by the per-client rate limiter',
+    ['route'],
+)
+IDP_UP = Gauge(
+    'jitsi_oidc_idp_up',
+    'Whether the last call to the identity provider succeeded',
+    multiprocess_mode='mostrecent',
+)
+IDP_LAST_SUCCESS = Gauge(
+    'jitsi_oidc_idp_last_success_timestamp_seconds',
+    'Unix time of the last successful call to the identity provider',
+    multiprocess_mode='max',
+)
+
+# Last known identity provider state - updated as a side effect of real calls, never probed
+idp_state = {
+    'reachable': None,
+    'last_success': None,
+    'last_failure': None,
+    'last_error': None,
+}
+
+
+def record_idp_result(ok, error=None):
+    """Update cached identity provider reachability"""
+    now = time.time()
+    idp_state['reachable'] = ok
+    if ok:
+        idp_state['last_success'] = now
+        IDP_LAST_SUCCESS.set(now)
+    else:
+        idp_state['last_failure'] = now
+        idp_state['last_error'] = str(error) if error else None
+    IDP_UP.set(1 if ok else 0)
+
+
+def record_failure(reason):
+    """Count a failed login"""
+    LOGIN_FAILURES.labels(reason=reason).inc()
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time one stage of the login flow"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+class SessionCollector:
+    """Report the number of unexpired sessions in the session directory.
+
+    Flask-Session stores each session as a cachelib file whose first four
+    bytes hold the expiry timestamp, so this only reads a header per file.
+    Cachelib's own bookkeeping file never expires (timestamp 0) and is skipped.
+    """
 
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_FILE_DIR'] = '/app/flask_session'
-app.config['SESSION_COOKIE_SECURE'] = True
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-Session(app)
+    def collect(self):
+        now = int(time.time())
+        active = 0
+        try:
+            entries = os.scandir(SESSION_FILE_DIR)
+        except OSError:
+            entries = []
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    expires = struct.unpack('I', f.read(4))[0]
+            except (OSError, struct.error):
+                continue
+            if expires > now:
+                active += 1
+        metric = GaugeMetricFamily('jitsi_oidc_active_sessions', 'Unexpired login sessions on disk')
+        metric.add_metric([], active)
+        yield metric
 
-oauth = OAuth(app)
+
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    REGISTRY.register(SessionCollector())
 
 def fetch_oidc_configuration():
     """Fetch OIDC configuration from discovery URL"""
@@ -62,85 +225,156 @@ def fetch_oidc_configuration():
         return None
     
     try:
-        response = requests.get(OIDC_DISCOVERY_URL, timeout=10)
-        response.raise_for_status()
-        config = response.json()
+        with stage_timer('discovery'):
+            response = requests.get(OIDC_DISCOVERY_URL, timeout=10)
+            response.raise_for_status()
+            config = response.json()
+        record_idp_result(True)
         logging.info(f"OIDC configuration fetched from {OIDC_DISCOVERY_URL}")
         logging.debug(f"OIDC endpoints: auth={config.get('authorization_endpoint')}, token={config.get('token_endpoint')}")
         return config
     except Exception as e:
+        record_idp_result(False, e)
         logging.error(f"Failed to fetch OIDC configuration: {e}")
         return None
 
-# Fetch OIDC config at startup
-oidc_config = fetch_oidc_configuration()
-
-if oidc_config:
-    oauth.register(
-        name='oidc',
-        client_id=OIDC_CLIENT_ID,
-        client_secret=OIDC_CLIENT_SECRET,
-        authorize_url=oidc_config['authorization_endpoint'],
-        access_token_url=oidc_config['token_endpoint'],
-        jwks_uri=oidc_config['jwks_uri'],
-        issuer=oidc_config['issuer'],
-        client_kwargs={'scope': OIDC_SCOPE},
-    )
-    logging.info("OAuth client registered successfully")
-else:
-    logging.error("Failed to initialize OIDC client - discovery failed")
-
 def get_jwks_keys(jwks_uri):
     """Fetch JWKS keys from the provider"""
-    resp = requests.get(jwks_uri, timeout=10)
-    return resp.json()
+    try:
+        with stage_timer('jwks_fetch'):
+            resp = requests.get(jwks_uri, timeout=10)
+            resp.raise_for_status()
+            jwks = resp.json()
+    except Exception as e:
+        record_idp_result(False, e)
+        raise
+    record_idp_result(True)
+    return jwks
 
-def jwks_to_pem(key_json):
-    """Convert RSA key from JWK to PEM format"""
+def jwk_to_public_key(key_json):
+    """Convert an RSA key from JWK to a key object PyJWT verifies with directly"""
     public_num = rsa.RSAPublicNumbers(
         e=int(base64.urlsafe_b64decode(key_json['e'] + '==').hex(), 16),
         n=int(base64.urlsafe_b64decode(key_json['n'] + '==').hex(), 16)
     )
-    public_key = public_num.public_key(default_backend())
-    pem = public_key.public_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    return public_num.public_key(default_backend())
+
+class IdentityProvider:
+    """Discovery metadata and parsed signing keys of the identity provider
+
+    Loaded once by create_app() - in the gunicorn master when the app is
+    preloaded - and then only refetched when something is missing: discovery
+    if it failed at startup, the JWKS when a token names a key it doesn't
+    have yet (key rotation). Refetches are spaced by ``retry_seconds`` so a
+    down IdP or a bogus key id can't turn every request into a fetch.
+    """
+
+    def __init__(self, retry_seconds=30):
+        self.retry_seconds = retry_seconds
+        self.config = None
+        self.keys = {}
+        self._lock = threading.Lock()
+        self._last_attempt = {'discovery': 0.0, 'jwks': 0.0}
+
+    def load(self):
+        """Fetch discovery metadata and signing keys; returns whether discovery worked"""
+        self._last_attempt['discovery'] = time.monotonic()
+        self.config = fetch_oidc_configuration()
+        if not self.config:
+            return False
+        try:
+            self.refresh_keys()
+        except Exception as e:
+            logging.error(f"Failed to fetch JWKS: {e}")
+        return True
+
+    def _due(self, what):
+        return time.monotonic() - self._last_attempt[what] >= self.retry_seconds
+
+    def ensure_config(self):
+        """Discovery metadata, retrying a failed startup discovery now and then"""
+        if self.config is None and self._due('discovery'):
+            with self._lock:
+                if self.config is None and self._due('discovery'):
+                    if self.load():
+                        register_client(self.config)
+        return self.config
+
+    def refresh_keys(self):
+        self._last_attempt['jwks'] = time.monotonic()
+        jwks = get_jwks_keys(self.config['jwks_uri'])
+        self.keys = {
+            key.get('kid'): jwk_to_public_key(key)
+            for key in jwks.get('keys', [])
+            if key.get('kty') == 'RSA'
+        }
+        logging.info(f"Loaded {len(self.keys)} signing keys from {self.config['jwks_uri']}")
+
+    def signing_key(self, kid):
+        """Public key for ``kid``, refetching the JWKS once for unknown ids"""
+        key = self.keys.get(kid)
+        if key is None and self._due('jwks'):
+            with self._lock:
+                key = self.keys.get(kid)
+                if key is None and self._due('jwks'):
+                    self.refresh_keys()
+                    key = self.keys.get(kid)
+        return key
+
+provider = IdentityProvider()
+
+def register_client(config):
+    """Register the OAuth client from discovery metadata"""
+    oauth.register(
+        name='oidc',
+        client_id=OIDC_CLIENT_ID,
+        client_secret=OIDC_CLIENT_SECRET,
+        authorize_url=config['authorization_endpoint'],
+        access_token_url=config['token_endpoint'],
+        jwks_uri=config['jwks_uri'],
+        issuer=config['issuer'],
+        client_kwargs={'scope': OIDC_SCOPE},
     )
-    return pem
+    logging.info("OAuth client registered successfully")
 
-def parse_id_token(id_token, jwks_uri):
+def parse_id_token(id_token):
     """Parse and validate the ID token"""
-    jwks = get_jwks_keys(jwks_uri)
     header = jwt.get_unverified_header(id_token)
-    
-    rsa_key = None
-    for key in jwks['keys']:
-        if key.get('kid') == header.get('kid'):
-            rsa_key = jwks_to_pem(key)
-            break
+    try:
+        rsa_key = provider.signing_key(header.get('kid'))
+    except Exception as e:
+        logging.error(f"Failed to fetch JWKS: {e}")
+        record_failure('jwks_fetch_failed')
+        return None
     
     if not rsa_key:
         logging.error("RSA key not found for token decoding")
+        record_failure('signing_key_not_found')
         return None
     
     try:
-        decoded = jwt.decode(
-            id_token,
-            rsa_key,
-            algorithms=['RS256'],
-            audience=OIDC_CLIENT_ID,
-            issuer=oidc_config['issuer']
-        )
+        with stage_timer('id_token_verify'):
+            decoded = jwt.decode(
+                id_token,
+                rsa_key,
+                algorithms=['RS256'],
+                audience=OIDC_CLIENT_ID,
+                issuer=provider.config['issuer']
+            )
         logging.debug("ID token successfully decoded")
         return decoded
     except jwt.ExpiredSignatureError:
         logging.error("Token expired")
+        record_failure('token_expired')
     except jwt.InvalidTokenError as e:
         logging.error(f"Invalid token: {e}")
+        record_failure('invalid_token')
     except PyJWTError as e:
         logging.error(f"JWT Error: {e}")
+        record_failure('invalid_token')
     except Exception as e:
         logging.error(f"Unexpected error decoding token: {e}")
+        record_failure('invalid_token')
     
     return None
 
@@ -152,46 +386,123 @@ def get_gravatar_url(email):
     email_hash = hashlib.sha256(email.encode('utf-8')).hexdigest()
     return f"https://www.gravatar.com/avatar/{email_hash}"
 
-@app.route('/health')
-@app.route('/oidc/health')
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@bp.after_app_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(
+            route=route,
+            method=request.method,
+            status=str(response.status_code),
+        ).observe(time.perf_counter() - started)
+    return response
+
+@bp.route('/health')
+@bp.route('/oidc/health')
 def health():
-    """Health check endpoint"""
-    return 'OK', 200
+    """Health check endpoint - reports IdP reachability from cached state, without calling it"""
+    degraded = not provider.config or idp_state['reachable'] is False
+    return jsonify({
+        'status': 'degraded' if degraded else 'ok',
+        'oidc_configured': bool(provider.config),
+        'idp': idp_state,
+    }), 200
+
+def metrics_registry():
+    """Registry to export, aggregated over all workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(SessionCollector())
+    return registry
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus metrics endpoint (under gunicorn, scraped from the master's metrics port instead)"""
+    return Response(generate_latest(metrics_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+def session_is_fresh():
+    """Whether the session holds a login recent enough to reuse"""
+    authenticated_at = session.get('authenticated_at')
+    return (
+        session.get('user_info') is not None
+        and authenticated_at is not None
+        and time.time() - authenticated_at < SESSION_FRESHNESS_SECONDS
+    )
 
-@app.route('/oidc/auth')
+@bp.route('/oidc/auth')
 def login():
     """Initiate OIDC authentication flow"""
+    # Get room name from query parameter
+    room_name = request.args.get('roomname', request.args.get('room', 'lobby'))
+    
+    # Rejoins and room switches after a recent login go straight to the token
+    if session_is_fresh():
+        session['room_name'] = room_name
+        session['auth_started_at'] = time.time()
+        SESSION_REUSES.inc()
+        logging.info(f'Reusing session for room: {room_name}')
+        return redirect(url_for('.tokenize'))
+    
+    oidc_config = provider.ensure_config()
     if not oidc_config:
+        record_failure('not_configured')
         return 'OIDC not configured', 500
     
     redirect_uri = urljoin(JITSI_BASE_URL, '/oidc/redirect')
     logging.debug(f'Redirect URI: {redirect_uri}')
     
-    result = oauth.oidc.create_authorization_url(redirect_uri=redirect_uri)
-    auth_url = result['url']
+    # A user who logged in before (but not recently) can often be re-authenticated without a prompt
+    silent = OIDC_SILENT_REAUTH and session.get('user_info') is not None
+    extra = {'prompt': 'none'} if silent else {}
     
-    # Get room name from query parameter
-    room_name = request.args.get('roomname', request.args.get('room', 'lobby'))
+    with stage_timer('authorize_redirect'):
+        result = oauth.oidc.create_authorization_url(redirect_uri=redirect_uri, **extra)
+    auth_url = result['url']
     
     # Store session data
     session['room_name'] = room_name
     session['oauth_state'] = result['state']
     session['oauth_nonce'] = result.get('nonce')
+    session['auth_started_at'] = time.time()
+    session['silent_reauth'] = silent
     
-    logging.info(f'Starting auth for room: {room_name}')
+    logging.info(f'Starting {"silent " if silent else ""}auth for room: {room_name}')
     logging.debug(f'Auth URL: {auth_url}')
     
     return redirect(auth_url)
 
-@app.route('/oidc/redirect')
+@bp.route('/oidc/redirect')
 def oauth_callback():
     """Handle OIDC callback after authentication"""
     try:
+        silent = session.pop('silent_reauth', False)
+        error = request.args.get('error')
+        if silent and error in ('login_required', 'interaction_required', 'consent_required'):
+            # The IdP session is gone too - forget the old login and ask interactively
+            SILENT_REAUTHS.labels(outcome='interaction_required').inc()
+            logging.info(f"Silent re-authentication not possible ({error}), falling back to login")
+            session.pop('user_info', None)
+            session.pop('authenticated_at', None)
+            return redirect(url_for('.login', roomname=session.get('room_name', 'lobby')))
+        
         code = request.args.get('code')
         if not code:
             logging.error("Authorization code not found")
+            record_failure('missing_code')
             return "Authorization code not found", 400
         
+        oidc_config = provider.ensure_config()
+        if not oidc_config:
+            record_failure('not_configured')
+            return 'OIDC not configured', 500
+        
         # Exchange code for tokens
         token_url = oidc_config['token_endpoint']
         redirect_uri = urljoin(JITSI_BASE_URL, '/oidc/redirect')
@@ -204,20 +515,33 @@ def oauth_callback():
             'client_secret': OIDC_CLIENT_SECRET
         }
         
-        response = requests.post(token_url, data=data, timeout=10)
+        try:
+            with stage_timer('token_exchange'):
+                response = requests.post(token_url, data=data, timeout=10)
+        except requests.RequestException as e:
+            record_idp_result(False, e)
+            record_failure('token_exchange_failed')
+            raise
         
         if response.status_code != 200:
+            if response.status_code >= 500:
+                record_idp_result(False, f"token endpoint returned {response.status_code}")
+            else:
+                record_idp_result(True)
             logging.error(f"Token exchange failed: {response.status_code} - {response.text}")
+            record_failure('token_exchange_failed')
             return "Token exchange failed", 500
         
+        record_idp_result(True)
         token_data = response.json()
         
         if 'id_token' not in token_data:
             logging.error("ID token not in response")
+            record_failure('missing_id_token')
             return "ID token not found", 500
         
         # Parse ID token
-        id_token = parse_id_token(token_data['id_token'], oidc_config['jwks_uri'])
+        id_token = parse_id_token(token_data['id_token'])
         
         if not id_token:
             return "Failed to parse ID token", 500
@@ -226,6 +550,7 @@ def oauth_callback():
         stored_nonce = session.pop('oauth_nonce', None)
         if stored_nonce and id_token.get('nonce') != stored_nonce:
             logging.error("Nonce mismatch")
+            record_failure('nonce_mismatch')
             return "Nonce mismatch", 400
         
         # Extract user info - try multiple claim names for compatibility
@@ -243,45 +568,38 @@ def oauth_callback():
             'email': email,
             'avatar': avatar_url
         }
+        session['authenticated_at'] = time.time()
         
+        if silent:
+            SILENT_REAUTHS.labels(outcome='success').inc()
+        LOGINS_TOTAL.inc()
         logging.info(f"User authenticated: {name} ({email})")
-        return redirect(url_for('tokenize'))
+        return redirect(url_for('.tokenize'))
         
     except Exception as e:
         logging.error(f"Error in OIDC callback: {e}")
+        if not isinstance(e, requests.RequestException):
+            record_failure('callback_error')
         return f"Authentication error: {e}", 500
 
-@app.route('/oidc/tokenize')
+@bp.route('/oidc/tokenize')
 def tokenize():
     """Generate Jitsi JWT token and redirect to meeting"""
     user_info = session.get('user_info')
     if not user_info:
         logging.error("User not logged in - no session")
-        return redirect(url_for('login'))
+        record_failure('no_session')
+        return redirect(url_for('.login'))
     
     room_name = session.get('room_name', 'lobby')
     
-    # Build JWT payload for Jitsi
-    jwt_payload = {
-        "context": {
-            "user": {
-                "id": user_info.get('id', ''),
-                "avatar": user_info.get('avatar', ''),
-                "name": user_info['name'],
-                "email": user_info.get('email', ''),
-                "affiliation": "owner",
-            }
-        },
-        "aud": JWT_APP_ID,
-        "iss": JWT_APP_ID,
-        "sub": JWT_SUBJECT,
-        "room": room_name,
-        "iat": datetime.datetime.now(datetime.timezone.utc),
-        "nbf": datetime.datetime.now(datetime.timezone.utc),
-        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=3)
-    }
+    # Header and static claims are prebuilt; recent tokens for the same user and room are reused
+    with stage_timer('jwt_mint'):
+        encoded_jwt = token_minter.mint(user_info, room_name)
     
-    encoded_jwt = jwt.encode(jwt_payload, JWT_APP_SECRET, algorithm='HS256')
+    started = session.pop('auth_started_at', None)
+    if started:
+        LOGIN_SECONDS.observe(max(time.time() - started, 0))
     
     # Redirect to meeting room with JWT
     final_url = f"{JITSI_BASE_URL}/{room_name}?jwt={encoded_jwt}#config.prejoinPageEnabled=false"
@@ -289,5 +607,37 @@ def tokenize():
     
     return redirect(final_url)
 
+def create_app():
+    """Build the app and load the identity provider's metadata and keys"""
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY or secrets.token_urlsafe(32)
+    # The limiter sits inside ProxyFix so it sees the client address, and outside
+    # Flask so a rejected request never touches the session store or the IdP
+    rate_limiter = RateLimiter(
+        app.wsgi_app,
+        limit=RATE_LIMIT_REQUESTS,
+        window=RATE_LIMIT_WINDOW_SECONDS,
+        prefixes=('/oidc/auth', '/oidc/redirect'),
+        backend=RedisBackend(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBackend(),
+        on_limited=lambda route: RATE_LIMITED.labels(route=route).inc(),
+    )
+    app.wsgi_app = ProxyFix(rate_limiter, x_for=1, x_proto=1, x_host=1)
+
+    app.config['SESSION_TYPE'] = 'filesystem'
+    app.config['SESSION_FILE_DIR'] = SESSION_FILE_DIR
+    app.config['SESSION_COOKIE_SECURE'] = True
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    Session(app)
+
+    oauth.init_app(app)
+    app.register_blueprint(bp)
+
+    if provider.load():
+        register_client(provider.config)
+    else:
+        logging.error("Failed to initialize OIDC client - discovery failed")
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8000)
+    create_app().run(debug=True, host='0.0.0.0', port=8000)
@@ -0,0 +1,58 @@
+"""
+Gunicorn configuration for the Jitsi OIDC adapter
+"""
+
+import os
+import shutil
+
+from prometheus_client import multiprocess, start_http_server
+
+bind = '0.0.0.0:8000'
+
+# Build the app once in the master: the secret key, discovery metadata and
+# JWKS are then shared by all workers, and a new worker starts without any
+# IdP round trip
+preload_app = True
+
+# Logins mostly wait on the IdP (token exchange) and the session files, so
+# each worker serves several requests on threads; workers add CPU for the rest
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', str(min(os.cpu_count() or 1, 4))))
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+# Traefik reuses its connections to the adapter
+keepalive = 30
+
+# Metrics get a listener of their own in the master, which is what gets
+# published on the private network. The app port is only reachable through
+# Traefik: ProxyFix trusts its X-Forwarded-For, which the rate limiter uses.
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '9100'))
+
+
+def reset_metrics_dir():
+    """Start every container run with an empty metrics directory"""
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+# This file is read before the app is preloaded, which already records IdP
+# metrics (on_starting would run after that). It is read again on a reload,
+# when the metrics of the running workers must stay.
+if not os.environ.get('JITSI_OIDC_METRICS_RESET'):
+    reset_metrics_dir()
+    os.environ['JITSI_OIDC_METRICS_RESET'] = '1'
+
+
+def when_ready(server):
+    """Serve the metrics of all workers from the master"""
+    import app
+
+    start_http_server(METRICS_PORT, registry=app.metrics_registry())
+    server.log.info(f"Serving metrics on port {METRICS_PORT}")
+
+
+def child_exit(server, worker):
+    """Drop live-gauge samples of workers that have exited"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,120 @@
+"""
+Per-client rate limiting for the OIDC adapter
+
+The login endpoints create a session file and, for callbacks, call the IdP,
+so a burst from one client can tie up the few gunicorn workers. This WSGI
+middleware counts requests per client address with a sliding window and
+answers over-limit requests with a bare 429 before Flask, the session
+interface or the IdP are involved.
+
+The window is approximated from two fixed buckets (the current one plus the
+previous one weighted by how much of it still overlaps the window), which
+needs two counters per client instead of a timestamp per request. Counters
+live in process memory by default - one set per gunicorn worker - or in
+Redis when a URL is configured, so all workers share one limit.
+"""
+
+import logging
+import threading
+import time
+
+
+class MemoryBackend:
+    """Bucket counters in this process"""
+
+    def __init__(self, max_clients=10000):
+        self.max_clients = max_clients
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, bucket, window):
+        """Count a request in ``bucket`` and return (current, previous) bucket counts"""
+        with self._lock:
+            current_bucket, current, previous = self._counts.get(key, (bucket, 0, 0))
+            if current_bucket != bucket:
+                previous = current if current_bucket == bucket - 1 else 0
+                current = 0
+            current += 1
+            self._counts[key] = (bucket, current, previous)
+            if len(self._counts) > self.max_clients:
+                self._prune(bucket)
+        return current, previous
+
+    def _prune(self, bucket):
+        # Clients not seen in the last two buckets no longer affect any limit
+        self._counts = {k: v for k, v in self._counts.items() if v[0] >= bucket - 1}
+        # Still too many (e.g. a spread-out flood): forget the oldest tenth, so
+        # pruning stays rare instead of running on every request
+        excess = len(self._counts) - int(self.max_clients * 0.9)
+        if excess > 0:
+            for key in list(self._counts)[:excess]:
+                del self._counts[key]
+
+
+class RedisBackend:
+    """Bucket counters in Redis, shared by all workers and replicas"""
+
+    PREFIX = 'jitsi-oidc:ratelimit'
+
+    def __init__(self, url):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def hit(self, key, bucket, window):
+        current_key = f'{self.PREFIX}:{key}:{bucket}'
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.incr(current_key)
+        pipe.expire(current_key, 2 * window)
+        pipe.get(f'{self.PREFIX}:{key}:{bucket - 1}')
+        current, _, previous = pipe.execute()
+        return current, int(previous or 0)
+
+
+class RateLimiter:
+    """WSGI middleware that sheds requests over ``limit`` per ``window`` seconds per client"""
+
+    def __init__(self, app, limit, window, prefixes, backend=None, on_limited=None):
+        self.app = app
+        self.limit = limit
+        self.window = window
+        self.prefixes = tuple(prefixes)
+        self.backend = backend or MemoryBackend()
+        self.on_limited = on_limited
+
+    def allow(self, key, now=None):
+        """Count one request for ``key``; return 0 if allowed, else seconds to wait"""
+        now = time.time() if now is None else now
+        bucket, offset = divmod(now, self.window)
+        current, previous = self.backend.hit(key, int(bucket), self.window)
+        estimate = previous * (1 - offset / self.window) + current
+        if estimate <= self.limit:
+            return 0
+        return max(1, int(self.window - offset))
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if self.limit <= 0 or not path.startswith(self.prefixes):
+            return self.app(environ, start_response)
+
+        # Behind ProxyFix, REMOTE_ADDR is already the client address from X-Forwarded-For
+        client = environ.get('REMOTE_ADDR', 'unknown')
+        try:
+            retry_after = self.allow(client)
+        except Exception as e:
+            # A broken shared backend must not lock everybody out
+            logging.warning(f"Rate limiter backend failed, allowing request: {e}")
+            retry_after = 0
+
+        if not retry_after:
+            return self.app(environ, start_response)
+
+        if self.on_limited:
+            self.on_limited(next(p for p in self.prefixes if path.startswith(p)))
+        logging.debug(f"Rate limited {client} on {path}")
+        start_response('429 Too Many Requests', [
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', '18'),
+            ('Retry-After', str(retry_after)),
+        ])
+        return [b'Too many requests\n']